@@ -17,6 +17,26 @@ type MentalResponse = {
   threadId: string;
 };
 
+type StreamEvent = {
+  event: string;
+  data: string;
+};
+
+function parseSseBlocks(buffer: string): { events: StreamEvent[]; rest: string } {
+  const blocks = buffer.split("\n\n");
+  const rest = blocks.pop() ?? "";
+  const events = blocks.map((block) => {
+    let event = "message";
+    const data: string[] = [];
+    for (const line of block.split("\n")) {
+      if (line.startsWith("event:")) event = line.slice(6).trim();
+      if (line.startsWith("data:")) data.push(line.slice(5).trim());
+    }
+    return { event, data: data.join("\n") };
+  });
+  return { events, rest };
+}
+
 export default function MentalShieldPage() {
   const router = useRouter();
   const { user, loading } = useAuthState();
@@ -39,7 +59,8 @@ export default function MentalShieldPage() {
     try {
       const token = await user.getIdToken(true);
       const apiBase = process.env.NEXT_PUBLIC_API_BASE ?? "";
-      const response = await fetch(`${apiBase}/api/v1/mental-shield/chat`, {
+      // カードが確定するたびに表示できるよう、SSE 版を使う
+      const response = await fetch(`${apiBase}/api/v1/mental-shield/chat/stream`, {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -59,8 +80,33 @@ export default function MentalShieldPage() {
         );
       }
 
-      const data = (await response.json()) as MentalResponse;
-      setResult(data);
+      if (!response.body) {
+        throw new Error("ストリームを受信できませんでした。");
+      }
+
+      const current: MentalResponse = { cards: [], summary: "", threadId: "default" };
+      setResult({ ...current });
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const parsed = parseSseBlocks(buffer);
+        buffer = parsed.rest;
+        for (const item of parsed.events) {
+          const data = JSON.parse(item.data);
+          if (item.event === "card") {
+            current.cards = [...current.cards, data as MentalCard];
+          } else if (item.event === "summary") {
+            current.summary = data.summary;
+          } else if (item.event === "done") {
+            current.threadId = data.threadId;
+          }
+        }
+        setResult({ ...current });
+      }
       setStatus("idle");
     } catch (error) {
       setStatus("error");
@@ -104,10 +150,12 @@ export default function MentalShieldPage() {
                 <p>{card.text}</p>
               </div>
             ))}
-            <div className={styles.summary}>
-              <h3>まとめ</h3>
-              <p>{result.summary}</p>
-            </div>
+            {result.summary ? (
+              <div className={styles.summary}>
+                <h3>まとめ</h3>
+                <p>{result.summary}</p>
+              </div>
+            ) : null}
           </div>
         ) : null}
       </div>
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import asdict
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+from typing import Callable
+
+from ..config import (
+    ANALYSIS_CACHE_DIR,
+    ANALYSIS_CACHE_DISK_MAX_BYTES,
+    ANALYSIS_CACHE_SIZE,
+)
+from .hair_density import (
+    METHOD_LABEL,
+    DensityResult,
+    QualityInfo,
+    RoiRect,
+    RoiSpec,
+    compute_density_batch,
+    compute_density_multi,
+)
+
+
+def _roi_key(roi: RoiSpec) -> str:
+    if isinstance(roi, RoiRect):
+        return f"rect:{roi.x!r},{roi.y!r},{roi.w!r},{roi.h!r}"
+    return roi or ""
+
+
+def _cache_key(
+    image_bytes: bytes, roi: RoiSpec, max_side: int | None, method: str
+) -> str:
+    digest = hashlib.sha256(image_bytes)
+    digest.update(f"|{_roi_key(roi)}|{max_side or 0}|{method}".encode())
+    return digest.hexdigest()
+
+
+def _to_record(result: DensityResult) -> dict:
+    return asdict(result)
+
+
+def _from_record(record: dict) -> DensityResult:
+    quality = record["quality"]
+    return DensityResult(
+        density_index=record["density_index"],
+        quality=QualityInfo(score=quality["score"], warnings=list(quality["warnings"])),
+        roi=dict(record["roi"]),
+        method=record["method"],
+    )
+
+
+class AnalysisCache:
+    def __init__(
+        self,
+        max_entries: int,
+        disk_dir: str | None = None,
+        disk_max_bytes: int = 0,
+    ):
+        self._max_entries = max_entries
+        self._memory: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_dir = Path(disk_dir) if disk_dir else None
+        self._disk_max_bytes = disk_max_bytes
+        self._disk_bytes: int | None = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> DensityResult | None:
+        with self._lock:
+            record = self._memory.get(key)
+            if record is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return _from_record(record)
+
+        record = self._read_disk(key)
+        with self._lock:
+            if record is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, record)
+        return _from_record(record)
+
+    def put(self, key: str, result: DensityResult) -> None:
+        record = _to_record(result)
+        with self._lock:
+            self._remember(key, record)
+        self._write_disk(key, record)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "memoryHits": self.memory_hits,
+                "diskHits": self.disk_hits,
+                "misses": self.misses,
+                "memoryEntries": len(self._memory),
+                "memoryCapacity": self._max_entries,
+                "diskBytes": self._disk_bytes or 0,
+                "diskCapacityBytes": self._disk_max_bytes if self._disk_dir else 0,
+            }
+
+    def _remember(self, key: str, record: dict) -> None:
+        if self._max_entries <= 0:
+            return
+        self._memory[key] = record
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_path(self, key: str) -> Path:
+        assert self._disk_dir is not None
+        return self._disk_dir / key[:2] / f"{key}.json"
+
+    def _read_disk(self, key: str) -> dict | None:
+        if self._disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            record = json.loads(path.read_text(encoding="utf-8"))
+            # 最終参照時刻をmtimeで表し、容量超過時は古いものから消す
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return record
+
+    def _write_disk(self, key: str, record: dict) -> None:
+        if self._disk_dir is None or self._disk_max_bytes <= 0:
+            return
+        path = self._disk_path(key)
+        data = json.dumps(record).encode("utf-8")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            previous = path.stat().st_size if path.exists() else 0
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_bytes()
+            else:
+                self._disk_bytes += len(data) - previous
+            if self._disk_bytes > self._disk_max_bytes:
+                self._evict_disk()
+
+    def _scan_disk_bytes(self) -> int:
+        assert self._disk_dir is not None
+        return sum(path.stat().st_size for path in self._disk_dir.glob("*/*.json"))
+
+    def _evict_disk(self) -> None:
+        assert self._disk_dir is not None
+        entries = []
+        for path in self._disk_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self._disk_max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+        self._disk_bytes = total
+
+
+_analysis_cache: AnalysisCache | None = None
+
+
+def get_analysis_cache() -> AnalysisCache:
+    global _analysis_cache
+    if _analysis_cache is None:
+        _analysis_cache = AnalysisCache(
+            ANALYSIS_CACHE_SIZE,
+            disk_dir=ANALYSIS_CACHE_DIR or None,
+            disk_max_bytes=ANALYSIS_CACHE_DISK_MAX_BYTES,
+        )
+    return _analysis_cache
+
+
+def cached_compute_density_multi(
+    image_bytes: bytes,
+    rois: list[RoiSpec],
+    max_side: int | None = None,
+    method: str = METHOD_LABEL,
+    compute: Callable[..., list[DensityResult]] = compute_density_multi,
+) -> list[DensityResult]:
+    # ROI ごとにキャッシュし、足りない ROI だけをまとめて1回で解析する
+    cache = get_analysis_cache()
+    keys = [_cache_key(image_bytes, roi, max_side, method) for roi in rois]
+    results: list[DensityResult | None] = [cache.get(key) for key in keys]
+
+    missing = [index for index, result in enumerate(results) if result is None]
+    if missing:
+        computed = compute(image_bytes, [rois[index] for index in missing], max_side, method)
+        for index, result in zip(missing, computed):
+            cache.put(keys[index], result)
+            results[index] = result
+    return [result for result in results if result is not None]
+
+
+def cached_compute_density_batch(
+    images: list[bytes],
+    roi: RoiSpec,
+    max_side: int | None = None,
+    method: str = METHOD_LABEL,
+    compute: Callable[..., list[DensityResult | None]] = compute_density_batch,
+) -> list[DensityResult | None]:
+    cache = get_analysis_cache()
+    keys = [_cache_key(image_bytes, roi, max_side, method) for image_bytes in images]
+    results: list[DensityResult | None] = [cache.get(key) for key in keys]
+
+    # 同一バッチ内の重複画像は1回だけ解析する
+    pending: dict[str, list[int]] = {}
+    for index, result in enumerate(results):
+        if result is None:
+            pending.setdefault(keys[index], []).append(index)
+    if pending:
+        firsts = [indices[0] for indices in pending.values()]
+        computed = compute(
+            [images[index] for index in firsts], roi, max_side, method
+        )
+        for (key, indices), result in zip(pending.items(), computed):
+            if result is None:
+                continue
+            cache.put(key, result)
+            results[indices[0]] = result
+            for index in indices[1:]:
+                results[index] = _from_record(_to_record(result))
+    return results
@@ -2,9 +2,28 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 import io
+import math
+from typing import Callable
 
-import numpy as np
-from PIL import Image, ImageFilter
+from ..config import ANALYSIS_MEMORY_BUDGET_BYTES
+from ..lazy import lazy_import
+from ..timing import stage
+
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+ImageFilter = lazy_import("PIL.ImageFilter")
+
+METHOD_LABEL = "pil_threshold_v1"
+HIST_MEDIAN_METHOD = "hist_median_v1"
+HIST_OTSU_METHOD = "hist_otsu_v1"
+ANALYSIS_METHODS = (METHOD_LABEL, HIST_MEDIAN_METHOD, HIST_OTSU_METHOD)
+ROI_PRESETS = ("default", "crown")
+
+_BLUR_RADIUS = 2
+# PIL のガウスぼかしは箱フィルタ3回なので、1画素の影響は上下 3×(半径+1) 行に収まる
+_STRIP_MARGIN = 3 * (_BLUR_RADIUS + 1)
+# 1画素あたりの作業メモリの見積もり（RGB切り出し・L変換・ぼかし・差分の整数配列）
+_BYTES_PER_PIXEL = 32
 
 
 @dataclass
@@ -18,6 +37,20 @@ class DensityResult:
     density_index: float
     quality: QualityInfo
     roi: dict[str, float]
+    method: str = METHOD_LABEL
+
+
+@dataclass(frozen=True)
+class RoiRect:
+    # 画像サイズに対する正規化座標（0〜1）
+    x: float
+    y: float
+    w: float
+    h: float
+
+
+# プリセット名（None は default）か任意の矩形
+RoiSpec = str | RoiRect | None
 
 
 def _roi_from_preset(height: int, width: int, preset: str | None) -> tuple[int, int, int, int]:
@@ -35,14 +68,8 @@ def _roi_from_preset(height: int, width: int, preset: str | None) -> tuple[int,
     return x, y, w, h
 
 
-def _quality_from_gray(gray: np.ndarray) -> QualityInfo:
+def _quality_from_stats(mean_brightness: float, blur_value: float) -> QualityInfo:
     warnings: list[str] = []
-    mean_brightness = float(np.mean(gray))
-    # 簡易ブラー指標（隣接差分の分散）でMVP判定
-    diff_x = np.diff(gray.astype(np.float32), axis=1)
-    diff_y = np.diff(gray.astype(np.float32), axis=0)
-    blur_value = float(np.var(diff_x) + np.var(diff_y))
-
     if mean_brightness < 70:
         warnings.append("low_light")
     if mean_brightness > 200:
@@ -54,32 +81,499 @@ def _quality_from_gray(gray: np.ndarray) -> QualityInfo:
     return QualityInfo(score=score, warnings=warnings)
 
 
-def compute_density_index(image_bytes: bytes, preset: str | None) -> DensityResult:
-    try:
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    except Exception as exc:  # noqa: BLE001
-        raise ValueError("Invalid image data") from exc
-
-    width, height = image.size
-    x, y, w, h = _roi_from_preset(height, width, preset)
-    roi = image.crop((x, y, x + w, y + h))
+def _quality_from_gray(gray: np.ndarray) -> QualityInfo:
+    mean_brightness = float(np.mean(gray))
+    # 簡易ブラー指標（隣接差分の分散）でMVP判定
+    diff_x = np.diff(gray.astype(np.float32), axis=1)
+    diff_y = np.diff(gray.astype(np.float32), axis=0)
+    blur_value = float(np.var(diff_x) + np.var(diff_y))
+    return _quality_from_stats(mean_brightness, blur_value)
 
-    gray_image = roi.convert("L").filter(ImageFilter.GaussianBlur(radius=2))
-    gray = np.array(gray_image, dtype=np.uint8)
 
-    # Otsuの代わりに中央値で簡易二値化
-    threshold = int(np.median(gray))
-    mask = gray < threshold
-    hair_pixels = int(np.count_nonzero(mask))
-    total_pixels = mask.size
-    density_index = float(hair_pixels / total_pixels) if total_pixels else 0.0
-
-    quality = _quality_from_gray(gray)
-    roi_norm = {
+def _roi_norm(x: int, y: int, w: int, h: int, width: int, height: int) -> dict[str, float]:
+    return {
         "x": x / width,
         "y": y / height,
         "w": w / width,
         "h": h / height,
     }
 
-    return DensityResult(density_index=density_index, quality=quality, roi=roi_norm)
+
+def _roi_box(height: int, width: int, roi: RoiSpec) -> tuple[int, int, int, int]:
+    if not isinstance(roi, RoiRect):
+        return _roi_from_preset(height, width, roi)
+    x = min(width - 1, int(width * roi.x))
+    y = min(height - 1, int(height * roi.y))
+    w = max(1, min(width - x, int(width * roi.w)))
+    h = max(1, min(height - y, int(height * roi.h)))
+    return x, y, w, h
+
+
+def _union_box(boxes: list[tuple[int, int, int, int]]) -> tuple[int, int, int, int]:
+    return (
+        min(box[0] for box in boxes),
+        min(box[1] for box in boxes),
+        max(box[2] for box in boxes),
+        max(box[3] for box in boxes),
+    )
+
+
+def _draft_size(
+    image: Image.Image, w: int, h: int, max_side: int | None
+) -> tuple[int, int] | None:
+    # JPEGはdraftで縮小デコード＋輝度のみ取り出す（ROI の長辺が max_side を下回らない倍率まで）
+    if not max_side or image.format != "JPEG":
+        return None
+    scale = max(w, h) / max_side
+    if scale <= 1:
+        return None
+    width, height = image.size
+    return math.ceil(width / scale), math.ceil(height / scale)
+
+
+def _decode_rois(
+    open_image: Callable[[], Image.Image], rois: list[RoiSpec], max_side: int | None
+) -> tuple[list[Image.Image], list[dict[str, float]]]:
+    # 輝度変換は ROI の外接矩形に対して1回だけ行い、各 ROI はそこから単独で解析する場合と同じ手順で
+    # 切り出し・縮小する（ぼかしも ROI ごと）。draft の倍率が違う ROI は結果が変わるので別にデコードする
+    image: Image.Image | None = open_image()
+    width, height = image.size
+    rects = [_roi_box(height, width, roi) for roi in rois]
+    roi_norms = [_roi_norm(x, y, w, h, width, height) for x, y, w, h in rects]
+
+    groups: dict[tuple[int, int] | None, list[int]] = {}
+    for index, (_, _, w, h) in enumerate(rects):
+        groups.setdefault(_draft_size(image, w, h, max_side), []).append(index)
+
+    grays: dict[int, Image.Image] = {}
+    for draft, members in groups.items():
+        source = image if image is not None else open_image()
+        image = None
+        if draft is not None:
+            source.draft("L", draft)
+        draft_width, draft_height = source.size
+        sx = draft_width / width
+        sy = draft_height / height
+        boxes: dict[int, tuple[int, int, int, int]] = {}
+        for index in members:
+            x, y, w, h = rects[index]
+            boxes[index] = (
+                int(x * sx),
+                int(y * sy),
+                max(int(x * sx) + 1, int((x + w) * sx)),
+                max(int(y * sy) + 1, int((y + h) * sy)),
+            )
+        left, top, right, bottom = _union_box(list(boxes.values()))
+        region = source.crop((left, top, right, bottom))
+        if not max_side and region.mode not in ("L", "RGB"):
+            region = region.convert("RGB")
+        if region.mode != "L":
+            region = region.convert("L")
+
+        for index, (box_left, box_top, box_right, box_bottom) in boxes.items():
+            roi = region.crop(
+                (box_left - left, box_top - top, box_right - left, box_bottom - top)
+            )
+            roi_width, roi_height = roi.size
+            if max_side and max(roi_width, roi_height) > max_side:
+                ratio = max_side / max(roi_width, roi_height)
+                target = (
+                    max(1, round(roi_width * ratio)),
+                    max(1, round(roi_height * ratio)),
+                )
+                roi = roi.resize(target, Image.Resampling.BOX, reducing_gap=2.0)
+            grays[index] = roi
+    return [grays[index] for index in range(len(rois))], roi_norms
+
+
+def _load_rois_gray(
+    image_bytes: bytes, rois: list[RoiSpec], max_side: int | None = None
+) -> list[tuple[np.ndarray, dict[str, float]]]:
+    try:
+        with stage("decode"):
+            gray_rois, roi_norms = _decode_rois(
+                lambda: Image.open(io.BytesIO(image_bytes)), rois, max_side
+            )
+    except Exception as exc:  # noqa: BLE001
+        raise ValueError("Invalid image data") from exc
+
+    grays = []
+    with stage("blur"):
+        for gray_roi in gray_rois:
+            gray_image = gray_roi.filter(ImageFilter.GaussianBlur(radius=_BLUR_RADIUS))
+            grays.append(np.array(gray_image, dtype=np.uint8))
+    return list(zip(grays, roi_norms))
+
+
+def _load_roi_gray(
+    image_bytes: bytes, roi: RoiSpec, max_side: int | None = None
+) -> tuple[np.ndarray, dict[str, float]]:
+    return _load_rois_gray(image_bytes, [roi], max_side)[0]
+
+
+def open_frame(data: bytes, size: tuple[int, int] | None = None) -> Image.Image:
+    # size 指定時は 8bit グレースケールの生データ（行優先）として読む
+    try:
+        if size is None:
+            return Image.open(io.BytesIO(data))
+        return Image.frombuffer("L", size, data, "raw", "L", 0, 1)
+    except Exception as exc:  # noqa: BLE001
+        raise ValueError("Invalid image data") from exc
+
+
+def compute_frame_quality(frame: Image.Image, roi: RoiSpec, max_side: int) -> QualityInfo:
+    # プレビュー用: ROI を max_side まで縮小した輝度画像だけで品質を判定する（ぼかし・密度計算はしない）
+    try:
+        with stage("decode"):
+            [gray_roi], _ = _decode_rois(lambda: frame, [roi], max_side)
+            gray = np.asarray(gray_roi, dtype=np.uint8)
+    except Exception as exc:  # noqa: BLE001
+        raise ValueError("Invalid image data") from exc
+    # 隣接差分が取れない大きさではブラー指標を出せない
+    if min(gray.shape) < 2:
+        raise ValueError("Frame is too small")
+    with stage("quality"):
+        return _quality_from_gray(gray)
+
+
+def _method_label(
+    shape: tuple[int, ...], max_side: int | None, method: str = METHOD_LABEL
+) -> str:
+    # 縮小解析では実効解像度をラベルに含め、異なる解像度の結果を区別できるようにする
+    if not max_side:
+        return method
+    height, width = shape[:2]
+    return f"{method}@{width}x{height}"
+
+
+def _histograms(stack: np.ndarray) -> np.ndarray:
+    return np.stack(
+        [np.bincount(gray.ravel(), minlength=256) for gray in stack]
+    ).astype(np.int64)
+
+
+def _median_thresholds(cumulative: np.ndarray, total_pixels: int) -> np.ndarray:
+    # np.median と同じく中央2値の平均を切り捨てる
+    lower = np.argmax(cumulative > (total_pixels - 1) // 2, axis=1)
+    upper = np.argmax(cumulative > total_pixels // 2, axis=1)
+    return (lower + upper) // 2
+
+
+def _otsu_thresholds(hists: np.ndarray, cumulative: np.ndarray) -> np.ndarray:
+    levels = np.arange(256, dtype=np.float64)
+    total = cumulative[:, -1:].astype(np.float64)
+    omega = cumulative / total
+    mu = np.cumsum(hists * levels, axis=1) / total
+    mu_total = mu[:, -1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (mu_total * omega - mu) ** 2 / (omega * (1.0 - omega))
+    between = np.nan_to_num(between, nan=0.0, posinf=0.0, neginf=0.0)
+    # 階調 t 以下を前景とするため、gray < t + 1 で二値化する
+    return np.argmax(between, axis=1) + 1
+
+
+def _blur_values_int(stack: np.ndarray, hists: np.ndarray) -> np.ndarray:
+    # Var(d) = E[d^2] - E[d]^2 を整数和から求め、float の差分配列を作らない
+    # sum(d) は端の列/行の差、sum(d^2) は二乗和（閾値計算と同じヒストグラムから）と隣接画素の積和から得る
+    count, height, width = stack.shape
+    levels_sq = np.arange(256, dtype=np.int64) ** 2
+    total_sq = hists @ levels_sq
+
+    def edge_sq(edge: np.ndarray) -> np.ndarray:
+        return levels_sq[edge].reshape(count, -1).sum(axis=1)
+
+    def edge_sum(edge: np.ndarray) -> np.ndarray:
+        return edge.reshape(count, -1).sum(axis=1, dtype=np.int64)
+
+    def variance(
+        first: np.ndarray, last: np.ndarray, cross: np.ndarray, pairs: int
+    ) -> np.ndarray:
+        if pairs == 0:
+            return np.zeros(count, dtype=np.float64)
+        sum_sq = (total_sq - edge_sq(first)) + (total_sq - edge_sq(last)) - 2 * cross
+        sum_diff = edge_sum(last) - edge_sum(first)
+        return sum_sq / pairs - (sum_diff / pairs) ** 2
+
+    cross_x = np.einsum(
+        "nij,nij->n", stack[:, :, 1:], stack[:, :, :-1], dtype=np.int64, casting="unsafe"
+    )
+    cross_y = np.einsum(
+        "nij,nij->n", stack[:, 1:, :], stack[:, :-1, :], dtype=np.int64, casting="unsafe"
+    )
+    var_x = variance(stack[:, :, 0], stack[:, :, -1], cross_x, height * (width - 1))
+    var_y = variance(stack[:, 0, :], stack[:, -1, :], cross_y, (height - 1) * width)
+    return var_x + var_y
+
+
+def _hist_stats_from_stack(
+    stack: np.ndarray, method: str
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # 256ビンのヒストグラム1枚から閾値・密度・平均輝度を求める
+    count = stack.shape[0]
+    total_pixels = stack.shape[1] * stack.shape[2]
+    if total_pixels == 0:
+        zeros = np.zeros(count, dtype=np.float64)
+        return zeros, zeros, zeros
+
+    hists = _histograms(stack)
+    cumulative = np.cumsum(hists, axis=1)
+    if method == HIST_OTSU_METHOD:
+        thresholds = _otsu_thresholds(hists, cumulative)
+    else:
+        thresholds = _median_thresholds(cumulative, total_pixels)
+
+    below = np.where(
+        thresholds > 0,
+        np.take_along_axis(cumulative, np.maximum(thresholds - 1, 0)[:, None], axis=1)[:, 0],
+        0,
+    )
+    densities = below / total_pixels
+    means = (hists @ np.arange(256, dtype=np.int64)) / total_pixels
+    return densities, means, _blur_values_int(stack, hists)
+
+
+def _result_from_gray(
+    gray: np.ndarray, roi_norm: dict[str, float], max_side: int | None, method: str
+) -> DensityResult:
+    if method != METHOD_LABEL:
+        with stage("threshold"):
+            densities, means, blur_values = _hist_stats_from_stack(gray[None], method)
+        return DensityResult(
+            density_index=float(densities[0]),
+            quality=_quality_from_stats(float(means[0]), float(blur_values[0])),
+            roi=roi_norm,
+            method=_method_label(gray.shape, max_side, method),
+        )
+
+    # Otsuの代わりに中央値で簡易二値化
+    with stage("threshold"):
+        threshold = int(np.median(gray))
+        mask = gray < threshold
+        hair_pixels = int(np.count_nonzero(mask))
+        total_pixels = mask.size
+        density_index = float(hair_pixels / total_pixels) if total_pixels else 0.0
+
+    with stage("quality"):
+        quality = _quality_from_gray(gray)
+
+    return DensityResult(
+        density_index=density_index,
+        quality=quality,
+        roi=roi_norm,
+        method=_method_label(gray.shape, max_side),
+    )
+
+
+class _StripStats:
+    # 行の帯ごとにヒストグラムと隣接差分の和・二乗和を積み上げる（帯の境目の縦差分も数える）
+    def __init__(self):
+        self.hist = np.zeros(256, dtype=np.int64)
+        self.diff_sums = [0, 0]
+        self.diff_sq_sums = [0, 0]
+        self.pairs = [0, 0]
+        self._last_row: np.ndarray | None = None
+
+    def add(self, rows: np.ndarray) -> None:
+        self.hist += np.bincount(rows.ravel(), minlength=256)
+        upper = rows if self._last_row is None else np.concatenate([self._last_row, rows])
+        for axis, block in ((0, upper), (1, rows)):
+            diff = np.diff(block.astype(np.int32), axis=axis)
+            self.diff_sums[axis] += int(diff.sum(dtype=np.int64))
+            self.diff_sq_sums[axis] += int(np.square(diff).sum(dtype=np.int64))
+            self.pairs[axis] += diff.size
+        self._last_row = rows[-1:].copy()
+
+    def blur_value(self) -> float:
+        value = 0.0
+        for axis in (0, 1):
+            pairs = self.pairs[axis]
+            if pairs:
+                mean = self.diff_sums[axis] / pairs
+                value += self.diff_sq_sums[axis] / pairs - mean * mean
+        return value
+
+
+def _strip_rows(width: int, budget_bytes: int) -> int:
+    return max(
+        4 * _STRIP_MARGIN, budget_bytes // (width * _BYTES_PER_PIXEL) - 2 * _STRIP_MARGIN
+    )
+
+
+def _roi_strip_stats(
+    image: Image.Image, box: tuple[int, int, int, int], budget_bytes: int
+) -> _StripStats:
+    # ROI を上下に重ねた行の帯で切り出してぼかし、重なりを除いた行だけを集計する。
+    # ぼかしは ROI の外を見ないので、ROI 全体を一度にぼかした場合と同じ値になる
+    x, y, w, h = box
+    rows = _strip_rows(w, budget_bytes)
+    stats = _StripStats()
+    for start in range(0, h, rows):
+        end = min(h, start + rows)
+        top = max(0, start - _STRIP_MARGIN)
+        bottom = min(h, end + _STRIP_MARGIN)
+        with stage("blur"):
+            strip = image.crop((x, y + top, x + w, y + bottom))
+            if strip.mode not in ("L", "RGB"):
+                strip = strip.convert("RGB")
+            if strip.mode != "L":
+                strip = strip.convert("L")
+            blurred = np.array(
+                strip.filter(ImageFilter.GaussianBlur(radius=_BLUR_RADIUS)), dtype=np.uint8
+            )
+        with stage("threshold"):
+            stats.add(blurred[start - top : end - top])
+    return stats
+
+
+def _result_from_strip_stats(
+    stats: _StripStats, roi_norm: dict[str, float], method: str
+) -> DensityResult:
+    total_pixels = int(stats.hist.sum())
+    hists = stats.hist[None]
+    cumulative = np.cumsum(hists, axis=1)
+    if method == HIST_OTSU_METHOD:
+        threshold = int(_otsu_thresholds(hists, cumulative)[0])
+    else:
+        threshold = int(_median_thresholds(cumulative, total_pixels)[0])
+    below = int(cumulative[0, threshold - 1]) if threshold > 0 else 0
+    mean_brightness = float(stats.hist @ np.arange(256, dtype=np.int64)) / total_pixels
+    return DensityResult(
+        density_index=below / total_pixels,
+        quality=_quality_from_stats(mean_brightness, stats.blur_value()),
+        roi=roi_norm,
+        method=method,
+    )
+
+
+def _compute_tiled(
+    image_bytes: bytes,
+    rois: list[RoiSpec],
+    max_side: int | None,
+    method: str,
+    budget_bytes: int = ANALYSIS_MEMORY_BUDGET_BYTES,
+) -> list[DensityResult] | None:
+    # フル解像度で ROI の作業メモリが上限を超える場合だけ、行の帯に分けて解析する。
+    # 対象外なら None（デコード前のヘッダ読み取りだけで判定する）
+    if max_side or budget_bytes <= 0:
+        return None
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        width, height = image.size
+    except Exception as exc:  # noqa: BLE001
+        raise ValueError("Invalid image data") from exc
+    boxes = [_roi_box(height, width, roi) for roi in rois]
+    if max(w * h for _, _, w, h in boxes) * _BYTES_PER_PIXEL <= budget_bytes:
+        return None
+
+    try:
+        with stage("decode"):
+            image.load()
+    except Exception as exc:  # noqa: BLE001
+        raise ValueError("Invalid image data") from exc
+    return [
+        _result_from_strip_stats(
+            _roi_strip_stats(image, box, budget_bytes),
+            _roi_norm(*box, width, height),
+            method,
+        )
+        for box in boxes
+    ]
+
+
+def compute_density_multi(
+    image_bytes: bytes,
+    rois: list[RoiSpec],
+    max_side: int | None = None,
+    method: str = METHOD_LABEL,
+) -> list[DensityResult]:
+    # 複数 ROI を1回のデコード・輝度変換から解析する（結果は rois と同じ順）
+    if method not in ANALYSIS_METHODS:
+        raise ValueError(f"Unknown analysis method: {method}")
+    if not rois:
+        raise ValueError("No ROI to analyze")
+
+    tiled = _compute_tiled(image_bytes, rois, max_side, method)
+    if tiled is not None:
+        return tiled
+    return [
+        _result_from_gray(gray, roi_norm, max_side, method)
+        for gray, roi_norm in _load_rois_gray(image_bytes, rois, max_side)
+    ]
+
+
+def compute_density_index(
+    image_bytes: bytes,
+    roi: RoiSpec,
+    max_side: int | None = None,
+    method: str = METHOD_LABEL,
+) -> DensityResult:
+    return compute_density_multi(image_bytes, [roi], max_side, method)[0]
+
+
+def _density_from_stack(stack: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # stack: (n, h, w) の uint8。画像ごとの密度・平均輝度・ブラー指標をまとめて計算する
+    count = stack.shape[0]
+    flat = stack.reshape(count, -1)
+    total_pixels = flat.shape[1]
+
+    thresholds = np.median(flat, axis=1).astype(np.int32)
+    hair_pixels = np.count_nonzero(flat < thresholds[:, None], axis=1)
+    if total_pixels:
+        densities = hair_pixels / total_pixels
+    else:
+        densities = np.zeros(count, dtype=np.float64)
+
+    means = np.mean(flat, axis=1)
+    as_float = stack.astype(np.float32)
+    diff_x = np.diff(as_float, axis=2).reshape(count, -1)
+    diff_y = np.diff(as_float, axis=1).reshape(count, -1)
+    blur_values = np.var(diff_x, axis=1) + np.var(diff_y, axis=1)
+    return densities, means, blur_values
+
+
+def compute_density_batch(
+    images: list[bytes],
+    roi: RoiSpec,
+    max_side: int | None = None,
+    method: str = METHOD_LABEL,
+) -> list[DensityResult | None]:
+    if method not in ANALYSIS_METHODS:
+        raise ValueError(f"Unknown analysis method: {method}")
+
+    # デコードできなかった画像の位置は None のまま返す
+    results: list[DensityResult | None] = [None] * len(images)
+    rois: dict[int, dict[str, float]] = {}
+    groups: dict[tuple[int, int], list[tuple[int, np.ndarray]]] = {}
+
+    for index, image_bytes in enumerate(images):
+        try:
+            tiled = _compute_tiled(image_bytes, [roi], max_side, method)
+            if tiled is not None:
+                results[index] = tiled[0]
+                continue
+            gray, roi_norm = _load_roi_gray(image_bytes, roi, max_side)
+        except ValueError:
+            continue
+        rois[index] = roi_norm
+        groups.setdefault(gray.shape, []).append((index, gray))
+
+    # ROIサイズが同じ画像同士を積み重ねて一括計算する
+    for shape, members in groups.items():
+        label = _method_label(shape, max_side, method)
+        stack = np.stack([gray for _, gray in members])
+        with stage("threshold"):
+            if method == METHOD_LABEL:
+                densities, means, blur_values = _density_from_stack(stack)
+            else:
+                densities, means, blur_values = _hist_stats_from_stack(stack, method)
+        for position, (index, _) in enumerate(members):
+            results[index] = DensityResult(
+                density_index=float(densities[position]),
+                quality=_quality_from_stats(
+                    float(means[position]), float(blur_values[position])
+                ),
+                roi=rois[index],
+                method=label,
+            )
+
+    return results
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import io
+import multiprocessing
+import os
+import threading
+from typing import Any, Callable
+
+from ..config import ANALYSIS_QUEUE_SIZE, ANALYSIS_WORKERS
+from .hair_density import (
+    DensityResult,
+    compute_density_batch,
+    compute_density_index,
+    compute_density_multi,
+)
+
+
+class AnalysisQueueFull(RuntimeError):
+    pass
+
+
+class AnalysisWorkerCrashed(RuntimeError):
+    # 作り直したプールでも子プロセスが落ちた（画像そのものが原因の可能性もある）
+    pass
+
+
+def warm_analysis() -> int:
+    # NumPy/PIL の import とデコード経路を一度通しておく（子プロセスでも親プロセスでも使う）
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), (128, 128, 128)).save(buffer, format="PNG")
+    compute_density_index(buffer.getvalue(), None)
+    return os.getpid()
+
+
+class AnalysisWorkerPool:
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.capacity = workers + max(0, queue_size)
+        self._executor = self._new_executor()
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.capacity)
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # fork だとスレッドを抱えた親の状態を引き継ぐため spawn で起動する
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        return self._submit(self._executor, fn, *args)
+
+    def _submit(
+        self, executor: ProcessPoolExecutor, fn: Callable[..., Any], *args: Any
+    ) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise AnalysisQueueFull("Analysis queue is full")
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        # 子プロセスが落ちる（OOM・デコーダのクラッシュ）と executor は壊れたままになるので、
+        # 作り直して1回だけやり直す
+        for attempt in range(2):
+            executor = self._executor
+            try:
+                return self._submit(executor, fn, *args).result()
+            except BrokenProcessPool as exc:
+                self._replace_broken(executor)
+                if attempt:
+                    raise AnalysisWorkerCrashed("Analysis worker crashed") from exc
+
+    def _replace_broken(self, broken: ProcessPoolExecutor) -> None:
+        # 同時に失敗した呼び出しがあっても作り直しは1回にする
+        with self._executor_lock:
+            if self._executor is not broken:
+                return
+            self._executor = self._new_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def warm(self) -> None:
+        futures = [self._executor.submit(warm_analysis) for _ in range(self.workers)]
+        wait(futures)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_analysis_pool: AnalysisWorkerPool | None = None
+
+
+def get_analysis_pool() -> AnalysisWorkerPool | None:
+    return _analysis_pool
+
+
+def start_analysis_pool() -> AnalysisWorkerPool | None:
+    global _analysis_pool
+    if _analysis_pool is None and ANALYSIS_WORKERS > 0:
+        _analysis_pool = AnalysisWorkerPool(ANALYSIS_WORKERS, ANALYSIS_QUEUE_SIZE)
+        _analysis_pool.warm()
+    return _analysis_pool
+
+
+def stop_analysis_pool() -> None:
+    global _analysis_pool
+    if _analysis_pool is not None:
+        _analysis_pool.shutdown()
+        _analysis_pool = None
+
+
+def run_analysis(fn: Callable[..., Any], *args: Any) -> Any:
+    # プールが無効ならリクエストスレッドでそのまま実行する
+    pool = get_analysis_pool()
+    if pool is None:
+        return fn(*args)
+    return pool.run(fn, *args)
+
+
+def pooled_compute_density_multi(*args: Any) -> list[DensityResult]:
+    return run_analysis(compute_density_multi, *args)
+
+
+def pooled_compute_density_batch(*args: Any) -> list[DensityResult | None]:
+    return run_analysis(compute_density_batch, *args)
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Optional
+
+
+# 日次集計は analysisResults/{uid}/daily/{YYYY-MM-DD}（UTC日付）に保持する。
+# values に analysisId ごとの値、analysisIds に記録順を持ち、同日の再解析は置き換えとして扱う。
+# 別の日に再解析した写真は元の日から外す（記録した日は解析結果の rollupDay）
+
+_BATCH_LIMIT = 400
+
+
+def rollups_ref(db, uid: str):
+    return db.collection("analysisResults").document(uid).collection("daily")
+
+
+def day_key(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).date().isoformat()
+
+
+def to_datetime(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    if hasattr(value, "to_datetime"):
+        return value.to_datetime()
+    return None
+
+
+def empty_rollup(day: str) -> dict[str, Any]:
+    return {
+        "date": day,
+        "count": 0,
+        "densitySum": 0.0,
+        "densityMin": None,
+        "densityMax": None,
+        "densityMean": None,
+        "first": None,
+        "last": None,
+        "values": {},
+        "analysisIds": [],
+    }
+
+
+def _ordered_ids(rollup: dict[str, Any]) -> list[str]:
+    values = rollup["values"]
+    ids = [
+        analysis_id
+        for analysis_id in rollup.get("analysisIds") or []
+        if analysis_id in values
+    ]
+    # analysisIds 導入前の集計は last 以外の順序が分からない
+    last_id = (rollup.get("last") or {}).get("analysisId")
+    rest = [analysis_id for analysis_id in values if analysis_id not in ids]
+    rest.sort(key=lambda analysis_id: analysis_id == last_id)
+    return rest + ids
+
+
+def _with_values(
+    rollup: dict[str, Any], values: dict[str, float], ids: list[str]
+) -> dict[str, Any]:
+    if not ids:
+        return empty_rollup(rollup["date"])
+    densities = [values[analysis_id] for analysis_id in ids]
+    return {
+        **rollup,
+        "values": values,
+        "analysisIds": ids,
+        "count": len(densities),
+        "densitySum": sum(densities),
+        "densityMin": min(densities),
+        "densityMax": max(densities),
+        "densityMean": sum(densities) / len(densities),
+        "first": {"analysisId": ids[0], "densityIndex": densities[0]},
+        "last": {"analysisId": ids[-1], "densityIndex": densities[-1]},
+    }
+
+
+def apply_to_rollup(
+    rollup: dict[str, Any], analysis_id: str, density: float
+) -> dict[str, Any]:
+    updated = {**empty_rollup(rollup.get("date", "")), **rollup}
+    ids = [item for item in _ordered_ids(updated) if item != analysis_id]
+    return _with_values(
+        updated, {**updated["values"], analysis_id: density}, [*ids, analysis_id]
+    )
+
+
+def remove_from_rollup(rollup: dict[str, Any], analysis_id: str) -> dict[str, Any]:
+    updated = {**empty_rollup(rollup.get("date", "")), **rollup}
+    values = {key: value for key, value in updated["values"].items() if key != analysis_id}
+    ids = [item for item in _ordered_ids(updated) if item != analysis_id]
+    return _with_values(updated, values, ids)
+
+
+def recorded_day(record: dict[str, Any]) -> Optional[str]:
+    # rollupDay 導入前の結果は computedAt の日に集計されている
+    if record.get("rollupDay"):
+        return str(record["rollupDay"])
+    computed_at = to_datetime(record.get("computedAt") or record.get("createdAt"))
+    return day_key(computed_at) if computed_at else None
+
+
+def rollup_record(rollup: dict[str, Any]) -> dict[str, Any]:
+    from firebase_admin import firestore as admin_firestore
+
+    return {**rollup, "updatedAt": admin_firestore.SERVER_TIMESTAMP}
+
+
+def load_rollup(db, uid: str, day: str, transaction=None) -> dict[str, Any]:
+    snapshot = rollups_ref(db, uid).document(day).get(transaction=transaction)
+    if snapshot.exists:
+        return {**empty_rollup(day), **(snapshot.to_dict() or {})}
+    return empty_rollup(day)
+
+
+def fetch_rollups(db, uid: str, first_day: date) -> list[dict[str, Any]]:
+    from firebase_admin import firestore as admin_firestore
+
+    docs = (
+        rollups_ref(db, uid)
+        .where("date", ">=", first_day.isoformat())
+        .order_by("date", direction=admin_firestore.Query.ASCENDING)
+        .get()
+    )
+    return [doc.to_dict() for doc in docs]
+
+
+def period_start(now: datetime, period_days: int) -> date:
+    # 当日を含めて period_days 日分（= 読み取る日次集計の最大件数）
+    return (now - timedelta(days=period_days - 1)).date()
+
+
+def backfill_rollups(db, uid: str) -> int:
+    from firebase_admin import firestore as admin_firestore
+
+    items = (
+        db.collection("analysisResults")
+        .document(uid)
+        .collection("items")
+        .order_by("computedAt", direction=admin_firestore.Query.ASCENDING)
+        .get()
+    )
+    rollups: dict[str, dict[str, Any]] = {}
+    for doc in items:
+        data = doc.to_dict()
+        day = recorded_day(data)
+        density = data.get("densityIndex")
+        if not day or not isinstance(density, (int, float)):
+            continue
+        rollups[day] = apply_to_rollup(
+            rollups.get(day) or empty_rollup(day), doc.id, float(density)
+        )
+
+    # 元データから作り直すので、該当しなくなった日の集計は消す
+    collection = rollups_ref(db, uid)
+    writes = [
+        (ref, None) for ref in collection.list_documents() if ref.id not in rollups
+    ]
+    writes.extend(
+        (collection.document(day), rollup_record(rollup))
+        for day, rollup in rollups.items()
+    )
+    for start in range(0, len(writes), _BATCH_LIMIT):
+        batch = db.batch()
+        for ref, record in writes[start : start + _BATCH_LIMIT]:
+            if record is None:
+                batch.delete(ref)
+            else:
+                batch.set(ref, record)
+        batch.commit()
+    return len(rollups)
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+from typing import Any, Optional
+
+
+# 集計は analysisResults/{uid} ドキュメント（items の親）に保持する。
+# rois には ROI ID ごとに同じ形の集計を持ち、ROI 単位の差分に使う
+
+
+def summary_ref(db, uid: str):
+    return db.collection("analysisResults").document(uid)
+
+
+def empty_summary() -> dict[str, Any]:
+    return {
+        "count": 0,
+        "densitySum": 0.0,
+        "densityMin": None,
+        "densityMax": None,
+        "densityMean": None,
+        "baseline": None,
+        "latest": None,
+        "previous": None,
+    }
+
+
+def recorded_density(record: Optional[dict[str, Any]]) -> Optional[float]:
+    density = (record or {}).get("densityIndex")
+    return float(density) if isinstance(density, (int, float)) else None
+
+
+def reference_densities(
+    summary: dict[str, Any], analysis_id: str, existing: Optional[dict[str, Any]] = None
+) -> tuple[Optional[float], Optional[float]]:
+    # existing は同じ analysisId の既存の結果（再解析のとき）
+    latest = summary.get("latest")
+    baseline = summary.get("baseline")
+    base_density = baseline.get("densityIndex") if baseline else None
+
+    if latest and latest.get("analysisId") == analysis_id:
+        # 最新の写真の再解析（リトライ）では latest を置き換えるので、その1つ前と比較する
+        previous = summary.get("previous")
+        prev_density = previous.get("densityIndex") if previous else None
+    else:
+        old_density = recorded_density(existing)
+        old_delta = (existing or {}).get("deltaVsPrev")
+        if old_density is None:
+            prev_density = latest.get("densityIndex") if latest else None
+        elif (baseline and baseline.get("analysisId") == analysis_id) or not isinstance(
+            old_delta, (int, float)
+        ):
+            # 古い写真の再解析は前回と同じ直前の値と比較する（基準の写真には直前が無い）
+            prev_density = None
+        else:
+            prev_density = old_density - float(old_delta)
+    return prev_density, base_density
+
+
+def apply_analysis(
+    summary: dict[str, Any],
+    analysis_id: str,
+    density: float,
+    existing: Optional[dict[str, Any]] = None,
+) -> dict[str, Any]:
+    updated = {**empty_summary(), **summary}
+    entry = {"analysisId": analysis_id, "densityIndex": density}
+    latest = updated.get("latest")
+
+    replaced = recorded_density(existing)
+    if replaced is None and latest and latest.get("analysisId") == analysis_id:
+        replaced = latest["densityIndex"]
+
+    if replaced is not None:
+        # 再解析は件数を増やさず古い値を差し替える。latest / previous の順序も変えない
+        updated["densitySum"] = updated["densitySum"] - replaced + density
+        for key in ("baseline", "latest", "previous"):
+            if updated[key] and updated[key].get("analysisId") == analysis_id:
+                updated[key] = entry
+    else:
+        updated["count"] += 1
+        updated["densitySum"] += density
+        updated["previous"] = latest
+        updated["latest"] = entry
+        if not updated["baseline"]:
+            updated["baseline"] = entry
+
+    # 置き換え時の min/max は元の値を含んだままの保守的な範囲になる
+    current_min = updated["densityMin"]
+    current_max = updated["densityMax"]
+    updated["densityMin"] = density if current_min is None else min(current_min, density)
+    updated["densityMax"] = density if current_max is None else max(current_max, density)
+    updated["densityMean"] = (
+        updated["densitySum"] / updated["count"] if updated["count"] else None
+    )
+    return updated
+
+
+def roi_record(record: Optional[dict[str, Any]], roi_id: str) -> Optional[dict[str, Any]]:
+    return ((record or {}).get("rois") or {}).get(roi_id)
+
+
+def roi_reference_densities(
+    summary: dict[str, Any],
+    roi_id: str,
+    analysis_id: str,
+    existing: Optional[dict[str, Any]] = None,
+) -> tuple[Optional[float], Optional[float]]:
+    return reference_densities(
+        (summary.get("rois") or {}).get(roi_id) or {},
+        analysis_id,
+        roi_record(existing, roi_id),
+    )
+
+
+def apply_roi_analysis(
+    summary: dict[str, Any],
+    roi_id: str,
+    analysis_id: str,
+    density: float,
+    existing: Optional[dict[str, Any]] = None,
+) -> dict[str, Any]:
+    rois = dict(summary.get("rois") or {})
+    rois[roi_id] = apply_analysis(
+        rois.get(roi_id) or {}, analysis_id, density, roi_record(existing, roi_id)
+    )
+    return {**summary, "rois": rois}
+
+
+def summary_record(summary: dict[str, Any]) -> dict[str, Any]:
+    from firebase_admin import firestore as admin_firestore
+
+    return {**summary, "updatedAt": admin_firestore.SERVER_TIMESTAMP}
+
+
+def build_summary(db, uid: str, transaction=None) -> dict[str, Any]:
+    from firebase_admin import firestore as admin_firestore
+
+    items = (
+        summary_ref(db, uid)
+        .collection("items")
+        .order_by("computedAt", direction=admin_firestore.Query.ASCENDING)
+        .get(transaction=transaction)
+    )
+    summary = empty_summary()
+    for doc in items:
+        data = doc.to_dict()
+        density = data.get("densityIndex")
+        if not isinstance(density, (int, float)):
+            continue
+        analysis_id = doc.id
+        summary = apply_analysis(summary, analysis_id, float(density))
+        for roi_id, roi in (data.get("rois") or {}).items():
+            roi_density = roi.get("densityIndex")
+            if isinstance(roi_density, (int, float)):
+                summary = apply_roi_analysis(summary, roi_id, analysis_id, float(roi_density))
+    return summary
+
+
+def load_summary(db, uid: str, transaction=None) -> dict[str, Any]:
+    snapshot = summary_ref(db, uid).get(transaction=transaction)
+    if snapshot.exists:
+        data = snapshot.to_dict() or {}
+        if "count" in data:
+            return {**empty_summary(), **data}
+    # 集計ドキュメント導入前のユーザーは一度だけ items から組み立てる
+    return build_summary(db, uid, transaction)
+
+
+def rebuild_summary(db, uid: str) -> dict[str, Any]:
+    summary = build_summary(db, uid)
+    summary_ref(db, uid).set(summary_record(summary))
+    return summary
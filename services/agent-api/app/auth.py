@@ -4,6 +4,8 @@ from fastapi import Header, HTTPException
 
 from .config import DEBUG_AUTH
 from .firebase import verify_id_token
+from .id_tokens import CertificateUnavailable
+from .timing import stage
 
 
 def get_current_uid(authorization: str | None = Header(default=None)) -> str:
@@ -12,7 +14,15 @@ def get_current_uid(authorization: str | None = Header(default=None)) -> str:
 
     token = authorization.split(" ", 1)[1]
     try:
-        decoded = verify_id_token(token)
+        with stage("auth"):
+            decoded = verify_id_token(token)
+    except CertificateUnavailable as exc:
+        # 公開鍵の取得待ち。ネットワークを待たずにすぐ返し、再試行させる
+        raise HTTPException(
+            status_code=503,
+            detail="Token verification is temporarily unavailable",
+            headers={"Retry-After": "1"},
+        ) from exc
     except Exception as exc:  # noqa: BLE001
         logging.exception("Failed to verify Firebase ID token")
         detail = f"Invalid token: {exc}" if DEBUG_AUTH else "Invalid token"
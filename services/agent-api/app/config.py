@@ -3,4 +3,57 @@ import os
 FIREBASE_STORAGE_BUCKET = os.getenv("FIREBASE_STORAGE_BUCKET", "")
 FIREBASE_PROJECT_ID = os.getenv("FIREBASE_PROJECT_ID", "")
 LOCAL_IMAGE_PATH = os.getenv("LOCAL_IMAGE_PATH", "")
+STORAGE_LOCAL_DIR = os.getenv("STORAGE_LOCAL_DIR", "")
+STORAGE_MAX_IMAGE_BYTES = int(os.getenv("STORAGE_MAX_IMAGE_MB", "25")) * 1024 * 1024
+STORAGE_CACHE_DIR = os.getenv("STORAGE_CACHE_DIR", "")
+STORAGE_CACHE_MAX_BYTES = int(os.getenv("STORAGE_CACHE_MAX_MB", "512")) * 1024 * 1024
 DEBUG_AUTH = os.getenv("DEBUG_AUTH", "false").lower() == "true"
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "1024"))
+AUTH_CERT_WARMUP_TIMEOUT_S = float(os.getenv("AUTH_CERT_WARMUP_TIMEOUT_S", "5"))
+AUTH_CERT_ROTATION_WAIT_S = float(os.getenv("AUTH_CERT_ROTATION_WAIT_S", "2"))
+USE_MOCK_FIRESTORE = os.getenv("USE_MOCK_FIRESTORE", "false").lower() == "true"
+MOCK_FIRESTORE_DIR = os.getenv("MOCK_FIRESTORE_DIR", "")
+MOCK_FIRESTORE_SNAPSHOT_EVERY = int(os.getenv("MOCK_FIRESTORE_SNAPSHOT_EVERY", "10000"))
+MOCK_FIRESTORE_FSYNC = os.getenv("MOCK_FIRESTORE_FSYNC", "false").lower() == "true"
+TIMING_ENABLED = os.getenv("TIMING_ENABLED", "true").lower() == "true"
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "false").lower() == "true"
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()
+LLM_LOCAL_LATENCY = os.getenv("LLM_LOCAL_LATENCY", "fixed:0")
+LLM_LOCAL_ERROR_RATE = float(os.getenv("LLM_LOCAL_ERROR_RATE", "0"))
+LLM_LOCAL_MALFORMED_RATE = float(os.getenv("LLM_LOCAL_MALFORMED_RATE", "0"))
+LLM_LOCAL_SEED = int(os.getenv("LLM_LOCAL_SEED", "0"))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "128"))
+LLM_CACHE_TTL_S = float(os.getenv("LLM_CACHE_TTL_S", "600"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "20"))
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+REPORT_MAX_PERIOD_DAYS = int(os.getenv("REPORT_MAX_PERIOD_DAYS", "365"))
+STORE_CATALOG_PATH = os.getenv("STORE_CATALOG_PATH", "")
+FOOD_CATALOG_PATH = os.getenv("FOOD_CATALOG_PATH", "")
+RISK_KEYWORDS_PATH = os.getenv("RISK_KEYWORDS_PATH", "")
+STORE_GRID_CELL_M = float(os.getenv("STORE_GRID_CELL_M", "500"))
+STORE_MAX_RADIUS_M = int(os.getenv("STORE_MAX_RADIUS_M", "5000"))
+STORE_MAX_RESULTS = int(os.getenv("STORE_MAX_RESULTS", "10"))
+ANALYZE_BATCH_MAX = int(os.getenv("ANALYZE_BATCH_MAX", "20"))
+ANALYSIS_MAX_SIDE = int(os.getenv("ANALYSIS_MAX_SIDE", "0"))
+ANALYSIS_MAX_ROIS = int(os.getenv("ANALYSIS_MAX_ROIS", "8"))
+QUALITY_CHECK_MAX_BYTES = int(os.getenv("QUALITY_CHECK_MAX_KB", "1024")) * 1024
+QUALITY_CHECK_MAX_PIXELS = int(os.getenv("QUALITY_CHECK_MAX_PIXELS", str(4096 * 4096)))
+QUALITY_CHECK_MAX_SIDE = int(os.getenv("QUALITY_CHECK_MAX_SIDE", "256"))
+ANALYSIS_MEMORY_BUDGET_BYTES = (
+    int(os.getenv("ANALYSIS_MEMORY_BUDGET_MB", "256")) * 1024 * 1024
+)
+ANALYSIS_METHOD = os.getenv("ANALYSIS_METHOD", "pil_threshold_v1")
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "256"))
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR", "")
+ANALYSIS_CACHE_DISK_MAX_BYTES = (
+    int(os.getenv("ANALYSIS_CACHE_DISK_MAX_MB", "256")) * 1024 * 1024
+)
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "0"))
+ANALYSIS_QUEUE_SIZE = int(os.getenv("ANALYSIS_QUEUE_SIZE", "8"))
+ANALYSIS_RETRY_AFTER_S = int(os.getenv("ANALYSIS_RETRY_AFTER_S", "2"))
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "1"))
+ANALYSIS_JOB_QUEUE_SIZE = int(os.getenv("ANALYSIS_JOB_QUEUE_SIZE", "100"))
+ANALYSIS_JOB_RETRIES = int(os.getenv("ANALYSIS_JOB_RETRIES", "5"))
+ANALYSIS_JOB_RETRY_DELAY_S = float(os.getenv("ANALYSIS_JOB_RETRY_DELAY_S", "0.5"))
@@ -1,10 +1,21 @@
-import firebase_admin
-from firebase_admin import auth, firestore
+import os
 
-from .config import FIREBASE_PROJECT_ID, FIREBASE_STORAGE_BUCKET
+from .config import (
+    FIREBASE_PROJECT_ID,
+    FIREBASE_STORAGE_BUCKET,
+    MOCK_FIRESTORE_DIR,
+    MOCK_FIRESTORE_FSYNC,
+    MOCK_FIRESTORE_SNAPSHOT_EVERY,
+    USE_MOCK_FIRESTORE,
+)
+from .id_tokens import get_certificate_keeper, get_token_cache, verify_with_keeper
+
+_mock_firestore_client = None
 
 
 def init_firebase() -> None:
+    import firebase_admin
+
     if firebase_admin._apps:
         return
 
@@ -17,11 +28,47 @@ def init_firebase() -> None:
     firebase_admin.initialize_app(options=options or None)
 
 
-def verify_id_token(id_token: str):
+def _project_id() -> str:
+    if FIREBASE_PROJECT_ID:
+        return FIREBASE_PROJECT_ID
+    import firebase_admin
+
     init_firebase()
-    return auth.verify_id_token(id_token)
+    return firebase_admin.get_app().project_id or ""
+
+
+def verify_id_token(id_token: str):
+    cache = get_token_cache()
+    decoded = cache.get(id_token)
+    if decoded is not None:
+        return decoded
+
+    if os.getenv("FIREBASE_AUTH_EMULATOR_HOST"):
+        # エミュレータのトークンは署名がないので firebase_admin に任せる
+        from firebase_admin import auth
+
+        init_firebase()
+        decoded = auth.verify_id_token(id_token)
+    else:
+        decoded = verify_with_keeper(id_token, _project_id(), get_certificate_keeper())
+    cache.put(id_token, decoded)
+    return decoded
 
 
 def get_firestore_client():
+    global _mock_firestore_client
+    if USE_MOCK_FIRESTORE:
+        if _mock_firestore_client is None:
+            from .firestore_mock import MockFirestoreClient
+
+            _mock_firestore_client = MockFirestoreClient(
+                persist_dir=MOCK_FIRESTORE_DIR or None,
+                snapshot_every=MOCK_FIRESTORE_SNAPSHOT_EVERY,
+                fsync=MOCK_FIRESTORE_FSYNC,
+            )
+        return _mock_firestore_client
+
+    from firebase_admin import firestore
+
     init_firebase()
     return firestore.client()
@@ -1,12 +1,27 @@
+import bisect
+from datetime import datetime, timezone
+import json
+import logging
+import mmap
+import os
+from pathlib import Path
+import pickle
+import threading
 import time
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Iterator, List, Tuple
+import uuid
 
 from firebase_admin import firestore as admin_firestore
 
+_RANGE_OPS = {"<", "<=", ">", ">=", "=="}
+
+# data が None の書き込みは削除を表す
+_Write = Tuple[List[str], Dict[str, Any] | None, bool]
+
 
 def _replace_server_timestamps(value: Any) -> Any:
     if value is admin_firestore.SERVER_TIMESTAMP:
-        return time.time()
+        return datetime.now(timezone.utc)
     if isinstance(value, dict):
         return {key: _replace_server_timestamps(val) for key, val in value.items()}
     if isinstance(value, list):
@@ -52,8 +67,102 @@ def _get_collection_dict(
     return None
 
 
+def _order_key(value: Any) -> Tuple[int, Any]:
+    # 型が混在しても比較できるよう、型ごとの順位を先頭に付ける
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, value.timestamp())
+    if isinstance(value, str):
+        return (4, value)
+    return (9, repr(value))
+
+
+def _is_descending(direction: str | Any) -> bool:
+    return (
+        direction == admin_firestore.Query.DESCENDING
+        or str(direction).upper() == "DESCENDING"
+    )
+
+
+class _FieldIndex:
+    # 値を持つ doc の (順序キー, doc_id) をソート済みで保持する
+    def __init__(self, field: str, collection: Dict[str, Any]):
+        self.field = field
+        self.entries: List[Tuple[Tuple[int, Any], str]] = [
+            (_order_key(value), doc_id)
+            for doc_id, doc in collection.items()
+            if (value := doc["__data__"].get(field)) is not None
+        ]
+        self.entries.sort()
+
+    def add(self, doc_id: str, value: Any) -> None:
+        if value is None:
+            return
+        bisect.insort(self.entries, (_order_key(value), doc_id))
+
+    def remove(self, doc_id: str, value: Any) -> None:
+        if value is None:
+            return
+        entry = (_order_key(value), doc_id)
+        position = bisect.bisect_left(self.entries, entry)
+        if position < len(self.entries) and self.entries[position] == entry:
+            del self.entries[position]
+
+    def lower_bound(self, value: Any, inclusive: bool) -> int:
+        key = _order_key(value)
+        if inclusive:
+            return bisect.bisect_left(self.entries, key, key=lambda entry: entry[0])
+        return bisect.bisect_right(self.entries, key, key=lambda entry: entry[0])
+
+    def upper_bound(self, value: Any, inclusive: bool) -> int:
+        key = _order_key(value)
+        if inclusive:
+            return bisect.bisect_right(self.entries, key, key=lambda entry: entry[0])
+        return bisect.bisect_left(self.entries, key, key=lambda entry: entry[0])
+
+
+class _IndexRegistry:
+    # コレクションパスごと・フィールドごとの順序インデックス。初回クエリ時に作り、以降は set で更新する
+    def __init__(self):
+        self._indexes: Dict[Tuple[str, ...], Dict[str, _FieldIndex]] = {}
+
+    def get(
+        self, path_parts: List[str], field: str, collection: Dict[str, Any]
+    ) -> _FieldIndex:
+        fields = self._indexes.setdefault(tuple(path_parts), {})
+        index = fields.get(field)
+        if index is None:
+            index = _FieldIndex(field, collection)
+            fields[field] = index
+        return index
+
+    def indexed_fields(self, path_parts: List[str]) -> Dict[str, _FieldIndex]:
+        return self._indexes.get(tuple(path_parts), {})
+
+    def update(
+        self,
+        path_parts: List[str],
+        doc_id: str,
+        before: Dict[str, Any] | None,
+        after: Dict[str, Any],
+    ) -> None:
+        for field, index in self.indexed_fields(path_parts).items():
+            old_value = before.get(field) if before is not None else None
+            new_value = after.get(field)
+            if before is not None and old_value == new_value and type(old_value) is type(new_value):
+                continue
+            if before is not None:
+                index.remove(doc_id, old_value)
+            index.add(doc_id, new_value)
+
+
 class MockDocumentSnapshot:
-    def __init__(self, data: Dict[str, Any] | None):
+    def __init__(self, data: Dict[str, Any] | None, doc_id: str | None = None):
+        self.id = doc_id
+        self.exists = data is not None
         self._data = data or {}
 
     def to_dict(self) -> Dict[str, Any]:
@@ -63,111 +172,521 @@ class MockDocumentSnapshot:
 class MockQuery:
     def __init__(
         self,
-        store: Dict[str, Dict[str, Any]],
+        state: "_MockState",
         path_parts: List[str],
         order_by_field: str | None = None,
         direction: str | Any = "ASCENDING",
         limit_count: int | None = None,
+        filters: List[Tuple[str, str, Any]] | None = None,
+        cursor: Tuple[Any, str | None] | None = None,
     ):
-        self._store = store
+        self._state = state
         self._path_parts = list(path_parts)
         self._order_by_field = order_by_field
         self._direction = direction
         self._limit_count = limit_count
+        self._filters = list(filters or [])
+        self._cursor = cursor
+
+    def _copy(self, **changes: Any) -> "MockQuery":
+        params = {
+            "order_by_field": self._order_by_field,
+            "direction": self._direction,
+            "limit_count": self._limit_count,
+            "filters": self._filters,
+            "cursor": self._cursor,
+        }
+        params.update(changes)
+        return MockQuery(self._state, self._path_parts, **params)
 
     def order_by(self, field: str, direction: str | Any = "ASCENDING") -> "MockQuery":
-        return MockQuery(
-            self._store,
-            self._path_parts,
-            order_by_field=field,
-            direction=direction,
-            limit_count=self._limit_count,
-        )
+        return self._copy(order_by_field=field, direction=direction)
 
     def limit(self, count: int) -> "MockQuery":
-        return MockQuery(
-            self._store,
-            self._path_parts,
-            order_by_field=self._order_by_field,
-            direction=self._direction,
-            limit_count=count,
-        )
+        return self._copy(limit_count=count)
 
-    def get(self) -> List[MockDocumentSnapshot]:
-        collection = _get_collection_dict(self._store, self._path_parts, create=False)
+    def where(
+        self,
+        field_path: str | None = None,
+        op_string: str | None = None,
+        value: Any = None,
+        *,
+        filter: Any = None,
+    ) -> "MockQuery":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if op_string not in _RANGE_OPS:
+            raise NotImplementedError(f"Unsupported operator: {op_string}")
+        return self._copy(filters=self._filters + [(field_path, op_string, value)])
+
+    def start_after(self, document_fields_or_snapshot: Any) -> "MockQuery":
+        # スナップショットなら (値, doc_id)、dict なら値のみをカーソルにする
+        field = self._index_field()
+        if field is None:
+            raise ValueError("start_after requires order_by or a range filter")
+        if isinstance(document_fields_or_snapshot, MockDocumentSnapshot):
+            snapshot = document_fields_or_snapshot
+            return self._copy(cursor=(snapshot.to_dict().get(field), snapshot.id))
+        return self._copy(cursor=(document_fields_or_snapshot.get(field), None))
+
+    def _index_field(self) -> str | None:
+        if self._order_by_field:
+            return self._order_by_field
+        for field, op, _ in self._filters:
+            if op != "==":
+                return field
+        return None
+
+    def _matches(self, data: Dict[str, Any]) -> bool:
+        for field, op, expected in self._filters:
+            value = data.get(field)
+            if value is None:
+                return False
+            left, right = _order_key(value), _order_key(expected)
+            if op == "==" and not left == right:
+                return False
+            if op == "<" and not left < right:
+                return False
+            if op == "<=" and not left <= right:
+                return False
+            if op == ">" and not left > right:
+                return False
+            if op == ">=" and not left >= right:
+                return False
+        return True
+
+    def _scan_indexed(
+        self, field: str, collection: Dict[str, Any]
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        index = self._state.indexes.get(self._path_parts, field, collection)
+        start, stop = 0, len(index.entries)
+        for filter_field, op, value in self._filters:
+            if filter_field != field:
+                continue
+            if op in (">", ">=", "=="):
+                start = max(start, index.lower_bound(value, op != ">"))
+            if op in ("<", "<=", "=="):
+                stop = min(stop, index.upper_bound(value, op != "<"))
+
+        descending = _is_descending(self._direction)
+        if self._cursor is not None:
+            value, doc_id = self._cursor
+            if doc_id is None:
+                if descending:
+                    stop = min(stop, index.upper_bound(value, False))
+                else:
+                    start = max(start, index.lower_bound(value, False))
+            else:
+                entry = (_order_key(value), doc_id)
+                if descending:
+                    stop = min(stop, bisect.bisect_left(index.entries, entry))
+                else:
+                    start = max(start, bisect.bisect_right(index.entries, entry))
+
+        positions = range(stop - 1, start - 1, -1) if descending else range(start, stop)
+        for position in positions:
+            doc_id = index.entries[position][1]
+            yield doc_id, collection[doc_id]
+
+        # 従来どおり、範囲条件がなければ値を持たない doc を末尾に並べる（limit で打ち切られれば走査しない）
+        if not self._filters and self._cursor is None:
+            for doc_id, doc in collection.items():
+                if doc["__data__"].get(field) is None:
+                    yield doc_id, doc
+
+    def get(self, transaction: Any = None) -> List[MockDocumentSnapshot]:
+        collection = _get_collection_dict(self._state.store, self._path_parts, create=False)
         if not collection:
             return []
 
-        docs: List[Tuple[str, Dict[str, Any]]] = list(collection.items())
-
-        if self._order_by_field:
-            def sort_key(item: Tuple[str, Dict[str, Any]]) -> Tuple[bool, Any]:
-                data = item[1].get("__data__", {})
-                value = data.get(self._order_by_field)
-                return (value is None, value)
-
-            direction = (
-                "DESCENDING"
-                if self._direction == admin_firestore.Query.DESCENDING
-                or str(self._direction).upper() == "DESCENDING"
-                else "ASCENDING"
-            )
-
-            with_value = [item for item in docs if item[1]["__data__"].get(self._order_by_field) is not None]
-            without_value = [item for item in docs if item[1]["__data__"].get(self._order_by_field) is None]
-            with_value = sorted(with_value, key=sort_key, reverse=direction == "DESCENDING")
-            docs = with_value + without_value
+        field = self._index_field()
+        if field:
+            candidates = self._scan_indexed(field, collection)
+        else:
+            candidates = iter(collection.items())
 
-        if self._limit_count is not None:
-            docs = docs[: self._limit_count]
+        docs: List[Tuple[str, Dict[str, Any]]] = []
+        for doc_id, doc in candidates:
+            if self._limit_count is not None and len(docs) >= self._limit_count:
+                break
+            if self._matches(doc["__data__"]):
+                docs.append((doc_id, doc))
 
-        return [MockDocumentSnapshot(doc["__data__"]) for _, doc in docs]
+        return [MockDocumentSnapshot(doc["__data__"], doc_id) for doc_id, doc in docs]
 
 
 class MockCollectionRef:
-    def __init__(self, store: Dict[str, Dict[str, Any]], path_parts: List[str]):
-        self._store = store
+    def __init__(self, state: "_MockState", path_parts: List[str]):
+        self._state = state
         self._path_parts = list(path_parts)
 
-    def document(self, doc_id: str) -> "MockDocumentRef":
-        return MockDocumentRef(self._store, self._path_parts + [doc_id])
+    def _query(self) -> MockQuery:
+        return MockQuery(self._state, self._path_parts)
+
+    def document(self, doc_id: str | None = None) -> "MockDocumentRef":
+        return MockDocumentRef(self._state, self._path_parts + [doc_id or _auto_id()])
+
+    def add(
+        self, document_data: Dict[str, Any], document_id: str | None = None
+    ) -> Tuple[float, "MockDocumentRef"]:
+        doc_ref = self.document(document_id)
+        doc_ref.set(document_data)
+        return time.time(), doc_ref
 
     def order_by(self, field: str, direction: str | Any = "ASCENDING") -> MockQuery:
-        return MockQuery(self._store, self._path_parts, order_by_field=field, direction=direction)
+        return self._query().order_by(field, direction=direction)
 
     def limit(self, count: int) -> MockQuery:
-        return MockQuery(self._store, self._path_parts, limit_count=count)
+        return self._query().limit(count)
+
+    def where(self, *args: Any, **kwargs: Any) -> MockQuery:
+        return self._query().where(*args, **kwargs)
+
+    def get(self, transaction: Any = None) -> List[MockDocumentSnapshot]:
+        return self._query().get()
 
-    def get(self) -> List[MockDocumentSnapshot]:
-        return MockQuery(self._store, self._path_parts).get()
+    def list_documents(self) -> List["MockDocumentRef"]:
+        collection = _get_collection_dict(self._state.store, self._path_parts, create=False)
+        if not collection:
+            return []
+        return [self.document(doc_id) for doc_id in collection]
 
 
 class MockDocumentRef:
-    def __init__(self, store: Dict[str, Dict[str, Any]], path_parts: List[str]):
-        self._store = store
+    def __init__(self, state: "_MockState", path_parts: List[str]):
+        self._state = state
         self._path_parts = list(path_parts)
+        self.id = self._path_parts[-1]
 
     def collection(self, name: str) -> MockCollectionRef:
-        return MockCollectionRef(self._store, self._path_parts + [name])
+        return MockCollectionRef(self._state, self._path_parts + [name])
+
+    def get(self, transaction: Any = None) -> MockDocumentSnapshot:
+        collection = _get_collection_dict(
+            self._state.store, self._path_parts[:-1], create=False
+        )
+        if not collection or self._path_parts[-1] not in collection:
+            return MockDocumentSnapshot(None, self._path_parts[-1])
+        return MockDocumentSnapshot(
+            collection[self._path_parts[-1]]["__data__"], self._path_parts[-1]
+        )
 
     def set(self, data: Dict[str, Any], merge: bool | None = False) -> None:
-        parent_path = self._path_parts[:-1]
-        doc_id = self._path_parts[-1]
-        collection = _get_collection_dict(self._store, parent_path, create=True)
+        self._state.apply_writes(
+            [(self._path_parts, _replace_server_timestamps(data), bool(merge))]
+        )
+
+    def delete(self) -> None:
+        self._state.apply_writes([(self._path_parts, None, False)])
+
+
+def _auto_id() -> str:
+    return uuid.uuid4().hex[:20]
+
+
+class MockWriteBatch:
+    # commit までは書き込みを溜め、commit で全件をまとめて適用する
+    def __init__(self, state: "_MockState"):
+        self._state = state
+        self._writes: List[_Write] = []
+        self._committed = False
+
+    def set(
+        self, reference: MockDocumentRef, document_data: Dict[str, Any], merge: bool = False
+    ) -> None:
+        if self._committed:
+            raise ValueError("Cannot add writes to a committed batch")
+        self._writes.append(
+            (reference._path_parts, _replace_server_timestamps(document_data), bool(merge))
+        )
+
+    def delete(self, reference: MockDocumentRef) -> None:
+        if self._committed:
+            raise ValueError("Cannot add writes to a committed batch")
+        self._writes.append((reference._path_parts, None, False))
+
+    def commit(self) -> List[float]:
+        if self._committed:
+            raise ValueError("Batch already committed")
+        self._committed = True
+        self._state.apply_writes(self._writes)
+        now = time.time()
+        return [now for _ in self._writes]
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+
+class MockTransaction(MockWriteBatch):
+    # firestore.transactional から呼ばれる _begin/_commit/_rollback を実装する
+    # 開始から終了まで状態ロックを保持し、他の書き込みと直列化する
+    def __init__(self, state: "_MockState", max_attempts: int = 5, read_only: bool = False):
+        super().__init__(state)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id: str | None = None
+
+    def get(self, ref_or_query: Any) -> Any:
+        return ref_or_query.get(transaction=self)
+
+    @property
+    def in_progress(self) -> bool:
+        return self._id is not None
+
+    def _clean_up(self) -> None:
+        self._writes = []
+        self._committed = False
+        if self._id is not None:
+            self._id = None
+            self._state.lock.release()
+
+    def _begin(self, retry_id: str | None = None) -> None:
+        if self._id is not None:
+            raise ValueError("Transaction already in progress")
+        self._state.lock.acquire()
+        self._id = _auto_id()
+
+    def _commit(self) -> List[float]:
+        if self._id is None:
+            raise ValueError("Transaction not in progress")
+        if self._read_only and self._writes:
+            raise ValueError("Cannot write in a read-only transaction")
+        try:
+            return self.commit()
+        finally:
+            self._clean_up()
+
+    def _rollback(self) -> None:
+        self._clean_up()
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"Unsupported value in mock store: {type(value).__name__}")
+
+
+def _decode_object(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1 and "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+class _WriteAheadLog:
+    # set/merge を1行1件の JSON で追記し、定期的にスナップショットへ圧縮する
+    SNAPSHOT_FILE = "snapshot.pickle"
+    LOG_FILE = "wal.jsonl"
+
+    def __init__(self, directory: str, snapshot_every: int, fsync: bool):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.seq = 0
+        self.writes_since_snapshot = 0
+        self._log = None
+
+    @property
+    def snapshot_path(self) -> Path:
+        return self.directory / self.SNAPSHOT_FILE
+
+    @property
+    def log_path(self) -> Path:
+        return self.directory / self.LOG_FILE
+
+    def load(self, state: "_MockState") -> Dict[str, Any]:
+        started = time.perf_counter()
+        snapshot_seq = 0
+        if self.snapshot_path.exists() and self.snapshot_path.stat().st_size:
+            with open(self.snapshot_path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    snapshot = pickle.loads(mapped)
+            state.store = snapshot["store"]
+            snapshot_seq = snapshot["seq"]
+        snapshot_seconds = time.perf_counter() - started
+
+        replay_started = time.perf_counter()
+        replayed = 0
+        self.seq = snapshot_seq
+        if self.log_path.exists():
+            valid_bytes = 0
+            with open(self.log_path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line, object_hook=_decode_object) if line.strip() else None
+                    except json.JSONDecodeError:
+                        # 書き込み途中で落ちた末尾行は捨てる
+                        break
+                    valid_bytes += len(line)
+                    # スナップショットに含まれる分は飛ばし、末尾だけを適用する
+                    if entry is None or entry["seq"] <= snapshot_seq:
+                        continue
+                    writes = [
+                        (write["path"], write["data"], write["merge"])
+                        for write in entry["writes"]
+                    ]
+                    state.apply_writes(writes, log=False)
+                    self.seq = entry["seq"]
+                    replayed += 1
+            if valid_bytes < self.log_path.stat().st_size:
+                os.truncate(self.log_path, valid_bytes)
+        replay_seconds = time.perf_counter() - replay_started
+        self.writes_since_snapshot = replayed
+
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        stats = {
+            "snapshotSeq": snapshot_seq,
+            "snapshotLoadSeconds": snapshot_seconds,
+            "replayedOps": replayed,
+            "replaySeconds": replay_seconds,
+            "replayOpsPerSecond": replayed / replay_seconds if replay_seconds > 0 else 0.0,
+            "startupSeconds": time.perf_counter() - started,
+        }
+        logging.info("MockFirestoreClient loaded from %s: %s", self.directory, stats)
+        return stats
+
+    def append(self, writes: List[_Write]) -> None:
+        # バッチ/トランザクションは1行に収め、復元時も全件か0件のどちらかになるようにする
+        self.seq += 1
+        entry = {
+            "seq": self.seq,
+            "writes": [
+                {"path": list(path_parts), "data": data, "merge": merge}
+                for path_parts, data, merge in writes
+            ],
+        }
+        self._log.write(json.dumps(entry, default=_encode_value, ensure_ascii=False) + "\n")
+        self._log.flush()
+        if self.fsync:
+            os.fsync(self._log.fileno())
+        self.writes_since_snapshot += len(writes)
+
+    def should_snapshot(self) -> bool:
+        return self.snapshot_every > 0 and self.writes_since_snapshot >= self.snapshot_every
+
+    def snapshot(self, store: Dict[str, Any]) -> None:
+        tmp_path = self.snapshot_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"seq": self.seq, "store": store}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        # スナップショット確定後にログを空にする（途中で落ちても seq で重複適用を防げる）
+        self._log.close()
+        self._log = open(self.log_path, "w", encoding="utf-8")
+        self.writes_since_snapshot = 0
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+
+class _MockState:
+    def __init__(self):
+        self.store: Dict[str, Dict[str, Any]] = {}
+        self.indexes = _IndexRegistry()
+        self.write_log: _WriteAheadLog | None = None
+        self.lock = threading.RLock()
+
+    def _apply_one(
+        self, path_parts: List[str], incoming: Dict[str, Any] | None, merge: bool
+    ) -> None:
+        parent_path = list(path_parts[:-1])
+        doc_id = path_parts[-1]
+        collection = _get_collection_dict(self.store, parent_path, create=True)
         if collection is None:
             return
 
+        existing = collection.get(doc_id)
+        before = dict(existing["__data__"]) if existing is not None else None
+        if incoming is None:
+            # Firestore と同じくサブコレクションは消さない
+            if existing is None:
+                return
+            if existing["__subcollections__"]:
+                existing["__data__"] = {}
+            else:
+                collection.pop(doc_id)
+            self.indexes.update(parent_path, doc_id, before, {})
+            return
         doc = collection.setdefault(doc_id, {"__data__": {}, "__subcollections__": {}})
-        incoming = _replace_server_timestamps(data)
         if merge:
             doc["__data__"].update(incoming)
         else:
             doc["__data__"] = dict(incoming)
+        self.indexes.update(parent_path, doc_id, before, doc["__data__"])
+
+    def _restore(self, path_parts: List[str], data: Dict[str, Any] | None) -> None:
+        collection = _get_collection_dict(self.store, list(path_parts[:-1]), create=True)
+        doc_id = path_parts[-1]
+        current = dict(collection[doc_id]["__data__"]) if doc_id in collection else None
+        if data is None:
+            collection.pop(doc_id, None)
+            data_after: Dict[str, Any] = {}
+        else:
+            collection.setdefault(doc_id, {"__data__": {}, "__subcollections__": {}})
+            collection[doc_id]["__data__"] = data
+            data_after = data
+        self.indexes.update(list(path_parts[:-1]), doc_id, current, data_after)
+
+    def apply_writes(self, writes: List[_Write], log: bool = True) -> None:
+        if not writes:
+            return
+        with self.lock:
+            # 途中で失敗したら適用済みの doc を元に戻し、全件か0件のどちらかにする
+            originals: List[Tuple[List[str], Dict[str, Any] | None]] = []
+            try:
+                for path_parts, incoming, merge in writes:
+                    snapshot = MockDocumentRef(self, list(path_parts)).get()
+                    originals.append(
+                        (list(path_parts), snapshot.to_dict() if snapshot.exists else None)
+                    )
+                    self._apply_one(path_parts, incoming, merge)
+                if log and self.write_log is not None:
+                    self.write_log.append(writes)
+            except Exception:
+                for path_parts, data in reversed(originals):
+                    self._restore(path_parts, data)
+                raise
+
+            if log and self.write_log is not None and self.write_log.should_snapshot():
+                self.write_log.snapshot(self.store)
 
 
 class MockFirestoreClient:
-    def __init__(self):
-        self._store: Dict[str, Dict[str, Any]] = {}
+    def __init__(
+        self,
+        persist_dir: str | None = None,
+        snapshot_every: int = 10000,
+        fsync: bool = False,
+    ):
+        self._state = _MockState()
+        self.load_stats: Dict[str, Any] | None = None
+        if persist_dir:
+            write_log = _WriteAheadLog(persist_dir, snapshot_every, fsync)
+            self.load_stats = write_log.load(self._state)
+            self._state.write_log = write_log
+
+    @property
+    def _store(self) -> Dict[str, Dict[str, Any]]:
+        return self._state.store
 
     def collection(self, name: str) -> MockCollectionRef:
-        return MockCollectionRef(self._store, [name])
+        return MockCollectionRef(self._state, [name])
+
+    def batch(self) -> MockWriteBatch:
+        return MockWriteBatch(self._state)
+
+    def transaction(self, max_attempts: int = 5, read_only: bool = False) -> MockTransaction:
+        return MockTransaction(self._state, max_attempts=max_attempts, read_only=read_only)
+
+    def snapshot(self) -> None:
+        with self._state.lock:
+            if self._state.write_log is not None:
+                self._state.write_log.snapshot(self._state.store)
+
+    def close(self) -> None:
+        with self._state.lock:
+            if self._state.write_log is not None:
+                self._state.write_log.close()
@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from typing import Any, Callable, Mapping
+
+from .config import (
+    AUTH_CERT_ROTATION_WAIT_S,
+    AUTH_CERT_WARMUP_TIMEOUT_S,
+    AUTH_TOKEN_CACHE_SIZE,
+)
+
+ID_TOKEN_CERT_URL = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/"
+    "securetoken@system.gserviceaccount.com"
+)
+ID_TOKEN_ISSUER_PREFIX = "https://securetoken.google.com/"
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+_DEFAULT_MAX_AGE_S = 3600.0
+_MIN_REFRESH_S = 60.0
+_RETRY_MIN_S = 5.0
+_RETRY_MAX_S = 300.0
+_FETCH_TIMEOUT_S = 10.0
+
+
+class CertificateUnavailable(RuntimeError):
+    pass
+
+
+class _CertResponse:
+    # google.auth.transport.Response と同じ形
+    def __init__(self, data: bytes):
+        self._data = data
+
+    @property
+    def status(self) -> int:
+        return 200
+
+    @property
+    def headers(self) -> Mapping[str, str]:
+        return {}
+
+    @property
+    def data(self) -> bytes:
+        return self._data
+
+
+def _fetch_certs(url: str) -> tuple[bytes, float]:
+    from google.auth.transport import requests as google_auth_requests
+
+    response = google_auth_requests.Request()(url, method="GET", timeout=_FETCH_TIMEOUT_S)
+    if response.status != 200:
+        raise RuntimeError(f"Could not fetch certificates at {url}: {response.status}")
+    match = _MAX_AGE_RE.search(response.headers.get("cache-control", ""))
+    max_age = float(match.group(1)) if match else _DEFAULT_MAX_AGE_S
+    return response.data, max_age
+
+
+class CertificateKeeper:
+    # google.auth.transport.Request として検証側（google.oauth2.id_token）に渡す。
+    # 公開鍵はバックグラウンドで更新し、検証中はメモリ上の値だけを返してネットワークへ出ない
+    def __init__(
+        self,
+        url: str = ID_TOKEN_CERT_URL,
+        fetch: Callable[[str], tuple[bytes, float]] = _fetch_certs,
+    ):
+        self.url = url
+        self._fetch = fetch
+        self._data: bytes | None = None
+        self._kids: frozenset[str] = frozenset()
+        self._fetched_at = 0.0
+        self._attempted_at = 0.0
+        self._max_age = 0.0
+        self._lock = threading.Lock()
+        self._refreshed = threading.Condition(self._lock)
+        self._ready = threading.Event()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.refreshes = 0
+        self.failures = 0
+        self.unavailable = 0
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=None, **kwargs):
+        if url != self.url:
+            raise ValueError(f"Unexpected certificate URL: {url}")
+        with self._lock:
+            data = self._data
+            if data is None:
+                self.unavailable += 1
+        if data is None:
+            self._wake.set()
+            raise CertificateUnavailable("Signing certificates are not loaded yet")
+        return _CertResponse(data)
+
+    def knows(self, kid: str | None) -> bool:
+        with self._lock:
+            return kid in self._kids
+
+    def await_refresh(self, timeout: float) -> bool:
+        # 知らない kid が来たら鍵の入れ替えとみなし、次の周期を待たずに取り直す。timeout 秒以内に取り直せたら True。
+        # 取り直した直後（_RETRY_MIN_S 以内）の鍵はそれ以上新しくならないので待たない
+        with self._refreshed:
+            if self._data is not None and time.monotonic() - self._fetched_at < _RETRY_MIN_S:
+                return True
+            generation = self.refreshes
+            self._wake.set()
+            return self._refreshed.wait_for(lambda: self.refreshes > generation, timeout)
+
+    def refresh(self) -> bool:
+        self._attempted_at = time.monotonic()
+        try:
+            data, max_age = self._fetch(self.url)
+            kids = frozenset(json.loads(data))
+        except Exception as exc:  # noqa: BLE001
+            # オフライン時などは再試行のたびに出るので、スタックトレースは付けない
+            logging.warning("Failed to refresh ID token certificates: %s", exc)
+            with self._lock:
+                self.failures += 1
+            return False
+        with self._lock:
+            self._data = data
+            self._kids = kids
+            self._fetched_at = time.monotonic()
+            self._max_age = max_age
+            self.refreshes += 1
+            self._refreshed.notify_all()
+        self._ready.set()
+        return True
+
+    def start(self, warmup_timeout_s: float = 0.0) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="id-token-certs", daemon=True
+            )
+            self._thread.start()
+        if warmup_timeout_s > 0:
+            self._ready.wait(warmup_timeout_s)
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        retry_s = _RETRY_MIN_S
+        while not self._stop.is_set():
+            if self.refresh():
+                retry_s = _RETRY_MIN_S
+                # max-age の半分で取り直し、期限切れの鍵で検証しないようにする
+                delay = max(_MIN_REFRESH_S, self._max_age / 2)
+            else:
+                delay = retry_s
+                retry_s = min(retry_s * 2, _RETRY_MAX_S)
+            self._wake.wait(delay)
+            self._wake.clear()
+            # 知らない kid のトークンが続いても、取り直しは _RETRY_MIN_S に1回までに抑える
+            self._stop.wait(max(0.0, _RETRY_MIN_S - (time.monotonic() - self._attempted_at)))
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            age = time.monotonic() - self._fetched_at if self._data is not None else None
+            return {
+                "loaded": self._data is not None,
+                "keys": len(self._kids),
+                "ageS": age,
+                "maxAgeS": self._max_age,
+                "refreshes": self.refreshes,
+                "failures": self.failures,
+                "unavailable": self.unavailable,
+            }
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class VerifiedTokenCache:
+    # 検証済みトークンを exp まで保持する。キーはトークンそのものではなくハッシュ
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> dict[str, Any] | None:
+        if self._max_entries <= 0:
+            return None
+        key = _token_key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[1])
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, claims: Mapping[str, Any]) -> None:
+        expires_at = claims.get("exp")
+        if self._max_entries <= 0 or not isinstance(expires_at, (int, float)):
+            return
+        key = _token_key(token)
+        with self._lock:
+            self._entries[key] = (float(expires_at), dict(claims))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "maxEntries": self._max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def verify_with_keeper(
+    token: str, project_id: str, keeper: CertificateKeeper
+) -> dict[str, Any]:
+    # firebase_admin.auth.verify_id_token と同じ検証（署名・aud・exp・iss・sub）を、証明書の取得先だけ差し替えて行う
+    from google.auth import jwt
+    from google.oauth2 import id_token as google_id_token
+
+    if not project_id:
+        raise ValueError("Firebase project ID is required to verify ID tokens")
+    header = jwt.decode_header(token)
+    if header.get("alg") != "RS256":
+        raise ValueError(f'Firebase ID token has incorrect algorithm: {header.get("alg")}')
+    # 鍵の入れ替え直後は新しい kid を知らないので、取り直しを少し待つ。
+    # 間に合わなければ 401（サインアウト）ではなく 503 で再試行させる
+    if not keeper.knows(header.get("kid")) and not keeper.await_refresh(
+        AUTH_CERT_ROTATION_WAIT_S
+    ):
+        raise CertificateUnavailable("Signing certificates are being refreshed")
+
+    claims = dict(
+        google_id_token.verify_token(
+            token, request=keeper, audience=project_id, certs_url=keeper.url
+        )
+    )
+    if claims.get("iss") != ID_TOKEN_ISSUER_PREFIX + project_id:
+        raise ValueError(f'Firebase ID token has incorrect "iss" claim: {claims.get("iss")}')
+    subject = claims.get("sub")
+    if not isinstance(subject, str) or not subject or len(subject) > 128:
+        raise ValueError('Firebase ID token has an invalid "sub" claim')
+    claims["uid"] = subject
+    return claims
+
+
+_keeper = CertificateKeeper()
+_token_cache = VerifiedTokenCache(AUTH_TOKEN_CACHE_SIZE)
+
+
+def get_certificate_keeper() -> CertificateKeeper:
+    return _keeper
+
+
+def get_token_cache() -> VerifiedTokenCache:
+    return _token_cache
+
+
+def start_certificate_keeper() -> None:
+    _keeper.start(AUTH_CERT_WARMUP_TIMEOUT_S)
+
+
+def stop_certificate_keeper() -> None:
+    _keeper.stop(timeout=1)
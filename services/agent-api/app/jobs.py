@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+import logging
+import queue
+import threading
+from typing import Any, Callable
+
+from .config import ANALYSIS_JOB_QUEUE_SIZE
+
+
+class JobQueueFull(RuntimeError):
+    pass
+
+
+@dataclass
+class AnalysisJob:
+    job_id: str
+    uid: str
+    payload: dict[str, Any] = field(default_factory=dict)
+
+
+class JobQueue(ABC):
+    # 別バックエンド（Cloud Tasks / Pub/Sub など）に差し替えるときはこの2メソッドを実装する
+    @abstractmethod
+    def put(self, job: AnalysisJob) -> None: ...
+
+    @abstractmethod
+    def get(self, timeout: float | None = None) -> AnalysisJob | None: ...
+
+
+class InMemoryJobQueue(JobQueue):
+    def __init__(self, maxsize: int = 0):
+        self._queue: queue.Queue[AnalysisJob] = queue.Queue(maxsize=maxsize)
+
+    def put(self, job: AnalysisJob) -> None:
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full as exc:
+            raise JobQueueFull("Job queue is full") from exc
+
+    def get(self, timeout: float | None = None) -> AnalysisJob | None:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+
+class JobWorker:
+    def __init__(
+        self,
+        job_queue: JobQueue,
+        handler: Callable[[AnalysisJob], None],
+        threads: int = 1,
+        poll_interval: float = 0.5,
+    ):
+        self._queue = job_queue
+        self._handler = handler
+        self._threads_count = max(1, threads)
+        self._poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for index in range(self._threads_count):
+            thread = threading.Thread(
+                target=self._run, name=f"analysis-job-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            job = self._queue.get(timeout=self._poll_interval)
+            if job is None:
+                continue
+            try:
+                self._handler(job)
+            except Exception:  # noqa: BLE001
+                logging.exception("Analysis job %s failed", job.job_id)
+
+
+_job_queue: JobQueue | None = None
+
+
+def get_job_queue() -> JobQueue:
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = InMemoryJobQueue(ANALYSIS_JOB_QUEUE_SIZE)
+    return _job_queue
+
+
+def set_job_queue(job_queue: JobQueue) -> None:
+    global _job_queue
+    _job_queue = job_queue
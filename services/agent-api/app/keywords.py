@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass, field
+import json
+from pathlib import Path
+import threading
+import unicodedata
+from typing import Generic, Iterable, TypeVar
+
+from .config import FOOD_CATALOG_PATH, RISK_KEYWORDS_PATH
+
+# 食材カタログとリスク語彙を1つのオートマトン（Aho-Corasick）にまとめ、メッセージを1回なめるだけで
+# 両方のヒットを取り出す。語彙が増えても1メッセージあたりの処理はメッセージ長にしか依存しない
+
+T = TypeVar("T")
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+# ひらがなはカタカナに寄せる（「たまご」と「タマゴ」を同じ語として扱う）
+_HIRAGANA_TO_KATAKANA = {code: code + 0x60 for code in range(0x3041, 0x3097)}
+
+
+def normalize_text(text: str) -> str:
+    # NFKC で全角英数・半角カナを揃え、英字は大文字小文字を区別しない
+    return unicodedata.normalize("NFKC", text).casefold().translate(_HIRAGANA_TO_KATAKANA)
+
+
+def _is_ascii_word(char: str) -> bool:
+    return char.isascii() and char.isalnum()
+
+
+def _at_word_boundary(text: str, start: int, end: int) -> bool:
+    # 英字の語は単語の途中に当たったものを捨てる（"eggplant" の "egg" など）。かなや漢字は区切らない
+    if start > 0 and _is_ascii_word(text[start]) and _is_ascii_word(text[start - 1]):
+        return False
+    if end < len(text) and _is_ascii_word(text[end - 1]) and _is_ascii_word(text[end]):
+        return False
+    return True
+
+
+class KeywordMatcher(Generic[T]):
+    def __init__(self, patterns: Iterable[tuple[str, T]]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # 各状態で終わるパターン（失敗リンク先の分も含む）: (パターン長, 値)
+        self._outputs: list[list[tuple[int, T]]] = [[]]
+        self.pattern_count = 0
+        for pattern, value in patterns:
+            self._add(normalize_text(pattern), value)
+        self._link()
+
+    def _add(self, pattern: str, value: T) -> None:
+        if not pattern:
+            return
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = next_state
+        self._outputs[state].append((len(pattern), value))
+        self.pattern_count += 1
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._outputs[next_state] = (
+                    self._outputs[next_state] + self._outputs[self._fail[next_state]]
+                )
+
+    def find_all(self, text: str) -> list[tuple[int, int, T]]:
+        # (開始位置, 終了位置, 値)。位置は正規化後の文字列上のもの
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        hits: list[tuple[int, int, T]] = []
+        state = 0
+        normalized = normalize_text(text)
+        for index, char in enumerate(normalized):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, value in outputs[state]:
+                start = index + 1 - length
+                if _at_word_boundary(normalized, start, index + 1):
+                    hits.append((start, index + 1, value))
+        return hits
+
+
+def _drop_contained(hits: list[tuple[int, int, T]]) -> list[tuple[int, int, T]]:
+    # 長い語に含まれる短い語は数えない（「鶏むね」の中の「鶏」など）
+    kept: list[tuple[int, int, T]] = []
+    covered_to = -1
+    for start, end, value in sorted(hits, key=lambda hit: (hit[0], -hit[1])):
+        if end <= covered_to:
+            continue
+        kept.append((start, end, value))
+        covered_to = end
+    return kept
+
+
+@dataclass(frozen=True)
+class FoodEntry:
+    name: str
+    why: str
+    aliases: tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class _Risk:
+    keyword: str
+
+
+@dataclass
+class MessageHits:
+    foods: list[FoodEntry] = field(default_factory=list)
+    risks: list[str] = field(default_factory=list)
+
+
+class KeywordEngine:
+    def __init__(self, foods: list[FoodEntry], risk_keywords: list[str]):
+        self.foods = foods
+        self.risk_keywords = risk_keywords
+        patterns: list[tuple[str, FoodEntry | _Risk]] = []
+        for food in foods:
+            patterns.extend((term, food) for term in (food.name, *food.aliases))
+        patterns.extend((keyword, _Risk(keyword)) for keyword in risk_keywords)
+        self._matcher: KeywordMatcher[FoodEntry | _Risk] = KeywordMatcher(patterns)
+
+    @property
+    def pattern_count(self) -> int:
+        return self._matcher.pattern_count
+
+    def scan(self, message: str) -> MessageHits:
+        # 同じ語は最初に出てきた順に1回だけ返す
+        food_hits: list[tuple[int, int, FoodEntry]] = []
+        risk_hits: list[tuple[int, int, _Risk]] = []
+        for hit in self._matcher.find_all(message):
+            (risk_hits if isinstance(hit[2], _Risk) else food_hits).append(hit)
+
+        # リスク語は食材名に含まれていても見逃さないよう、食材とは別に重なりを判定する
+        hits = MessageHits()
+        for _, _, food in _drop_contained(food_hits):
+            if food not in hits.foods:
+                hits.foods.append(food)
+        for _, _, risk in _drop_contained(risk_hits):
+            if risk.keyword not in hits.risks:
+                hits.risks.append(risk.keyword)
+        return hits
+
+
+def load_food_catalog(path: str | Path) -> list[FoodEntry]:
+    # JSON 配列: [{"name": "卵", "why": "...", "aliases": ["たまご", "玉子"]}]
+    with open(path, encoding="utf-8") as handle:
+        data = json.load(handle)
+    return [
+        FoodEntry(
+            name=item["name"],
+            why=item.get("why", ""),
+            aliases=tuple(item.get("aliases", [])),
+        )
+        for item in data
+    ]
+
+
+def load_risk_keywords(path: str | Path) -> list[str]:
+    # 1行1語。空行と # で始まる行は無視する
+    with open(path, encoding="utf-8") as handle:
+        lines = (line.strip() for line in handle)
+        return [line for line in lines if line and not line.startswith("#")]
+
+
+_engine: KeywordEngine | None = None
+_engine_lock = threading.Lock()
+
+
+def get_keyword_engine() -> KeywordEngine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = KeywordEngine(
+                    load_food_catalog(FOOD_CATALOG_PATH or DATA_DIR / "foods.json"),
+                    load_risk_keywords(RISK_KEYWORDS_PATH or DATA_DIR / "risk_keywords.txt"),
+                )
+    return _engine
+
+
+def set_keyword_engine(engine: KeywordEngine | None) -> None:
+    global _engine
+    _engine = engine
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+import math
+import time
+from typing import AsyncIterator, Awaitable, Callable
+
+from ..config import (
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_PERCENTILE,
+    LLM_MAX_CONCURRENCY,
+    LLM_TIMEOUT_S,
+)
+from .vertex_gemini import agenerate_text, astream_text
+
+_LATENCY_WINDOW = 200
+
+
+class AsyncLLMClient:
+    def __init__(
+        self,
+        generate: Callable[[str], Awaitable[str]],
+        max_concurrency: int,
+        timeout_s: float,
+        hedge_percentile: float = 0.0,
+        hedge_min_samples: int = 20,
+        stream: Callable[[str], AsyncIterator[str]] | None = None,
+    ):
+        self._generate = generate
+        self._stream = stream
+        self._max_concurrency = max(1, max_concurrency)
+        self._timeout_s = timeout_s
+        self._hedge_percentile = hedge_percentile
+        self._hedge_min_samples = hedge_min_samples
+        self._latencies: deque[float] = deque(maxlen=_LATENCY_WINDOW)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self.calls = 0
+        self.timeouts = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    async def generate(self, prompt: str) -> str:
+        # 期限はセマフォ待ちも含めた呼び出し全体にかける
+        self.calls += 1
+        try:
+            async with asyncio.timeout(self._timeout_s if self._timeout_s > 0 else None):
+                return await self._generate_hedged(prompt)
+        except TimeoutError:
+            self.timeouts += 1
+            raise
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        # ストリームはヘッジせず、同時実行枠と全体の期限だけを適用する
+        if self._stream is None:
+            raise RuntimeError("Streaming is not supported by this client")
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._timeout_s if self._timeout_s > 0 else None
+
+        def remaining() -> float | None:
+            return None if deadline is None else max(0.0, deadline - loop.time())
+
+        semaphore = self._get_semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), remaining())
+        except TimeoutError:
+            self.timeouts += 1
+            raise
+        chunks = self._stream(prompt)
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(anext(chunks), remaining())
+                except StopAsyncIteration:
+                    return
+                except TimeoutError:
+                    self.timeouts += 1
+                    raise
+                yield chunk
+        finally:
+            semaphore.release()
+            await chunks.aclose()
+
+    def hedge_delay(self) -> float | None:
+        if not 0 < self._hedge_percentile < 1:
+            return None
+        if len(self._latencies) < self._hedge_min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        position = min(len(ordered) - 1, math.ceil(self._hedge_percentile * len(ordered)) - 1)
+        return ordered[max(0, position)]
+
+    def stats(self) -> dict[str, float | int | None]:
+        return {
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "hedged": self.hedged,
+            "hedgeWins": self.hedge_wins,
+            "hedgeDelaySeconds": self.hedge_delay(),
+            "maxConcurrency": self._max_concurrency,
+        }
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        return self._semaphore
+
+    async def _attempt(self, prompt: str) -> str:
+        async with self._get_semaphore():
+            started = time.perf_counter()
+            text = await self._generate(prompt)
+        self._latencies.append(time.perf_counter() - started)
+        return text
+
+    async def _generate_hedged(self, prompt: str) -> str:
+        primary = asyncio.ensure_future(self._attempt(prompt))
+        hedge: asyncio.Future | None = None
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                # 空きが無いときに予備リクエストを出すと混雑を悪化させるので見送る
+                if not done and not self._get_semaphore().locked():
+                    self.hedged += 1
+                    hedge = asyncio.ensure_future(self._attempt(prompt))
+            if hedge is None:
+                return await primary
+
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+            # 両方失敗したら元のリクエストの例外を返す
+            return primary.result()
+        finally:
+            # 期限切れや先着で不要になった呼び出しは取り消す
+            primary.cancel()
+            if hedge is not None:
+                hedge.cancel()
+
+
+_async_llm_client: AsyncLLMClient | None = None
+
+
+def get_async_llm_client() -> AsyncLLMClient:
+    global _async_llm_client
+    if _async_llm_client is None:
+        _async_llm_client = AsyncLLMClient(
+            agenerate_text,
+            LLM_MAX_CONCURRENCY,
+            LLM_TIMEOUT_S,
+            hedge_percentile=LLM_HEDGE_PERCENTILE,
+            hedge_min_samples=LLM_HEDGE_MIN_SAMPLES,
+            stream=astream_text,
+        )
+    return _async_llm_client
+
+
+async def agenerate_text_limited(prompt: str) -> str:
+    return await get_async_llm_client().generate(prompt)
+
+
+def astream_text_limited(prompt: str) -> AsyncIterator[str]:
+    return get_async_llm_client().stream(prompt)
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+from typing import Any, Awaitable, Callable
+
+from ..config import LLM_CACHE_SIZE, LLM_CACHE_TTL_S
+from .async_client import agenerate_text_limited
+from .vertex_gemini import model_label
+
+
+def _cache_key(model: str, prompt: str) -> str:
+    digest = hashlib.sha256(model.encode())
+    digest.update(b"\0")
+    digest.update(prompt.encode())
+    return digest.hexdigest()
+
+
+class LLMResponseCache:
+    def __init__(self, max_entries: int, ttl_s: float):
+        self._max_entries = max_entries
+        self._ttl_s = ttl_s
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.rejected = 0
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            text = self._lookup(key)
+            if text is None:
+                self.misses += 1
+            return text
+
+    def put(
+        self, key: str, text: str, validate: Callable[[str], Any] | None = None
+    ) -> None:
+        if self._acceptable(text, validate):
+            self._remember(key, text)
+
+    async def aget_or_generate(
+        self,
+        key: str,
+        generate: Callable[[], Awaitable[str]],
+        validate: Callable[[str], Any] | None = None,
+    ) -> str:
+        while True:
+            with self._lock:
+                text = self._lookup(key)
+                if text is not None:
+                    return text
+                inflight = self._inflight.get(key)
+                leader = inflight is None
+                if leader:
+                    inflight = asyncio.get_running_loop().create_future()
+                    self._inflight[key] = inflight
+                    self.misses += 1
+                else:
+                    self.shared += 1
+
+            if leader:
+                return await self._alead(key, inflight, generate, validate)
+            # 待っている側が取り消されても、実行中の呼び出しは止めない
+            text = await asyncio.shield(inflight)
+            if text is not None:
+                return text
+            # 実行していた側が取り消された場合は、キャッシュを見直すところからやり直す
+
+    async def _alead(
+        self,
+        key: str,
+        inflight: asyncio.Future,
+        generate: Callable[[], Awaitable[str]],
+        validate: Callable[[str], Any] | None,
+    ) -> str:
+        try:
+            text = await generate()
+            if self._acceptable(text, validate):
+                self._remember(key, text)
+            inflight.set_result(text)
+            return text
+        except asyncio.CancelledError:
+            # 待っている側には取り消しを伝えず、None で再試行させる
+            inflight.set_result(None)
+            raise
+        except BaseException as exc:
+            inflight.set_exception(exc)
+            # 共有していない場合に "exception was never retrieved" を出さない
+            inflight.exception()
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _lookup(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, text = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return text
+
+    def _acceptable(self, text: str, validate: Callable[[str], Any] | None) -> bool:
+        if validate is None:
+            return True
+        try:
+            validate(text)
+        except Exception:  # noqa: BLE001
+            with self._lock:
+                self.rejected += 1
+            return False
+        return True
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared": self.shared,
+                "rejected": self.rejected,
+                "entries": len(self._entries),
+                "capacity": self._max_entries,
+            }
+
+    def _remember(self, key: str, text: str) -> None:
+        if self._max_entries <= 0 or self._ttl_s <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self._ttl_s, text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+
+_llm_cache: LLMResponseCache | None = None
+
+
+def get_llm_cache() -> LLMResponseCache:
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LLMResponseCache(LLM_CACHE_SIZE, LLM_CACHE_TTL_S)
+    return _llm_cache
+
+
+async def cached_agenerate_text(
+    prompt: str, validate: Callable[[str], Any] | None = None
+) -> str:
+    return await get_llm_cache().aget_or_generate(
+        _cache_key(model_label(), prompt),
+        lambda: agenerate_text_limited(prompt),
+        validate,
+    )
+
+
+def lookup_cached_text(prompt: str) -> str | None:
+    return get_llm_cache().get(_cache_key(model_label(), prompt))
+
+
+def remember_text(
+    prompt: str, text: str, validate: Callable[[str], Any] | None = None
+) -> None:
+    get_llm_cache().put(_cache_key(model_label(), prompt), text, validate)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Iterable
+
+_WHITESPACE = " \t\r\n"
+
+
+class JsonStreamScanner:
+    # ストリーミング中のJSONから、配列要素と値を確定したものから順に取り出す。
+    # 対象はトップレベル付近の "key": [...] と "key": "..."（文字列・オブジェクト）
+    def __init__(self, array_fields: Iterable[str], value_fields: Iterable[str]):
+        self._array_fields = set(array_fields)
+        self._value_fields = set(value_fields)
+        fields = sorted(self._array_fields | self._value_fields)
+        self._key_pattern = re.compile(
+            r'"(' + "|".join(re.escape(field) for field in fields) + r')"\s*:\s*'
+        )
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._field: str | None = None
+        self._state = "seek"
+
+    def feed(self, chunk: str) -> list[tuple[str, Any]]:
+        self._buffer += chunk
+        found: list[tuple[str, Any]] = []
+        while self._step(found):
+            pass
+        return found
+
+    def _skip(self, chars: str) -> bool:
+        while self._pos < len(self._buffer) and self._buffer[self._pos] in chars:
+            self._pos += 1
+        return self._pos < len(self._buffer)
+
+    def _decode(self) -> tuple[Any, bool]:
+        # 末尾が欠けている間は JSONDecodeError になるので次のチャンクを待つ
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            return None, False
+        self._pos = end
+        return value, True
+
+    def _step(self, found: list[tuple[str, Any]]) -> bool:
+        if self._state == "seek":
+            match = self._key_pattern.search(self._buffer, self._pos)
+            if match is None or match.end() == len(self._buffer):
+                return False
+            self._field = match.group(1)
+            self._pos = match.end()
+            self._state = "array" if self._field in self._array_fields else "value"
+            return True
+
+        if not self._skip(_WHITESPACE):
+            return False
+        assert self._field is not None
+
+        if self._state == "value":
+            value, ok = self._decode()
+            if ok:
+                found.append((self._field, value))
+                self._state = "seek"
+            return ok
+
+        if self._state == "array":
+            if self._buffer[self._pos] != "[":
+                self._state = "seek"
+                return True
+            self._pos += 1
+            self._state = "items"
+            return True
+
+        # items: 要素を1つずつ確定させ、"]" で配列を抜ける
+        if not self._skip(_WHITESPACE + ","):
+            return False
+        if self._buffer[self._pos] == "]":
+            self._pos += 1
+            self._state = "seek"
+            return True
+        value, ok = self._decode()
+        if ok:
+            found.append((self._field, value))
+        return ok
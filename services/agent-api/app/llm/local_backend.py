@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from typing import AsyncIterator, Callable
+
+from ..config import (
+    LLM_LOCAL_ERROR_RATE,
+    LLM_LOCAL_LATENCY,
+    LLM_LOCAL_MALFORMED_RATE,
+    LLM_LOCAL_SEED,
+)
+
+# Vertex AI を呼ばずに負荷試験するための代替バックエンド。
+# 応答内容はプロンプトから決まり、遅延・エラー・壊れた出力は seed 付き乱数で再現できる
+
+_STREAM_CHUNK_CHARS = 24
+
+_ENCOURAGER_TEXTS = [
+    "不安になるのは、きちんと向き合っている証拠です。ここまで続けられた自分を認めましょう。",
+    "気になる変化に気づけたのは大事な一歩です。一人で抱え込まずに整理していきましょう。",
+    "今日ここで相談できたこと自体が前進です。焦らず一つずつ進めましょう。",
+]
+_COACH_TEXTS = [
+    "今日の一手は、同じ場所・同じ光で写真を1枚撮ること。それだけで十分です。",
+    "今夜は寝る時間を30分早めよう。小さな一手を確実にやり切るのが近道です。",
+    "朝食にタンパク質を1品足してみよう。続けやすいものから始めるのがコツです。",
+]
+_DOCTOR_TEXTS = [
+    "一般論として、抜け毛の量は季節や睡眠・ストレスで変動します。診断はできませんが、急な変化があれば受診も検討してください。",
+    "一般論として、栄養と睡眠は髪の状態に影響します。診断はできないため、気になる症状が続く場合は専門医に相談してください。",
+    "一般論として、短期間の変化は撮影条件のブレのこともあります。診断はできませんが、経過を同条件で見ていきましょう。",
+]
+_HIGHLIGHTS = [
+    "測定を継続できており、推移を比較できる状態です。",
+    "密度指数は大きな変動なく推移しています。",
+    "撮影条件が揃うほど比較の精度が上がります。",
+]
+_NEXT_ACTIONS = [
+    "次回も同じ時間帯・同じ照明で撮影する。",
+    "睡眠時間を確保し、就寝前のスマホを控える。",
+    "タンパク質と亜鉛を意識した食事を1品足す。",
+]
+
+
+def _constant(value_ms: float) -> Callable[[random.Random], float]:
+    return lambda _: value_ms
+
+
+def parse_latency_spec(spec: str) -> Callable[[random.Random], float]:
+    # 例: "fixed:300" / "uniform:100,900" / "normal:500,120" / "lognormal:600,0.5"（中央値ms, σ）
+    kind, _, raw = spec.strip().partition(":")
+    try:
+        params = [float(value) for value in raw.split(",") if value.strip()]
+    except ValueError as exc:
+        raise ValueError(f"Invalid latency spec: {spec}") from exc
+    kind = kind.lower()
+    if kind == "fixed" and len(params) == 1:
+        return _constant(params[0])
+    if kind == "uniform" and len(params) == 2:
+        low, high = params
+        return lambda rng: rng.uniform(low, high)
+    if kind == "normal" and len(params) == 2:
+        mean, stddev = params
+        return lambda rng: max(0.0, rng.gauss(mean, stddev))
+    if kind == "lognormal" and len(params) == 2:
+        median, sigma = params
+        return lambda rng: rng.lognormvariate(math.log(max(median, 1e-3)), sigma)
+    raise ValueError(f"Invalid latency spec: {spec}")
+
+
+def _pick(options: list[str], digest: bytes, offset: int) -> str:
+    return options[digest[offset] % len(options)]
+
+
+def _pick_two(options: list[str], digest: bytes, offset: int) -> list[str]:
+    first = digest[offset] % len(options)
+    second = (first + 1 + digest[offset + 1] % (len(options) - 1)) % len(options)
+    return [options[first], options[second]]
+
+
+def _response_for(prompt: str) -> str:
+    digest = hashlib.sha256(prompt.encode()).digest()
+    if '"cards"' in prompt:
+        data = {
+            "cards": [
+                {"agent": "encourager", "text": _pick(_ENCOURAGER_TEXTS, digest, 0)},
+                {"agent": "coach", "text": _pick(_COACH_TEXTS, digest, 1)},
+                {"agent": "doctor", "text": _pick(_DOCTOR_TEXTS, digest, 2)},
+            ],
+            "summary": "今日の最小の一手: " + _pick(_COACH_TEXTS, digest, 1),
+        }
+    elif '"highlights"' in prompt:
+        highlights = _pick_two(_HIGHLIGHTS, digest, 3)
+        next_actions = _pick_two(_NEXT_ACTIONS, digest, 5)
+        data = {
+            "highlights": highlights,
+            "nextActions": next_actions,
+            "rawText": "\n".join(highlights + ["---"] + next_actions),
+        }
+    else:
+        return "ローカル代替バックエンドの応答です。"
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+
+def _malform(text: str, rng: random.Random) -> str:
+    # _safe_json_load で救えるもの（前後の文章）と救えないもの（途中切れ・JSONなし・別スキーマ）を混ぜる
+    variant = rng.randrange(4)
+    if variant == 0:
+        return text[: max(1, len(text) // 2)]
+    if variant == 1:
+        return f"以下が回答です。\n```json\n{text}\n```\n以上です。"
+    if variant == 2:
+        return "申し訳ありません、うまく回答を作成できませんでした。"
+    return json.dumps({"result": "ok"})
+
+
+class LocalLLMBackend:
+    label = "local:stand-in"
+
+    def __init__(
+        self,
+        latency_ms: Callable[[random.Random], float] = _constant(0.0),
+        error_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self._latency_ms = latency_ms
+        self._error_rate = error_rate
+        self._malformed_rate = malformed_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.malformed = 0
+
+    @classmethod
+    def from_env(cls) -> "LocalLLMBackend":
+        return cls(
+            parse_latency_spec(LLM_LOCAL_LATENCY),
+            error_rate=LLM_LOCAL_ERROR_RATE,
+            malformed_rate=LLM_LOCAL_MALFORMED_RATE,
+            seed=LLM_LOCAL_SEED,
+        )
+
+    def _plan(self, prompt: str) -> tuple[float, str | None]:
+        # 呼び出し順が同じなら遅延・エラー・出力の組み合わせも同じになる
+        with self._lock:
+            self.calls += 1
+            delay = self._latency_ms(self._rng) / 1000
+            if self._rng.random() < self._error_rate:
+                self.errors += 1
+                return delay, None
+            text = _response_for(prompt)
+            if self._rng.random() < self._malformed_rate:
+                self.malformed += 1
+                text = _malform(text, self._rng)
+            return delay, text
+
+    def generate_text(self, prompt: str) -> str:
+        delay, text = self._plan(prompt)
+        time.sleep(delay)
+        if text is None:
+            raise RuntimeError("Injected LLM error")
+        return text
+
+    async def agenerate_text(self, prompt: str) -> str:
+        delay, text = self._plan(prompt)
+        await asyncio.sleep(delay)
+        if text is None:
+            raise RuntimeError("Injected LLM error")
+        return text
+
+    async def astream_text(self, prompt: str) -> AsyncIterator[str]:
+        delay, text = self._plan(prompt)
+        if text is None:
+            # 途中まで流してから失敗させ、部分応答の扱いも試せるようにする
+            await asyncio.sleep(delay / 2)
+            yield _response_for(prompt)[:_STREAM_CHUNK_CHARS]
+            raise RuntimeError("Injected LLM error")
+        chunks = [
+            text[start : start + _STREAM_CHUNK_CHARS]
+            for start in range(0, len(text), _STREAM_CHUNK_CHARS)
+        ]
+        for chunk in chunks:
+            await asyncio.sleep(delay / len(chunks))
+            yield chunk
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "malformed": self.malformed,
+            }
@@ -1,10 +1,12 @@
 import os
 import re
 import json
-from typing import Any
+from typing import TYPE_CHECKING, Any, AsyncIterator
 
-from google import genai
-from google.genai.types import HttpOptions
+if TYPE_CHECKING:
+    from google import genai
+
+from ..config import LLM_BACKEND
 
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 GEMINI_ENABLED = os.getenv("GEMINI_ENABLED", "true").lower() == "true"
@@ -12,12 +14,17 @@ GOOGLE_CLOUD_PROJECT = os.getenv("GOOGLE_CLOUD_PROJECT", "")
 GOOGLE_CLOUD_LOCATION = os.getenv("GOOGLE_CLOUD_LOCATION", "global")
 USE_VERTEXAI = os.getenv("GOOGLE_GENAI_USE_VERTEXAI", "false").lower() == "true"
 
-_client: genai.Client | None = None
+_client: "genai.Client | None" = None
+_backend = None
 
 
-def _get_client() -> genai.Client:
+def _get_client() -> "genai.Client":
     global _client
     if _client is None:
+        # google.genai は import に時間がかかるので、最初の呼び出しまで読み込まない
+        from google import genai
+        from google.genai.types import HttpOptions
+
         if USE_VERTEXAI:
             _client = genai.Client(
                 vertexai=True,
@@ -30,16 +37,74 @@ def _get_client() -> genai.Client:
     return _client
 
 
+def warm_client() -> None:
+    if gemini_enabled() and get_llm_backend() is None:
+        _get_client()
+
+
+def get_llm_backend():
+    # LLM_BACKEND=local ならプロンプトに応じた JSON を返すローカル代替を使う
+    global _backend
+    if _backend is None and LLM_BACKEND == "local":
+        from .local_backend import LocalLLMBackend
+
+        _backend = LocalLLMBackend.from_env()
+    return _backend
+
+
+def set_llm_backend(backend) -> None:
+    global _backend
+    _backend = backend
+
+
 def gemini_enabled() -> bool:
+    if get_llm_backend() is not None:
+        return True
     return GEMINI_ENABLED and bool(GEMINI_MODEL)
 
 
+def model_label() -> str:
+    backend = get_llm_backend()
+    if backend is not None:
+        return backend.label
+    return f"gemini:{GEMINI_MODEL}"
+
+
 def generate_text(prompt: str) -> str:
+    backend = get_llm_backend()
+    if backend is not None:
+        return backend.generate_text(prompt)
     client = _get_client()
     response = client.models.generate_content(model=GEMINI_MODEL, contents=prompt)
     return response.text or ""
 
 
+async def agenerate_text(prompt: str) -> str:
+    backend = get_llm_backend()
+    if backend is not None:
+        return await backend.agenerate_text(prompt)
+    client = _get_client()
+    response = await client.aio.models.generate_content(
+        model=GEMINI_MODEL, contents=prompt
+    )
+    return response.text or ""
+
+
+async def astream_text(prompt: str) -> AsyncIterator[str]:
+    backend = get_llm_backend()
+    if backend is not None:
+        async for chunk in backend.astream_text(prompt):
+            yield chunk
+        return
+    client = _get_client()
+    stream = await client.aio.models.generate_content_stream(
+        model=GEMINI_MODEL, contents=prompt
+    )
+    async for chunk in stream:
+        if chunk.text:
+            yield chunk.text
+
+
 def extract_json(text: str) -> dict[str, Any]:
     match = re.search(r"\{[\s\S]*\}", text)
     if not match:
@@ -1,24 +1,128 @@
+from contextlib import asynccontextmanager
 from typing import List, Optional
-import math
 import uuid
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 import json
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import os
 
-from fastapi import Depends, FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from firebase_admin import firestore as admin_firestore
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 
-from .analysis.hair_density import compute_density_index
+from .analysis.cache import (
+    cached_compute_density_batch,
+    cached_compute_density_multi,
+    get_analysis_cache,
+)
+from .analysis.hair_density import (
+    ANALYSIS_METHODS,
+    ROI_PRESETS,
+    DensityResult,
+    RoiRect,
+    RoiSpec,
+    compute_frame_quality,
+    open_frame,
+)
+from .analysis.workers import (
+    AnalysisQueueFull,
+    AnalysisWorkerCrashed,
+    pooled_compute_density_batch,
+    pooled_compute_density_multi,
+    start_analysis_pool,
+    stop_analysis_pool,
+)
+from .analysis_rollups import (
+    apply_to_rollup,
+    day_key,
+    fetch_rollups,
+    load_rollup,
+    period_start,
+    recorded_day,
+    remove_from_rollup,
+    rollup_record,
+    rollups_ref,
+)
+from .analysis_summary import (
+    apply_analysis,
+    apply_roi_analysis,
+    load_summary,
+    reference_densities,
+    roi_reference_densities,
+    summary_record,
+    summary_ref,
+)
 from .auth import get_current_uid
+from .config import (
+    ANALYSIS_JOB_RETRIES,
+    ANALYSIS_JOB_RETRY_DELAY_S,
+    ANALYSIS_JOB_WORKERS,
+    ANALYSIS_MAX_ROIS,
+    ANALYSIS_MAX_SIDE,
+    ANALYSIS_METHOD,
+    ANALYSIS_RETRY_AFTER_S,
+    ANALYZE_BATCH_MAX,
+    QUALITY_CHECK_MAX_BYTES,
+    QUALITY_CHECK_MAX_PIXELS,
+    QUALITY_CHECK_MAX_SIDE,
+    REPORT_MAX_PERIOD_DAYS,
+    STORE_MAX_RADIUS_M,
+    STORE_MAX_RESULTS,
+    TIMING_ENABLED,
+    WARMUP_ENABLED,
+)
 from .firebase import get_firestore_client
-from .storage import download_image_bytes
-from .llm.vertex_gemini import gemini_enabled, generate_text, GEMINI_MODEL
+from .id_tokens import (
+    get_certificate_keeper,
+    get_token_cache,
+    start_certificate_keeper,
+    stop_certificate_keeper,
+)
+from .jobs import AnalysisJob, JobQueueFull, JobWorker, get_job_queue
+from .keywords import get_keyword_engine
+from .storage import ImageTooLarge, download_image_bytes
+from .stores import StoreCatalog, get_store_catalog
+from .timing import TimingMiddleware, get_timing_registry, stage
+from .warmup import start_warmup
+from .llm.async_client import astream_text_limited, get_async_llm_client
+from .llm.cache import (
+    cached_agenerate_text,
+    get_llm_cache,
+    lookup_cached_text,
+    remember_text,
+)
+from .llm.json_stream import JsonStreamScanner
+from .llm.vertex_gemini import (
+    gemini_enabled,
+    get_llm_backend,
+    model_label as llm_model_label,
+)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # 最初のリクエストが証明書の取得を待たないよう、起動時に公開鍵を読み込んでおく
+    await run_in_threadpool(start_certificate_keeper)
+    get_keyword_engine()
+    if WARMUP_ENABLED:
+        start_warmup()
+    start_analysis_pool()
+    job_worker = JobWorker(get_job_queue(), _process_analysis_job, ANALYSIS_JOB_WORKERS)
+    job_worker.start()
+    try:
+        yield
+    finally:
+        job_worker.stop(timeout=5)
+        stop_analysis_pool()
+        stop_certificate_keeper()
 
-app = FastAPI(title="HairGuard Agent API")
+
+app = FastAPI(title="HairGuard Agent API", lifespan=lifespan)
 
 allowed_origins = [
     origin.strip()
@@ -31,7 +135,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+if TIMING_ENABLED:
+    app.add_middleware(TimingMiddleware)
+
+
+class NormalizedRect(BaseModel):
+    x: float
+    y: float
+    w: float
+    h: float
+
+
+class AnalysisRoi(BaseModel):
+    id: Optional[str] = None
+    preset: Optional[str] = None
+    rect: Optional[NormalizedRect] = None
 
 
 class AnalyzePhotoRequest(BaseModel):
@@ -39,6 +159,9 @@ class AnalyzePhotoRequest(BaseModel):
     storagePath: str
     capturedAt: Optional[str] = None
     roiPreset: Optional[str] = None
+    rois: Optional[List[AnalysisRoi]] = None
+    analysisMaxSide: Optional[int] = None
+    analysisMethod: Optional[str] = None
 
 
 class QualityInfo(BaseModel):
@@ -46,12 +169,55 @@ class QualityInfo(BaseModel):
     warnings: List[str]
 
 
+class RoiAnalysis(BaseModel):
+    id: str
+    densityIndex: float
+    deltaVsPrev: float
+    deltaVsBase: float
+    quality: QualityInfo
+    roi: dict[str, float]
+
+
 class AnalyzePhotoResponse(BaseModel):
     densityIndex: float
     deltaVsPrev: float
     deltaVsBase: float
     quality: QualityInfo
     analysisId: str
+    rois: List[RoiAnalysis] = []
+
+
+class AnalyzeJobResponse(BaseModel):
+    jobId: str
+    photoId: str
+    status: str
+
+
+class AnalyzeJobStatusResponse(BaseModel):
+    photoId: str
+    jobId: Optional[str] = None
+    status: str
+    analysisId: Optional[str] = None
+    error: Optional[str] = None
+
+
+class AnalyzeBatchRequest(BaseModel):
+    photos: List[AnalyzePhotoRequest]
+
+
+class AnalyzeBatchItem(BaseModel):
+    photoId: str
+    result: Optional[AnalyzePhotoResponse] = None
+    error: Optional[str] = None
+
+
+class AnalyzeBatchResponse(BaseModel):
+    items: List[AnalyzeBatchItem]
+
+
+class QualityCheckResponse(BaseModel):
+    ok: bool
+    quality: QualityInfo
 
 
 class Location(BaseModel):
@@ -117,81 +283,162 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/api/analysis/cache")
+def analysis_cache_stats():
+    return get_analysis_cache().stats()
+
+
+@app.get("/api/auth/cache")
+def auth_cache_stats():
+    return {**get_token_cache().stats(), "certificates": get_certificate_keeper().stats()}
+
+
+@app.get("/api/llm/cache")
+def llm_cache_stats():
+    stats = {**get_llm_cache().stats(), "client": get_async_llm_client().stats()}
+    backend = get_llm_backend()
+    if backend is not None:
+        stats["backend"] = {"label": backend.label, **backend.stats()}
+    return stats
+
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(
+        get_timing_registry().render(), media_type="text/plain; version=0.0.4"
+    )
+
+
 @app.post("/api/v1/photos/analyze", response_model=AnalyzePhotoResponse)
 def analyze_photo(
     payload: AnalyzePhotoRequest, uid: str = Depends(get_current_uid)
 ) -> AnalyzePhotoResponse:
-    try:
-        image_bytes = download_image_bytes(payload.storagePath)
-    except Exception as exc:  # noqa: BLE001
-        raise HTTPException(status_code=400, detail="Failed to load image") from exc
+    return _run_photo_analysis(payload, uid)
 
-    try:
-        result = compute_density_index(image_bytes, payload.roiPreset)
-    except Exception as exc:  # noqa: BLE001
-        raise HTTPException(status_code=400, detail="Failed to analyze image") from exc
 
+def _photo_ref(uid: str, photo_id: str):
     db = get_firestore_client()
-    analysis_collection = (
-        db.collection("analysisResults").document(uid).collection("items")
-    )
+    return db.collection("photos").document(uid).collection("items").document(photo_id)
 
-    prev_docs = (
-        analysis_collection.order_by(
-            "computedAt", direction=admin_firestore.Query.DESCENDING
-        )
-        .limit(1)
-        .get()
-    )
-    base_docs = (
-        analysis_collection.order_by(
-            "computedAt", direction=admin_firestore.Query.ASCENDING
+
+@app.post(
+    "/api/v1/photos/analyze-async",
+    response_model=AnalyzeJobResponse,
+    status_code=202,
+)
+def analyze_photo_async(
+    payload: AnalyzePhotoRequest, uid: str = Depends(get_current_uid)
+) -> AnalyzeJobResponse:
+    _analysis_method(payload)
+    _analysis_rois(payload)
+    job_id = f"job_{uuid.uuid4().hex}"
+    photo_ref = _photo_ref(uid, payload.photoId)
+    # ワーカーが running に進める前に queued を書いておく
+    with stage("firestore_write"):
+        photo_ref.set(
+            {"status": "queued", "analysisJobId": job_id, "analysisError": None},
+            merge=True,
         )
-        .limit(1)
-        .get()
-    )
 
-    prev_density = None
-    if prev_docs:
-        prev_density = prev_docs[0].to_dict().get("densityIndex")
+    try:
+        with stage("enqueue"):
+            get_job_queue().put(
+                AnalysisJob(job_id=job_id, uid=uid, payload=payload.model_dump())
+            )
+    except JobQueueFull as exc:
+        with stage("firestore_write"):
+            photo_ref.set({"status": "failed", "analysisError": "queue_full"}, merge=True)
+        raise _analysis_busy() from exc
 
-    base_density = None
-    if base_docs:
-        base_density = base_docs[0].to_dict().get("densityIndex")
+    return AnalyzeJobResponse(jobId=job_id, photoId=payload.photoId, status="queued")
 
-    delta_vs_prev = (
-        float(result.density_index - prev_density)
-        if prev_density is not None
-        else 0.0
-    )
-    delta_vs_base = (
-        float(result.density_index - base_density)
-        if base_density is not None
-        else 0.0
-    )
 
-    analysis_id = f"analysis_{payload.photoId}"
-
-    analysis_collection.document(analysis_id).set(
-        {
-            "photoId": payload.photoId,
-            "computedAt": admin_firestore.SERVER_TIMESTAMP,
-            "roi": result.roi,
-            "densityIndex": result.density_index,
-            "deltaVsPrev": delta_vs_prev,
-            "deltaVsBase": delta_vs_base,
-            "quality": {
-                "score": result.quality.score,
-                "warnings": result.quality.warnings,
-            },
-            "method": "pil_threshold_v1",
-        }
+@app.get(
+    "/api/v1/photos/{photo_id}/analysis-status",
+    response_model=AnalyzeJobStatusResponse,
+)
+def analyze_photo_status(
+    photo_id: str, uid: str = Depends(get_current_uid)
+) -> AnalyzeJobStatusResponse:
+    with stage("firestore_read"):
+        snapshot = _photo_ref(uid, photo_id).get()
+    if not snapshot.exists:
+        raise HTTPException(status_code=404, detail="Photo not found")
+
+    data = snapshot.to_dict() or {}
+    return AnalyzeJobStatusResponse(
+        photoId=photo_id,
+        jobId=data.get("analysisJobId"),
+        status=str(data.get("status") or "unknown"),
+        analysisId=data.get("analysisId"),
+        error=data.get("analysisError"),
     )
 
-    db.collection("photos").document(uid).collection("items").document(
-        payload.photoId
-    ).set({"status": "done"}, merge=True)
 
+def _process_analysis_job(job: AnalysisJob) -> None:
+    payload = AnalyzePhotoRequest(**job.payload)
+    photo_ref = _photo_ref(job.uid, payload.photoId)
+    photo_ref.set({"status": "running"}, merge=True)
+    for attempt in range(ANALYSIS_JOB_RETRIES + 1):
+        try:
+            _run_photo_analysis(payload, job.uid)
+            return
+        except HTTPException as exc:
+            # 解析ワーカーが埋まっているだけなら、間隔を広げながら同じジョブをやり直す
+            if isinstance(exc.__cause__, AnalysisQueueFull) and attempt < ANALYSIS_JOB_RETRIES:
+                time.sleep(ANALYSIS_JOB_RETRY_DELAY_S * 2**attempt)
+                continue
+            photo_ref.set({"status": "failed", "analysisError": str(exc.detail)}, merge=True)
+            return
+        except Exception:  # noqa: BLE001
+            photo_ref.set({"status": "failed", "analysisError": "internal_error"}, merge=True)
+            raise
+
+
+# 写真全体の (deltaVsPrev, deltaVsBase) と ROI ごとの同じ組
+_AnalysisDeltas = tuple[tuple[float, float], List[tuple[float, float]]]
+
+
+def _run_photo_analysis(payload: AnalyzePhotoRequest, uid: str) -> AnalyzePhotoResponse:
+    method = _analysis_method(payload)
+    rois = _analysis_rois(payload)
+
+    try:
+        with stage("download"):
+            image_bytes = download_image_bytes(payload.storagePath)
+    except ImageTooLarge as exc:
+        raise HTTPException(status_code=413, detail="Image is too large") from exc
+    except Exception as exc:  # noqa: BLE001
+        raise HTTPException(status_code=400, detail="Failed to load image") from exc
+
+    try:
+        with stage("analyze"):
+            results = cached_compute_density_multi(
+                image_bytes,
+                [roi for _, roi in rois],
+                _analysis_max_side(payload),
+                method,
+                compute=pooled_compute_density_multi,
+            )
+    except (AnalysisQueueFull, AnalysisWorkerCrashed) as exc:
+        raise _analysis_busy() from exc
+    except Exception as exc:  # noqa: BLE001
+        raise HTTPException(status_code=400, detail="Failed to analyze image") from exc
+
+    roi_results = [(roi_id, result) for (roi_id, _), result in zip(rois, results)]
+    with stage("firestore"):
+        [deltas] = _commit_analyses(
+            get_firestore_client(), uid, [(payload.photoId, roi_results)]
+        )
+
+    return _analysis_response(payload.photoId, roi_results, deltas)
+
+
+def _analysis_response(
+    photo_id: str, roi_results: List[tuple[str, DensityResult]], deltas: _AnalysisDeltas
+) -> AnalyzePhotoResponse:
+    (delta_vs_prev, delta_vs_base), roi_deltas = deltas
+    result = roi_results[0][1]
     return AnalyzePhotoResponse(
         densityIndex=result.density_index,
         deltaVsPrev=delta_vs_prev,
@@ -199,40 +446,399 @@ def analyze_photo(
         quality=QualityInfo(
             score=result.quality.score, warnings=result.quality.warnings
         ),
-        analysisId=analysis_id,
+        analysisId=f"analysis_{photo_id}",
+        rois=[
+            RoiAnalysis(
+                id=roi_id,
+                densityIndex=roi_result.density_index,
+                deltaVsPrev=roi_delta_vs_prev,
+                deltaVsBase=roi_delta_vs_base,
+                quality=QualityInfo(
+                    score=roi_result.quality.score, warnings=roi_result.quality.warnings
+                ),
+                roi=roi_result.roi,
+            )
+            for (roi_id, roi_result), (roi_delta_vs_prev, roi_delta_vs_base) in zip(
+                roi_results, roi_deltas
+            )
+        ],
     )
 
 
-def _haversine_distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> int:
-    radius = 6371000
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    d_phi = math.radians(lat2 - lat1)
-    d_lambda = math.radians(lng2 - lng1)
+def _commit_analyses(
+    db, uid: str, entries: List[tuple[str, List[tuple[str, DensityResult]]]]
+) -> List[_AnalysisDeltas]:
+    from firebase_admin import firestore as admin_firestore
 
-    a = (
-        math.sin(d_phi / 2) ** 2
-        + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    # 集計・日次集計の読み取りと結果・集計・写真ステータスの書き込みを1トランザクションで行う
+    analysis_collection = (
+        db.collection("analysisResults").document(uid).collection("items")
     )
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return int(radius * c)
+    photos_collection = db.collection("photos").document(uid).collection("items")
+
+    @admin_firestore.transactional
+    def write(transaction) -> List[_AnalysisDeltas]:
+        summary = load_summary(db, uid, transaction)
+        today = day_key(datetime.now(timezone.utc))
+        # 再解析を二重に数えないよう、既存の結果と記録済みの日の日次集計を書き込み前にまとめて読む
+        existing = {}
+        for photo_id, _ in entries:
+            analysis_id = f"analysis_{photo_id}"
+            snapshot = analysis_collection.document(analysis_id).get(transaction=transaction)
+            existing[analysis_id] = snapshot.to_dict() if snapshot.exists else None
+        days = {today}
+        days.update(filter(None, (recorded_day(record) for record in existing.values() if record)))
+        rollups = {day: load_rollup(db, uid, day, transaction) for day in sorted(days)}
+        deltas: List[_AnalysisDeltas] = []
+        # 複数件はリクエスト順に時系列とみなして差分を計算する。
+        # 写真全体の集計・日次集計は先頭の ROI の値で更新し、ROI ごとの差分は ROI ID 別の集計と比べる
+        for photo_id, roi_results in entries:
+            analysis_id = f"analysis_{photo_id}"
+            result = roi_results[0][1]
+            previous = existing[analysis_id]
+            prev_density, base_density = reference_densities(summary, analysis_id, previous)
+            delta_vs_prev = _delta_from(result.density_index, prev_density)
+            delta_vs_base = _delta_from(result.density_index, base_density)
+            summary = apply_analysis(summary, analysis_id, result.density_index, previous)
+            previous_day = recorded_day(previous) if previous else None
+            if previous_day and previous_day != today:
+                rollups[previous_day] = remove_from_rollup(rollups[previous_day], analysis_id)
+            rollups[today] = apply_to_rollup(rollups[today], analysis_id, result.density_index)
+
+            roi_deltas: List[tuple[float, float]] = []
+            for roi_id, roi_result in roi_results:
+                roi_prev, roi_base = roi_reference_densities(
+                    summary, roi_id, analysis_id, previous
+                )
+                roi_deltas.append(
+                    (
+                        _delta_from(roi_result.density_index, roi_prev),
+                        _delta_from(roi_result.density_index, roi_base),
+                    )
+                )
+                summary = apply_roi_analysis(
+                    summary, roi_id, analysis_id, roi_result.density_index, previous
+                )
 
+            photo_deltas = ((delta_vs_prev, delta_vs_base), roi_deltas)
+            record = _analysis_record(photo_id, roi_results, photo_deltas, today)
+            transaction.set(analysis_collection.document(analysis_id), record)
+            existing[analysis_id] = record
+            transaction.set(
+                photos_collection.document(photo_id),
+                {"status": "done", "analysisId": analysis_id, "analysisError": None},
+                merge=True,
+            )
+            deltas.append(photo_deltas)
+        transaction.set(summary_ref(db, uid), summary_record(summary))
+        for day, rollup in rollups.items():
+            if rollup["count"]:
+                transaction.set(rollups_ref(db, uid).document(day), rollup_record(rollup))
+            else:
+                transaction.delete(rollups_ref(db, uid).document(day))
+        return deltas
+
+    return write(db.transaction())
+
+
+def _delta_from(density: float, reference: Optional[float]) -> float:
+    return float(density - reference) if reference is not None else 0.0
+
+
+def _analysis_record(
+    photo_id: str,
+    roi_results: List[tuple[str, DensityResult]],
+    deltas: _AnalysisDeltas,
+    rollup_day: str,
+) -> dict:
+    from firebase_admin import firestore as admin_firestore
+
+    (delta_vs_prev, delta_vs_base), roi_deltas = deltas
+    roi_id, result = roi_results[0]
+    return {
+        "photoId": photo_id,
+        "computedAt": admin_firestore.SERVER_TIMESTAMP,
+        "rollupDay": rollup_day,
+        "roiId": roi_id,
+        "roi": result.roi,
+        "densityIndex": result.density_index,
+        "deltaVsPrev": delta_vs_prev,
+        "deltaVsBase": delta_vs_base,
+        "quality": {
+            "score": result.quality.score,
+            "warnings": result.quality.warnings,
+        },
+        "method": result.method,
+        "rois": {
+            roi_id: {
+                "roi": roi_result.roi,
+                "densityIndex": roi_result.density_index,
+                "deltaVsPrev": roi_delta_vs_prev,
+                "deltaVsBase": roi_delta_vs_base,
+                "quality": {
+                    "score": roi_result.quality.score,
+                    "warnings": roi_result.quality.warnings,
+                },
+                "method": roi_result.method,
+            }
+            for (roi_id, roi_result), (roi_delta_vs_prev, roi_delta_vs_base) in zip(
+                roi_results, roi_deltas
+            )
+        },
+    }
 
-def _extract_food_items(message: str) -> List[FoodItem]:
-    catalog = [
-        ("レバー", "鉄・ビタミンB群など（一般論）"),
-        ("卵", "タンパク質とビオチンの補給（一般論）"),
-        ("ナッツ", "ビタミンE・亜鉛（一般論）"),
-        ("鮭", "タンパク質とオメガ3（一般論）"),
-        ("納豆", "タンパク質・ミネラル（一般論）"),
-        ("牡蠣", "亜鉛を意識しやすい（一般論）"),
-        ("鶏むね", "高タンパクで続けやすい（一般論）"),
+
+def _analysis_max_side(payload: AnalyzePhotoRequest) -> Optional[int]:
+    # リクエスト指定がなければ設定値（0 はフル解像度の従来モード）
+    if payload.analysisMaxSide is not None:
+        return max(0, payload.analysisMaxSide) or None
+    return ANALYSIS_MAX_SIDE or None
+
+
+def _analysis_busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Analysis workers are busy",
+        headers={"Retry-After": str(ANALYSIS_RETRY_AFTER_S)},
+    )
+
+
+def _analysis_method(payload: AnalyzePhotoRequest) -> str:
+    method = payload.analysisMethod or ANALYSIS_METHOD
+    if method not in ANALYSIS_METHODS:
+        raise HTTPException(status_code=400, detail="Unsupported analysis method")
+    return method
+
+
+_ROI_ID_RE = re.compile(r"[A-Za-z0-9_-]{1,64}")
+_ROI_TOLERANCE = 1e-9
+
+
+def _roi_spec(preset: str) -> RoiSpec:
+    return None if preset == "default" else preset
+
+
+def _analysis_rois(payload: AnalyzePhotoRequest) -> List[tuple[str, RoiSpec]]:
+    # 先頭は写真全体の値（densityIndex・集計・日次集計）に使う ROI。リクエストごとに入れ替わらないよう
+    # roiPreset（未指定・未知のプリセットは default）に固定し、rois に無ければ追加する
+    primary = payload.roiPreset if payload.roiPreset in ROI_PRESETS else "default"
+    if not payload.rois:
+        return [(primary, _roi_spec(primary))]
+    if len(payload.rois) > ANALYSIS_MAX_ROIS:
+        raise HTTPException(
+            status_code=400, detail=f"Too many ROIs (max {ANALYSIS_MAX_ROIS})"
+        )
+
+    rois: List[tuple[str, RoiSpec]] = []
+    for item in payload.rois:
+        if item.rect is not None:
+            rect = item.rect
+            if item.preset is not None:
+                raise HTTPException(status_code=400, detail="ROI needs either preset or rect")
+            if not item.id:
+                raise HTTPException(status_code=400, detail="Custom ROI needs an id")
+            if item.id in ROI_PRESETS:
+                # プリセットの ROI 別集計に混ざらないよう、プリセット名は使わせない
+                raise HTTPException(status_code=400, detail="Custom ROI id is reserved")
+            if not (
+                0 <= rect.x < 1
+                and 0 <= rect.y < 1
+                and rect.w > 0
+                and rect.h > 0
+                and rect.x + rect.w <= 1 + _ROI_TOLERANCE
+                and rect.y + rect.h <= 1 + _ROI_TOLERANCE
+            ):
+                raise HTTPException(status_code=400, detail="ROI rect is out of range")
+            rois.append((item.id, RoiRect(rect.x, rect.y, rect.w, rect.h)))
+            continue
+        preset = item.preset or "default"
+        if preset not in ROI_PRESETS:
+            raise HTTPException(status_code=400, detail="Unsupported ROI preset")
+        roi_id = item.id or preset
+        if roi_id in ROI_PRESETS and roi_id != preset:
+            raise HTTPException(status_code=400, detail="Custom ROI id is reserved")
+        rois.append((roi_id, _roi_spec(preset)))
+
+    ids = [roi_id for roi_id, _ in rois]
+    if not all(_ROI_ID_RE.fullmatch(roi_id) for roi_id in ids):
+        raise HTTPException(status_code=400, detail="Invalid ROI id")
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=400, detail="Duplicate ROI id")
+
+    primary_spec = _roi_spec(primary)
+    for index, (_, roi) in enumerate(rois):
+        if roi == primary_spec:
+            return [rois[index], *rois[:index], *rois[index + 1 :]]
+    return [(primary, primary_spec), *rois]
+
+
+def _download_or_none(storage_path: str) -> Optional[bytes]:
+    try:
+        return download_image_bytes(storage_path)
+    except Exception:  # noqa: BLE001
+        return None
+
+
+@app.post("/api/v1/photos/analyze-batch", response_model=AnalyzeBatchResponse)
+def analyze_photo_batch(
+    payload: AnalyzeBatchRequest, uid: str = Depends(get_current_uid)
+) -> AnalyzeBatchResponse:
+    photos = payload.photos
+    if not photos:
+        raise HTTPException(status_code=400, detail="No photos in batch")
+    if len(photos) > ANALYZE_BATCH_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many photos in batch (max {ANALYZE_BATCH_MAX})",
+        )
+    methods = [_analysis_method(photo) for photo in photos]
+    photo_rois = [_analysis_rois(photo) for photo in photos]
+
+    with stage("download"):
+        with ThreadPoolExecutor(max_workers=min(8, len(photos))) as executor:
+            downloaded = list(
+                executor.map(_download_or_none, [photo.storagePath for photo in photos])
+            )
+
+    # ROI・解析解像度・解析方式ごとにまとめてベクトル化エンジンへ渡す。
+    # ROI が複数の写真は1枚ずつ、1回のデコードから全 ROI を解析する
+    results: list[Optional[List[DensityResult]]] = [None] * len(photos)
+    by_options: dict[tuple[RoiSpec, Optional[int], str], list[int]] = {}
+    for index, image_bytes in enumerate(downloaded):
+        if image_bytes is None:
+            continue
+        max_side = _analysis_max_side(photos[index])
+        if len(photo_rois[index]) == 1:
+            [(_, roi)] = photo_rois[index]
+            by_options.setdefault((roi, max_side, methods[index]), []).append(index)
+            continue
+        try:
+            with stage("analyze"):
+                results[index] = cached_compute_density_multi(
+                    image_bytes,
+                    [roi for _, roi in photo_rois[index]],
+                    max_side,
+                    methods[index],
+                    compute=pooled_compute_density_multi,
+                )
+        except (AnalysisQueueFull, AnalysisWorkerCrashed) as exc:
+            raise _analysis_busy() from exc
+        except Exception:  # noqa: BLE001
+            results[index] = None
+    for (roi, max_side, method), indices in by_options.items():
+        try:
+            with stage("analyze"):
+                batch_results = cached_compute_density_batch(
+                    [downloaded[index] for index in indices],
+                    roi,
+                    max_side,
+                    method,
+                    compute=pooled_compute_density_batch,
+                )
+        except (AnalysisQueueFull, AnalysisWorkerCrashed) as exc:
+            raise _analysis_busy() from exc
+        for index, result in zip(indices, batch_results):
+            results[index] = [result] if result is not None else None
+
+    analyzed = [
+        (
+            index,
+            photo.photoId,
+            [(roi_id, result) for (roi_id, _), result in zip(photo_rois[index], roi_results)],
+        )
+        for index, (photo, roi_results) in enumerate(zip(photos, results))
+        if roi_results is not None
     ]
+    deltas: dict[int, _AnalysisDeltas] = {}
+    if analyzed:
+        with stage("firestore"):
+            committed = _commit_analyses(
+                get_firestore_client(),
+                uid,
+                [(photo_id, roi_results) for _, photo_id, roi_results in analyzed],
+            )
+        deltas = {index: delta for (index, _, _), delta in zip(analyzed, committed)}
+    named_results = {index: roi_results for index, _, roi_results in analyzed}
+
+    items: List[AnalyzeBatchItem] = []
+    for index, (photo, image_bytes) in enumerate(zip(photos, downloaded)):
+        if image_bytes is None:
+            items.append(AnalyzeBatchItem(photoId=photo.photoId, error="Failed to load image"))
+            continue
+        if index not in named_results:
+            items.append(
+                AnalyzeBatchItem(photoId=photo.photoId, error="Failed to analyze image")
+            )
+            continue
+
+        items.append(
+            AnalyzeBatchItem(
+                photoId=photo.photoId,
+                result=_analysis_response(
+                    photo.photoId, named_results[index], deltas[index]
+                ),
+            )
+        )
+
+    return AnalyzeBatchResponse(items=items)
+
+
+_FRAME_CONTENT_TYPES = ("image/jpeg", "image/png", "image/webp")
+
+
+@app.post("/api/v1/photos/quality-check", response_model=QualityCheckResponse)
+async def quality_check(
+    request: Request,
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+    roiPreset: Optional[str] = None,
+    uid: str = Depends(get_current_uid),
+) -> QualityCheckResponse:
+    # 撮影前のプレビューフレームを本文で受け取り、品質だけを判定する（Storage・密度計算・Firestore は通らない）
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    raw = content_type == "application/octet-stream"
+    if not raw and content_type not in _FRAME_CONTENT_TYPES:
+        raise HTTPException(status_code=415, detail="Unsupported frame type")
+    if roiPreset is not None and roiPreset not in ROI_PRESETS:
+        raise HTTPException(status_code=400, detail="Unsupported ROI preset")
+
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > QUALITY_CHECK_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Frame is too large")
+
+    size = None
+    if raw:
+        if not width or not height or width < 0 or height < 0 or width * height != len(body):
+            raise HTTPException(
+                status_code=400, detail="Raw frames need width and height matching the body"
+            )
+        size = (width, height)
+
+    try:
+        quality = await run_in_threadpool(_frame_quality, bytes(body), size, roiPreset)
+    except ImageTooLarge as exc:
+        raise HTTPException(status_code=413, detail="Frame is too large") from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Invalid frame") from exc
+    return QualityCheckResponse(ok=not quality.warnings, quality=quality)
+
+
+def _frame_quality(
+    body: bytes, size: Optional[tuple[int, int]], preset: Optional[str]
+) -> QualityInfo:
+    frame = open_frame(body, size)
+    # 小さな圧縮データで巨大な寸法を名乗るフレームは、デコード前にヘッダの寸法で断る
+    if frame.width * frame.height > QUALITY_CHECK_MAX_PIXELS:
+        raise ImageTooLarge("Frame has too many pixels")
+    quality = compute_frame_quality(frame, preset, QUALITY_CHECK_MAX_SIDE)
+    return QualityInfo(score=quality.score, warnings=quality.warnings)
+
 
-    items: List[FoodItem] = []
-    for name, why in catalog:
-        if name in message:
-            items.append(FoodItem(name=name, why=why))
+def _extract_food_items(message: str) -> List[FoodItem]:
+    foods = get_keyword_engine().scan(message).foods
+    items = [FoodItem(name=food.name, why=food.why) for food in foods]
 
     if not items:
         items = [
@@ -243,60 +849,50 @@ def _extract_food_items(message: str) -> List[FoodItem]:
     return items
 
 
+_STORE_BASE_CONFIDENCE = {
+    "supermarket": 0.75,
+    "convenience": 0.55,
+    "drugstore": 0.45,
+}
+
+
+def _dummy_store_catalog(location: Location) -> StoreCatalog:
+    # STORE_CATALOG_PATH 未設定時のデモ用。現在地の周辺に3店舗を置く
+    return StoreCatalog(
+        ["スーパーA", "コンビニB", "ドラッグストアC"],
+        [location.lat + 0.0012, location.lat - 0.0009, location.lat + 0.0018],
+        [location.lng + 0.0007, location.lng + 0.0004, location.lng - 0.0006],
+        ["supermarket", "convenience", "drugstore"],
+    )
+
+
 def _build_store_candidates(
     location: Optional[Location], radius_m: int, items: List[FoodItem]
 ) -> List[StoreCandidate]:
     if location is None:
         return []
 
-    dummy_stores = [
-        {
-            "name": "スーパーA",
-            "lat": location.lat + 0.0012,
-            "lng": location.lng + 0.0007,
-            "type": "supermarket",
-        },
-        {
-            "name": "コンビニB",
-            "lat": location.lat - 0.0009,
-            "lng": location.lng + 0.0004,
-            "type": "convenience",
-        },
-        {
-            "name": "ドラッグストアC",
-            "lat": location.lat + 0.0018,
-            "lng": location.lng - 0.0006,
-            "type": "drugstore",
-        },
-    ]
+    catalog = get_store_catalog() or _dummy_store_catalog(location)
+    indices, distances = catalog.query_radius(
+        location.lat, location.lng, min(radius_m, STORE_MAX_RADIUS_M), STORE_MAX_RESULTS
+    )
 
     candidates: List[StoreCandidate] = []
-    for store in dummy_stores:
-        distance = _haversine_distance_m(
-            location.lat, location.lng, store["lat"], store["lng"]
-        )
-        if distance > radius_m:
-            continue
-
-        base_confidence = {
-            "supermarket": 0.75,
-            "convenience": 0.55,
-            "drugstore": 0.45,
-        }.get(store["type"], 0.4)
-
+    for index, distance in zip(indices.tolist(), distances.tolist()):
+        store_type = catalog.types[index]
+        base_confidence = _STORE_BASE_CONFIDENCE.get(store_type, 0.4)
         confidence = min(0.9, base_confidence + 0.05 * len(items))
-        note = "惣菜/精肉があれば入手しやすい" if store["type"] == "supermarket" else "代替案があると安心"
+        note = "惣菜/精肉があれば入手しやすい" if store_type == "supermarket" else "代替案があると安心"
 
         candidates.append(
             StoreCandidate(
-                name=store["name"],
-                distanceM=distance,
+                name=catalog.names[index],
+                distanceM=int(distance),
                 confidence=confidence,
                 note=note,
             )
         )
 
-    candidates.sort(key=lambda c: (c.distanceM or 0))
     return candidates
 
 
@@ -304,9 +900,12 @@ def _build_store_candidates(
 def recommend_food_sniper(
     payload: FoodSniperRequest, uid: str = Depends(get_current_uid)
 ) -> FoodSniperResponse:
+    from firebase_admin import firestore as admin_firestore
+
     items = _extract_food_items(payload.message)
     radius = payload.radiusM or 800
-    stores = _build_store_candidates(payload.location, radius, items)
+    with stage("stores"):
+        stores = _build_store_candidates(payload.location, radius, items)
 
     shopping_list = [f"{item.name}" for item in items]
     if "卵" not in shopping_list:
@@ -314,30 +913,23 @@ def recommend_food_sniper(
 
     db = get_firestore_client()
     request_id = f"food_{uuid.uuid4().hex}"
-    db.collection("foodRequests").document(uid).collection("items").document(
-        request_id
-    ).set(
-        {
-            "createdAt": admin_firestore.SERVER_TIMESTAMP,
-            "query": payload.message,
-            "location": payload.location.model_dump() if payload.location else None,
-            "recommendations": [item.dict() for item in items],
-            "stores": [store.dict() for store in stores],
-            "shoppingList": shopping_list,
-        }
-    )
+    with stage("firestore_write"):
+        db.collection("foodRequests").document(uid).collection("items").document(
+            request_id
+        ).set(
+            {
+                "createdAt": admin_firestore.SERVER_TIMESTAMP,
+                "query": payload.message,
+                "location": payload.location.model_dump() if payload.location else None,
+                "recommendations": [item.dict() for item in items],
+                "stores": [store.dict() for store in stores],
+                "shoppingList": shopping_list,
+            }
+        )
 
     return FoodSniperResponse(items=items, stores=stores, shoppingList=shopping_list)
 
 
-def _to_datetime(value) -> Optional[datetime]:
-    if isinstance(value, datetime):
-        return value
-    if hasattr(value, "to_datetime"):
-        return value.to_datetime()
-    return None
-
-
 def _safe_json_load(text: str) -> dict:
     try:
         return json.loads(text)
@@ -348,7 +940,7 @@ def _safe_json_load(text: str) -> dict:
         return json.loads(match.group(0))
 
 
-def _generate_report_with_llm(
+async def _generate_report_with_llm(
     series: list[tuple[datetime, float]], period_days: int
 ) -> Optional[ReportGenerateResponse]:
     if not gemini_enabled():
@@ -374,7 +966,7 @@ def _generate_report_with_llm(
     )
 
     try:
-        text = generate_text(prompt)
+        text = await cached_agenerate_text(prompt, validate=_safe_json_load)
         data = _safe_json_load(text)
     except Exception:  # noqa: BLE001
         return None
@@ -394,53 +986,55 @@ def _generate_report_with_llm(
     )
 
 
+def _load_report_series(uid: str, first_day) -> list[tuple[datetime, float]]:
+    # 日次集計を読むので、読み取り件数は最大でも period_days 件。
+    # 各日の最初と最後の値を並べ、期間の始点・終点を写真単位の系列と揃える
+    series = []
+    for rollup in fetch_rollups(get_firestore_client(), uid, first_day):
+        day = datetime.fromisoformat(rollup["date"]).replace(tzinfo=timezone.utc)
+        first = rollup.get("first") or {}
+        last = rollup.get("last") or {}
+        points = [last] if first.get("analysisId") == last.get("analysisId") else [first, last]
+        for point in points:
+            density = point.get("densityIndex")
+            if isinstance(density, (int, float)):
+                series.append((day, float(density)))
+    return series
+
+
+def _save_report(uid: str, report_id: str, record: dict) -> None:
+    get_firestore_client().collection("reports").document(uid).collection(
+        "items"
+    ).document(report_id).set(record)
+
+
 @app.post("/api/v1/reports/generate", response_model=ReportGenerateResponse)
-def generate_report(
+async def generate_report(
     payload: ReportGenerateRequest, uid: str = Depends(get_current_uid)
 ) -> ReportGenerateResponse:
-    period_days = payload.periodDays or 7
-    period_days = max(1, min(period_days, 30))
+    from firebase_admin import firestore as admin_firestore
 
-    db = get_firestore_client()
-    analysis_ref = db.collection("analysisResults").document(uid).collection("items")
-    docs = (
-        analysis_ref.order_by(
-            "computedAt", direction=admin_firestore.Query.DESCENDING
-        )
-        .limit(50)
-        .get()
-    )
+    period_days = payload.periodDays or 7
+    period_days = max(1, min(period_days, REPORT_MAX_PERIOD_DAYS))
 
+    # Firestore はブロッキング API なのでスレッドプールで呼び、イベントループを塞がない
     now = datetime.now(timezone.utc)
-    cutoff = now - timedelta(days=period_days)
-    series = []
-    for doc in docs:
-        data = doc.to_dict()
-        ts = data.get("computedAt") or data.get("createdAt")
-        computed_at = _to_datetime(ts)
-        if not computed_at:
-            continue
-        if computed_at.tzinfo is None:
-            computed_at = computed_at.replace(tzinfo=timezone.utc)
-        if computed_at < cutoff:
-            continue
-        density = data.get("densityIndex")
-        if isinstance(density, (int, float)):
-            series.append((computed_at, float(density)))
-
-    series.sort(key=lambda item: item[0])
+    first_day = period_start(now, period_days)
+    with stage("firestore_read"):
+        series = await run_in_threadpool(_load_report_series, uid, first_day)
 
     highlights: List[str] = []
     next_actions: List[str] = []
     raw_text = ""
     model_label = "rule_based_v1"
 
-    llm_report = _generate_report_with_llm(series, period_days)
+    with stage("llm"):
+        llm_report = await _generate_report_with_llm(series, period_days)
     if llm_report:
         highlights = llm_report.highlights
         next_actions = llm_report.nextActions
         raw_text = llm_report.rawText
-        model_label = f"gemini:{GEMINI_MODEL}"
+        model_label = llm_model_label()
     else:
         if not series:
             highlights.append("期間内の測定データがありません。")
@@ -466,20 +1060,24 @@ def generate_report(
         raw_text = "\n".join(highlights + ["---"] + next_actions)
 
     report_id = f"report_{uuid.uuid4().hex}"
-    db.collection("reports").document(uid).collection("items").document(report_id).set(
-        {
-            "createdAt": admin_firestore.SERVER_TIMESTAMP,
-            "period": {
-                "from": cutoff.date().isoformat(),
-                "to": now.date().isoformat(),
-                "days": period_days,
+    with stage("firestore_write"):
+        await run_in_threadpool(
+            _save_report,
+            uid,
+            report_id,
+            {
+                "createdAt": admin_firestore.SERVER_TIMESTAMP,
+                "period": {
+                    "from": first_day.isoformat(),
+                    "to": now.date().isoformat(),
+                    "days": period_days,
+                },
+                "highlights": highlights,
+                "nextActions": next_actions,
+                "rawText": raw_text,
+                "llm": {"model": model_label},
             },
-            "highlights": highlights,
-            "nextActions": next_actions,
-            "rawText": raw_text,
-            "llm": {"model": model_label},
-        }
-    )
+        )
 
     return ReportGenerateResponse(
         reportId=report_id,
@@ -490,27 +1088,20 @@ def generate_report(
 
 
 def _contains_risk_keywords(message: str) -> bool:
-    keywords = [
-        "出血",
-        "痛い",
-        "強いかゆみ",
-        "赤み",
-        "炎症",
-        "円形脱毛",
-        "急に",
-        "発熱",
-        "膿",
-        "ただれ",
-    ]
-    return any(key in message for key in keywords)
-
+    return bool(get_keyword_engine().scan(message).risks)
 
-def _compose_mental_shield(message: str) -> tuple[List[MentalShieldCard], str]:
-    risk = _contains_risk_keywords(message)
 
-    llm_cards, llm_summary = _generate_mental_with_llm(message)
+async def _compose_mental_shield(
+    message: str,
+) -> tuple[List[MentalShieldCard], str]:
+    llm_cards, llm_summary = await _generate_mental_with_llm(message)
     if llm_cards and llm_summary:
         return llm_cards, llm_summary
+    return _rule_based_mental_shield(message)
+
+
+def _rule_based_mental_shield(message: str) -> tuple[List[MentalShieldCard], str]:
+    risk = _contains_risk_keywords(message)
 
     encourager = (
         "不安に感じるのは自然な反応です。今ここで一緒に整理しましょう。"
@@ -539,30 +1130,15 @@ def _compose_mental_shield(message: str) -> tuple[List[MentalShieldCard], str]:
     return cards, summary
 
 
-def _generate_mental_with_llm(
+async def _generate_mental_with_llm(
     message: str,
 ) -> tuple[Optional[List[MentalShieldCard]], Optional[str]]:
     if not gemini_enabled():
         return None, None
 
-    prompt = (
-        "あなたは薄毛対策のメンタル支援エージェントです。"
-        "以下の相談内容に対して、3人格（encourager/coach/doctor）の短い回答と"
-        "まとめを日本語で返してください。診断はしないでください。\n"
-        "出力は必ず次のJSON形式のみ:\n"
-        "{\n"
-        '  "cards": [\n'
-        '    {"agent": "encourager", "text": "..."},\n'
-        '    {"agent": "coach", "text": "..."},\n'
-        '    {"agent": "doctor", "text": "..."}\n'
-        "  ],\n"
-        '  "summary": "..." \n'
-        "}\n"
-        f"相談内容: {message}\n"
-    )
-
+    prompt = _mental_shield_prompt(message)
     try:
-        text = generate_text(prompt)
+        text = await cached_agenerate_text(prompt, validate=_safe_json_load)
         data = _safe_json_load(text)
     except Exception:  # noqa: BLE001
         return None, None
@@ -574,11 +1150,9 @@ def _generate_mental_with_llm(
 
     cards: List[MentalShieldCard] = []
     for item in cards_data:
-        agent = str(item.get("agent", ""))
-        text_value = str(item.get("text", ""))
-        if agent not in {"encourager", "coach", "doctor"} or not text_value:
-            continue
-        cards.append(MentalShieldCard(agent=agent, text=text_value))
+        card = _mental_card_from(item)
+        if card is not None:
+            cards.append(card)
 
     if len(cards) < 3:
         return None, None
@@ -586,12 +1160,86 @@ def _generate_mental_with_llm(
     return cards, str(summary)
 
 
-@app.post("/api/v1/mental-shield/chat", response_model=MentalShieldResponse)
-def mental_shield_chat(
-    payload: MentalShieldRequest, uid: str = Depends(get_current_uid)
-) -> MentalShieldResponse:
-    thread_id = payload.threadId or "default"
-    cards, summary = _compose_mental_shield(payload.message)
+def _mental_shield_prompt(message: str) -> str:
+    return (
+        "あなたは薄毛対策のメンタル支援エージェントです。"
+        "以下の相談内容に対して、3人格（encourager/coach/doctor）の短い回答と"
+        "まとめを日本語で返してください。診断はしないでください。\n"
+        "出力は必ず次のJSON形式のみ:\n"
+        "{\n"
+        '  "cards": [\n'
+        '    {"agent": "encourager", "text": "..."},\n'
+        '    {"agent": "coach", "text": "..."},\n'
+        '    {"agent": "doctor", "text": "..."}\n'
+        "  ],\n"
+        '  "summary": "..." \n'
+        "}\n"
+        f"相談内容: {message}\n"
+    )
+
+
+def _mental_card_from(item) -> Optional[MentalShieldCard]:
+    if not isinstance(item, dict):
+        return None
+    agent = str(item.get("agent", ""))
+    text_value = str(item.get("text", ""))
+    if agent not in {"encourager", "coach", "doctor"} or not text_value:
+        return None
+    return MentalShieldCard(agent=agent, text=text_value)
+
+
+async def _stream_mental_shield(message: str):
+    # カード（MentalShieldCard）とまとめ（str）を確定した順に返す
+    emitted: dict[str, MentalShieldCard] = {}
+    summary: Optional[str] = None
+
+    if gemini_enabled():
+        prompt = _mental_shield_prompt(message)
+        scanner = JsonStreamScanner(array_fields=["cards"], value_fields=["summary"])
+        cached = lookup_cached_text(prompt)
+        chunks: List[str] = []
+        try:
+            stream = _single_chunk(cached) if cached else astream_text_limited(prompt)
+            async for chunk in stream:
+                chunks.append(chunk)
+                for field, value in scanner.feed(chunk):
+                    if field == "summary" and value:
+                        summary = str(value)
+                        continue
+                    card = _mental_card_from(value) if field == "cards" else None
+                    if card is not None and card.agent not in emitted:
+                        emitted[card.agent] = card
+                        yield card
+            if not cached:
+                remember_text(prompt, "".join(chunks), validate=_safe_json_load)
+        except Exception:  # noqa: BLE001
+            pass
+
+    # LLM が無効・失敗・不完全な場合は、足りない分をルールベースで即時に補う
+    fallback_cards, fallback_summary = _rule_based_mental_shield(message)
+    for card in fallback_cards:
+        if card.agent not in emitted:
+            emitted[card.agent] = card
+            yield card
+    yield summary or fallback_summary
+
+
+async def _single_chunk(text: str):
+    yield text
+
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _save_mental_turn(
+    uid: str,
+    thread_id: str,
+    message: str,
+    cards: List[MentalShieldCard],
+    summary: str,
+) -> None:
+    from firebase_admin import firestore as admin_firestore
 
     db = get_firestore_client()
     messages_ref = (
@@ -602,32 +1250,69 @@ def mental_shield_chat(
         .collection("messages")
     )
 
-    messages_ref.add(
-        {
-            "role": "user",
-            "agent": "user",
-            "text": payload.message,
-            "createdAt": admin_firestore.SERVER_TIMESTAMP,
-        }
+    # 1ターン分（相談・3カード・まとめ）を1回のコミットで保存する。
+    # createdAt は同一になるため、表示順は order で並べる
+    messages = [{"role": "user", "agent": "user", "text": message}]
+    messages.extend(
+        {"role": "agent", "agent": card.agent, "text": card.text} for card in cards
     )
+    messages.append({"role": "agent", "agent": "orchestrator", "text": summary})
 
-    for card in cards:
-        messages_ref.add(
+    batch = db.batch()
+    for order, item in enumerate(messages):
+        batch.set(
+            messages_ref.document(),
             {
-                "role": "agent",
-                "agent": card.agent,
-                "text": card.text,
+                **item,
+                "order": order,
                 "createdAt": admin_firestore.SERVER_TIMESTAMP,
-            }
+            },
         )
+    batch.commit()
 
-    messages_ref.add(
-        {
-            "role": "agent",
-            "agent": "orchestrator",
-            "text": summary,
-            "createdAt": admin_firestore.SERVER_TIMESTAMP,
-        }
-    )
+
+@app.post("/api/v1/mental-shield/chat", response_model=MentalShieldResponse)
+async def mental_shield_chat(
+    payload: MentalShieldRequest, uid: str = Depends(get_current_uid)
+) -> MentalShieldResponse:
+    thread_id = payload.threadId or "default"
+    with stage("llm"):
+        cards, summary = await _compose_mental_shield(payload.message)
+    with stage("firestore_write"):
+        await run_in_threadpool(
+            _save_mental_turn, uid, thread_id, payload.message, cards, summary
+        )
 
     return MentalShieldResponse(cards=cards, summary=summary, threadId=thread_id)
+
+
+@app.post("/api/v1/mental-shield/chat/stream")
+async def mental_shield_chat_stream(
+    payload: MentalShieldRequest, uid: str = Depends(get_current_uid)
+) -> StreamingResponse:
+    thread_id = payload.threadId or "default"
+
+    async def events():
+        cards: List[MentalShieldCard] = []
+        summary = ""
+        async for item in _stream_mental_shield(payload.message):
+            if isinstance(item, MentalShieldCard):
+                cards.append(item)
+                yield _sse_event("card", item.model_dump())
+            else:
+                summary = item
+                yield _sse_event("summary", {"summary": summary})
+
+        # 表示を待たせないよう、保存はストリームを送り終えてから行う。
+        # ヘッダ送信後の区間は Server-Timing には載らず、/api/metrics にだけ残る
+        with stage("firestore_write"):
+            await run_in_threadpool(
+                _save_mental_turn, uid, thread_id, payload.message, cards, summary
+            )
+        yield _sse_event("done", {"threadId": thread_id})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
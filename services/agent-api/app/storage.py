@@ -1,29 +1,188 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import io
 import os
 from pathlib import Path
+import threading
+from typing import BinaryIO
+
+from .config import (
+    FIREBASE_STORAGE_BUCKET,
+    LOCAL_IMAGE_PATH,
+    STORAGE_CACHE_DIR,
+    STORAGE_CACHE_MAX_BYTES,
+    STORAGE_LOCAL_DIR,
+    STORAGE_MAX_IMAGE_BYTES,
+)
+
+_CHUNK_SIZE = 1024 * 1024
+
+_storage_client = None
+_cache_lock = threading.Lock()
+# ディスクキャッシュの合計サイズ。None は未走査（他プロセスが足した分は次の走査で反映される）
+_cache_bytes: int | None = None
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class _LocalBlob:
+    def __init__(self, path: Path, name: str):
+        self._path = path
+        self.name = name
+        stat = path.stat()
+        self.size = stat.st_size
+        self.generation = stat.st_mtime_ns
+
+    def open(self, mode: str = "rb", **_: object) -> BinaryIO:
+        return open(self._path, mode)
+
+    def download_as_bytes(self, **_: object) -> bytes:
+        return self._path.read_bytes()
 
-from google.cloud import storage as gcs
 
-from .config import FIREBASE_STORAGE_BUCKET, LOCAL_IMAGE_PATH
+class _LocalBucket:
+    def __init__(self, root: Path):
+        self._root = root
 
-_storage_client: gcs.Client | None = None
+    def get_blob(self, blob_name: str) -> _LocalBlob | None:
+        path = (self._root / blob_name).resolve()
+        if self._root not in path.parents or not path.is_file():
+            return None
+        return _LocalBlob(path, blob_name)
 
 
-def get_storage_client() -> gcs.Client:
+class LocalDirectoryStorageClient:
+    # GCS クライアントの代わりにローカルディレクトリを読む（オフライン検証用）
+    def __init__(self, root: str):
+        self._root = Path(root).resolve()
+
+    def bucket(self, _name: str) -> _LocalBucket:
+        return _LocalBucket(self._root)
+
+
+def get_storage_client():
     global _storage_client
     if _storage_client is None:
-        _storage_client = gcs.Client()
+        if STORAGE_LOCAL_DIR:
+            _storage_client = LocalDirectoryStorageClient(STORAGE_LOCAL_DIR)
+        else:
+            from google.cloud import storage as gcs
+
+            _storage_client = gcs.Client()
     return _storage_client
 
 
+def set_storage_client(client) -> None:
+    global _storage_client
+    _storage_client = client
+
+
+@functools.lru_cache(maxsize=1)
+def _local_fixture_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _cache_path(storage_path: str, generation: object) -> Path:
+    key = hashlib.sha256(f"{storage_path}#{generation}".encode()).hexdigest()
+    return Path(STORAGE_CACHE_DIR) / key[:2] / key
+
+
+def _evict_blob_cache(target_bytes: int) -> int:
+    entries = []
+    for path in Path(STORAGE_CACHE_DIR).glob("*/*"):
+        if path.suffix == ".part":
+            continue
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort()
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= target_bytes:
+            break
+        try:
+            path.unlink()
+        except OSError:
+            continue
+        total -= size
+    return total
+
+
+def _add_cached_bytes(size: int) -> None:
+    global _cache_bytes
+    # ディレクトリの走査は起動後の最初の1回と、累計が上限を超えたときだけ行う。
+    # 超過時は上限の 9 割まで消し、満杯のまま取得のたびに走査しないようにする
+    if _cache_bytes is not None:
+        _cache_bytes += size
+    if _cache_bytes is None or _cache_bytes > STORAGE_CACHE_MAX_BYTES:
+        _cache_bytes = _evict_blob_cache(STORAGE_CACHE_MAX_BYTES * 9 // 10)
+
+
+def _read_limited(source: BinaryIO, max_bytes: int) -> bytes:
+    # 上限を超えた時点で読むのをやめ、巨大な画像をメモリに載せきらない
+    buffer = io.BytesIO()
+    while True:
+        chunk = source.read(_CHUNK_SIZE)
+        if not chunk:
+            return buffer.getvalue()
+        if buffer.tell() + len(chunk) > max_bytes:
+            raise ImageTooLarge("Image exceeds size limit")
+        buffer.write(chunk)
+
+
+def _open_blob(blob) -> BinaryIO:
+    # 世代を固定して読み、途中で上書きされた別の画像が混ざらないようにする
+    return blob.open("rb", chunk_size=_CHUNK_SIZE, if_generation_match=blob.generation)
+
+
+def _read_cached_blob(blob, storage_path: str) -> bytes:
+    path = _cache_path(storage_path, blob.generation)
+    try:
+        # 参照時刻をmtimeで表し、容量超過時は古いものから消す
+        os.utime(path)
+        return path.read_bytes()
+    except OSError:
+        pass
+
+    with _open_blob(blob) as source:
+        data = _read_limited(source, STORAGE_MAX_IMAGE_BYTES)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.part")
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+    with _cache_lock:
+        _add_cached_bytes(len(data))
+    return data
+
+
 def download_image_bytes(storage_path: str) -> bytes:
     if LOCAL_IMAGE_PATH and os.path.exists(LOCAL_IMAGE_PATH):
-        with open(LOCAL_IMAGE_PATH, "rb") as f:
-            return f.read()
+        return _local_fixture_bytes(LOCAL_IMAGE_PATH)
 
-    if not FIREBASE_STORAGE_BUCKET:
+    client = get_storage_client()
+    if not FIREBASE_STORAGE_BUCKET and not isinstance(client, LocalDirectoryStorageClient):
         raise RuntimeError("FIREBASE_STORAGE_BUCKET is not set")
 
-    client = get_storage_client()
-    bucket = client.bucket(FIREBASE_STORAGE_BUCKET)
-    blob = bucket.blob(storage_path)
-    return blob.download_as_bytes()
+    blob = client.bucket(FIREBASE_STORAGE_BUCKET).get_blob(storage_path)
+    if blob is None:
+        raise FileNotFoundError(storage_path)
+    if blob.size is not None and blob.size > STORAGE_MAX_IMAGE_BYTES:
+        raise ImageTooLarge("Image exceeds size limit")
+
+    if STORAGE_CACHE_DIR:
+        return _read_cached_blob(blob, storage_path)
+    with _open_blob(blob) as source:
+        return _read_limited(source, STORAGE_MAX_IMAGE_BYTES)
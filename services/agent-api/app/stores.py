@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import csv
+import logging
+import math
+from pathlib import Path
+import threading
+
+from .config import STORE_CATALOG_PATH, STORE_GRID_CELL_M
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# 店舗カタログと半径検索。緯度経度を固定幅のグリッドに割り当て、セル番号順に並べた配列を
+# searchsorted で切り出してから、候補だけを NumPy でまとめて距離計算する
+
+EARTH_RADIUS_M = 6371000.0
+_METERS_PER_DEG_LAT = math.pi * EARTH_RADIUS_M / 180
+
+
+def haversine_m(
+    lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray
+) -> np.ndarray:
+    phi1 = math.radians(lat)
+    phi2 = np.radians(lats)
+    d_phi = phi2 - phi1
+    d_lambda = np.radians(lngs - lng)
+    a = np.sin(d_phi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class StoreCatalog:
+    def __init__(
+        self,
+        names: list[str],
+        lats: np.ndarray,
+        lngs: np.ndarray,
+        types: list[str],
+        cell_m: float = STORE_GRID_CELL_M,
+    ):
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        self._cell_deg = cell_m / _METERS_PER_DEG_LAT
+        self._cols = int(math.ceil(360 / self._cell_deg)) + 1
+        keys = self._row(lats) * self._cols + self._col(lngs)
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self.lats = lats[order]
+        self.lngs = lngs[order]
+        self.names = np.asarray(names, dtype=object)[order]
+        self.types = np.asarray(types, dtype=object)[order]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _row(self, lats):
+        return np.floor((np.asarray(lats) + 90) / self._cell_deg).astype(np.int64)
+
+    def _col(self, lngs):
+        return np.floor((np.asarray(lngs) + 180) / self._cell_deg).astype(np.int64)
+
+    def _candidates(self, lat: float, lng: float, radius_m: float) -> np.ndarray:
+        d_lat = radius_m / _METERS_PER_DEG_LAT
+        # 高緯度側ほど経度1度が短いので、範囲の端の緯度で経度方向の幅を決める
+        cos_lat = math.cos(math.radians(min(89.0, abs(lat) + d_lat)))
+        d_lng = min(180.0, d_lat / max(cos_lat, 1e-6))
+        row_from, row_to = int(self._row(lat - d_lat)), int(self._row(lat + d_lat))
+        col_from = max(0, int(self._col(lng - d_lng)))
+        col_to = min(self._cols - 1, int(self._col(lng + d_lng)))
+
+        # 行ごとに [col_from, col_to] のセルは並び順で連続している
+        bases = np.arange(row_from, row_to + 1, dtype=np.int64) * self._cols
+        starts = np.searchsorted(self._keys, bases + col_from, side="left")
+        ends = np.searchsorted(self._keys, bases + col_to, side="right")
+        spans = [np.arange(start, end) for start, end in zip(starts, ends) if end > start]
+        if not spans:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(spans)
+
+    def query_radius(
+        self, lat: float, lng: float, radius_m: float, limit: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        indices = self._candidates(lat, lng, radius_m)
+        distances = haversine_m(lat, lng, self.lats[indices], self.lngs[indices])
+        within = distances <= radius_m
+        indices, distances = indices[within], distances[within]
+        if len(indices) > limit:
+            nearest = np.argpartition(distances, limit - 1)[:limit]
+            indices, distances = indices[nearest], distances[nearest]
+        order = np.argsort(distances, kind="stable")
+        return indices[order], distances[order]
+
+
+def load_store_catalog(path: str | Path) -> StoreCatalog:
+    # CSV（ヘッダ: name,lat,lng,type）。座標が読めない行は読み飛ばす
+    names: list[str] = []
+    lats: list[float] = []
+    lngs: list[float] = []
+    types: list[str] = []
+    skipped = 0
+    with open(path, newline="", encoding="utf-8") as handle:
+        for row in csv.DictReader(handle):
+            try:
+                lat = float(row["lat"])
+                lng = float(row["lng"])
+            except (KeyError, TypeError, ValueError):
+                skipped += 1
+                continue
+            if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+                skipped += 1
+                continue
+            names.append(row.get("name") or "")
+            lats.append(lat)
+            lngs.append(lng)
+            types.append(row.get("type") or "")
+    catalog = StoreCatalog(names, np.array(lats), np.array(lngs), types)
+    logging.info("Loaded %d stores from %s (skipped %d rows)", len(catalog), path, skipped)
+    return catalog
+
+
+_catalog: StoreCatalog | None = None
+_catalog_lock = threading.Lock()
+
+
+def get_store_catalog() -> StoreCatalog | None:
+    global _catalog
+    if _catalog is None and STORE_CATALOG_PATH:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = load_store_catalog(STORE_CATALOG_PATH)
+    return _catalog
+
+
+def set_store_catalog(catalog: StoreCatalog | None) -> None:
+    global _catalog
+    _catalog = catalog
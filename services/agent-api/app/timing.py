@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from contextvars import ContextVar
+import threading
+import time
+from typing import Any
+
+# リクエストごとの区間計測。無効時やリクエスト外（ジョブワーカー・解析プロセス）では何もしない
+
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class RequestTiming:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        # 同じ区間が複数回あれば合計する（例: バッチ内の Firestore 読み取り）
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def header_value(self) -> str:
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[RequestTiming | None] = ContextVar("request_timing", default=None)
+
+
+class _Stage:
+    __slots__ = ("_timing", "_name", "_started")
+
+    def __init__(self, timing: RequestTiming, name: str):
+        self._timing = timing
+        self._name = name
+
+    def __enter__(self) -> None:
+        self._started = time.perf_counter()
+
+    def __exit__(self, *_: Any) -> None:
+        self._timing.add(self._name, time.perf_counter() - self._started)
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *_: Any) -> None:
+        return None
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name: str) -> _Stage | _NullStage:
+    timing = _current.get()
+    if timing is None:
+        return _NULL_STAGE
+    return _Stage(timing, name)
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+class TimingRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests: dict[tuple[str, str, str], _Histogram] = {}
+        self._stages: dict[tuple[str, str], _Histogram] = {}
+
+    def record(self, route: str, method: str, status: int, timing: RequestTiming) -> None:
+        total = time.perf_counter() - timing.started
+        with self._lock:
+            self._requests.setdefault((route, method, str(status)), _Histogram()).observe(total)
+            for name, seconds in timing.stages.items():
+                self._stages.setdefault((route, name), _Histogram()).observe(seconds)
+
+    def render(self) -> str:
+        lines: list[str] = []
+        with self._lock:
+            _render_histogram(
+                lines,
+                "agent_api_request_duration_seconds",
+                "Request duration by route",
+                [
+                    ({"route": route, "method": method, "status": status}, histogram)
+                    for (route, method, status), histogram in sorted(self._requests.items())
+                ],
+            )
+            _render_histogram(
+                lines,
+                "agent_api_stage_duration_seconds",
+                "Per-stage duration by route",
+                [
+                    ({"route": route, "stage": name}, histogram)
+                    for (route, name), histogram in sorted(self._stages.items())
+                ],
+            )
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(values: dict[str, str]) -> str:
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in values.items())
+
+
+def _render_histogram(
+    lines: list[str],
+    name: str,
+    description: str,
+    series: list[tuple[dict[str, str], _Histogram]],
+) -> None:
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, histogram in series:
+        cumulative = 0
+        for bound, count in zip(_BUCKETS, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{_labels({**labels, "le": str(bound)})}}} {cumulative}')
+        lines.append(f'{name}_bucket{{{_labels({**labels, "le": "+Inf"})}}} {histogram.count}')
+        lines.append(f"{name}_sum{{{_labels(labels)}}} {histogram.total}")
+        lines.append(f"{name}_count{{{_labels(labels)}}} {histogram.count}")
+
+
+_registry = TimingRegistry()
+
+
+def get_timing_registry() -> TimingRegistry:
+    return _registry
+
+
+class TimingMiddleware:
+    # StreamingResponse でもヘッダ送信時点までの区間を Server-Timing に載せる
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = _current.set(timing)
+        status = 500
+
+        async def send_with_timing(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timing.header_value().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            _registry.record(path, scope.get("method", ""), status, timing)
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Callable
+
+from .analysis.workers import warm_analysis
+from .config import USE_MOCK_FIRESTORE
+from .firebase import get_firestore_client, init_firebase
+from .keywords import get_keyword_engine
+from .llm.vertex_gemini import warm_client
+from .storage import get_storage_client
+from .stores import get_store_catalog
+
+# 起動直後にバックグラウンドで重い依存の import とクライアント生成を済ませ、
+# 最初のリクエストがその分を待たないようにする（WARMUP_ENABLED=true のときだけ）
+
+
+def _warm_firebase() -> None:
+    if not USE_MOCK_FIRESTORE:
+        init_firebase()
+    get_firestore_client()
+
+
+_STEPS: list[tuple[str, Callable[[], object]]] = [
+    ("firebase", _warm_firebase),
+    ("storage", get_storage_client),
+    ("gemini", warm_client),
+    ("analysis", warm_analysis),
+    ("keywords", get_keyword_engine),
+    ("stores", get_store_catalog),
+]
+
+
+def warm_up() -> dict[str, float]:
+    durations: dict[str, float] = {}
+    for name, step in _STEPS:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as exc:  # noqa: BLE001
+            # 失敗しても最初のリクエストで改めて初期化されるだけなので、起動は止めない
+            logging.warning("Warmup step %s failed: %s", name, exc)
+        durations[name] = round((time.perf_counter() - started) * 1000, 1)
+    logging.info("Warmup finished (ms): %s", durations)
+    return durations
+
+
+def start_warmup() -> threading.Thread:
+    thread = threading.Thread(target=warm_up, name="warmup", daemon=True)
+    thread.start()
+    return thread
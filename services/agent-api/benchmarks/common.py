@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import math
+import time
+from typing import Any, Callable
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    position = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[position]
+
+
+def summarize(name: str, samples_s: list[float], **extra: Any) -> dict[str, Any]:
+    ordered = sorted(samples_s)
+    return {
+        "name": name,
+        "samples": len(ordered),
+        "meanMs": 1000 * sum(ordered) / len(ordered) if ordered else 0.0,
+        "p50Ms": 1000 * percentile(ordered, 0.50),
+        "p90Ms": 1000 * percentile(ordered, 0.90),
+        "p99Ms": 1000 * percentile(ordered, 0.99),
+        "minMs": 1000 * ordered[0] if ordered else 0.0,
+        **extra,
+    }
+
+
+def time_calls(
+    fn: Callable[[], Any], min_time_s: float, min_rounds: int, max_rounds: int = 10_000
+) -> list[float]:
+    # 1回目はキャッシュやJITの影響を受けるので捨てる
+    fn()
+    samples: list[float] = []
+    started = time.perf_counter()
+    while len(samples) < max_rounds and (
+        len(samples) < min_rounds or time.perf_counter() - started < min_time_s
+    ):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
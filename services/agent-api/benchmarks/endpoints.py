@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import asyncio
+from functools import lru_cache
+import io
+import itertools
+from pathlib import Path
+import time
+from typing import Any, Callable
+
+import httpx
+from PIL import Image
+
+from app.auth import get_current_uid
+from app.config import STORAGE_LOCAL_DIR
+from app.main import app
+
+from .common import summarize
+
+BENCH_UID = "bench-user"
+SOURCE_IMAGE = Path(__file__).resolve().parent.parent / "test_image.png"
+# バッチ内で同じ画像が重なると解析が1回にまとめられるので、バッチより多い種類を順に使う
+IMAGE_VARIANTS = 16
+
+_ids = itertools.count()
+
+
+def _image_path(index: int) -> str:
+    return f"users/{BENCH_UID}/photos/variant_{index % IMAGE_VARIANTS}.jpg"
+
+
+def _prepare_images() -> None:
+    # test_image.png（中身は JPEG）の1画素だけを変えて再エンコードし、写真ごとにバイト列を変える
+    source = Image.open(SOURCE_IMAGE).convert("RGB")
+    directory = Path(STORAGE_LOCAL_DIR)
+    for index in range(IMAGE_VARIANTS):
+        path = directory / _image_path(index)
+        if path.exists():
+            continue
+        path.parent.mkdir(parents=True, exist_ok=True)
+        variant = source.copy()
+        variant.putpixel((0, 0), (index, index, index))
+        variant.save(path, format="JPEG", quality=95)
+
+
+def _next_photo() -> dict[str, Any]:
+    index = next(_ids)
+    return {"photoId": f"bench_{index}", "storagePath": _image_path(index)}
+
+
+def _analyze() -> tuple[str, str, dict[str, Any]]:
+    return "POST", "/api/v1/photos/analyze", _next_photo()
+
+
+def _analyze_async() -> tuple[str, str, dict[str, Any]]:
+    return "POST", "/api/v1/photos/analyze-async", _next_photo()
+
+
+def _analysis_status() -> tuple[str, str, None]:
+    return "GET", "/api/v1/photos/bench_status/analysis-status", None
+
+
+def _analyze_batch() -> tuple[str, str, dict[str, Any]]:
+    return "POST", "/api/v1/photos/analyze-batch", {"photos": [_next_photo() for _ in range(4)]}
+
+
+@lru_cache(maxsize=1)
+def _preview_frame() -> bytes:
+    # カメラのプレビュー相当（640x480 の JPEG）
+    buffer = io.BytesIO()
+    Image.open(SOURCE_IMAGE).convert("RGB").resize((640, 480)).save(
+        buffer, format="JPEG", quality=80
+    )
+    return buffer.getvalue()
+
+
+def _quality_check() -> tuple[str, str, bytes]:
+    return "POST", "/api/v1/photos/quality-check", _preview_frame()
+
+
+def _food_sniper() -> tuple[str, str, dict[str, Any]]:
+    return (
+        "POST",
+        "/api/v1/food-sniper/recommend",
+        {
+            "message": "レバーと卵と納豆が食べたい",
+            "location": {"lat": 35.681, "lng": 139.767, "accuracyM": 20},
+            "radiusM": 800,
+        },
+    )
+
+
+def _report() -> tuple[str, str, dict[str, Any]]:
+    return "POST", "/api/v1/reports/generate", {"periodDays": 30}
+
+
+def _mental_message() -> dict[str, Any]:
+    # LLM キャッシュに当たらないよう毎回変える
+    return {"threadId": "bench", "message": f"抜け毛が不安です #{next(_ids)}"}
+
+
+def _mental_chat() -> tuple[str, str, dict[str, Any]]:
+    return "POST", "/api/v1/mental-shield/chat", _mental_message()
+
+
+def _mental_stream() -> tuple[str, str, dict[str, Any]]:
+    return "POST", "/api/v1/mental-shield/chat/stream", _mental_message()
+
+
+ENDPOINTS: dict[str, Callable[[], tuple[str, str, Any]]] = {
+    "analyze": _analyze,
+    "analyze-async": _analyze_async,
+    "analysis-status": _analysis_status,
+    "analyze-batch": _analyze_batch,
+    "quality-check": _quality_check,
+    "food-sniper": _food_sniper,
+    "reports-generate": _report,
+    "mental-shield-chat": _mental_chat,
+    "mental-shield-chat-stream": _mental_stream,
+}
+
+
+async def _request(
+    client: httpx.AsyncClient, method: str, path: str, body: Any
+) -> tuple[float, float, int]:
+    started = time.perf_counter()
+    first_byte: float | None = None
+    # bytes は画像の本文としてそのまま送る
+    if isinstance(body, bytes):
+        options: dict[str, Any] = {"content": body, "headers": {"content-type": "image/jpeg"}}
+    else:
+        options = {"json": body}
+    async with client.stream(method, path, **options) as response:
+        async for _ in response.aiter_raw():
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+    elapsed = time.perf_counter() - started
+    return elapsed, first_byte if first_byte is not None else elapsed, response.status_code
+
+
+async def _load(
+    client: httpx.AsyncClient,
+    build: Callable[[], tuple[str, str, Any]],
+    requests: int,
+    concurrency: int,
+) -> tuple[list[float], list[float], int, float]:
+    latencies: list[float] = []
+    first_bytes: list[float] = []
+    errors = 0
+    remaining = itertools.count()
+
+    async def worker() -> None:
+        nonlocal errors
+        while next(remaining) < requests:
+            method, path, body = build()
+            elapsed, first_byte, status = await _request(client, method, path, body)
+            if status >= 400:
+                errors += 1
+            latencies.append(elapsed)
+            first_bytes.append(first_byte)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, first_bytes, errors, time.perf_counter() - started
+
+
+async def _run_endpoints(
+    names: list[str], requests: int, concurrency: int, warmup: int
+) -> list[dict[str, Any]]:
+    results: list[dict[str, Any]] = []
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            # analysis-status 用のジョブを1件用意しておく
+            await client.post(
+                "/api/v1/photos/analyze-async",
+                json={"photoId": "bench_status", "storagePath": _image_path(0)},
+            )
+            for name in names:
+                build = ENDPOINTS[name]
+                await _load(client, build, warmup, min(concurrency, max(1, warmup)))
+                latencies, first_bytes, errors, wall = await _load(
+                    client, build, requests, concurrency
+                )
+                ttfb = summarize("", first_bytes)
+                results.append(
+                    summarize(
+                        f"endpoint[{name},c={concurrency}]",
+                        latencies,
+                        concurrency=concurrency,
+                        errors=errors,
+                        requestsPerSecond=len(latencies) / wall if wall > 0 else 0.0,
+                        firstByteP50Ms=ttfb["p50Ms"],
+                        firstByteP99Ms=ttfb["p99Ms"],
+                    )
+                )
+    return results
+
+
+def run_endpoints(
+    names: list[str] | None = None,
+    requests: int = 100,
+    concurrency: int = 8,
+    warmup: int = 5,
+) -> list[dict[str, Any]]:
+    _prepare_images()
+    app.dependency_overrides[get_current_uid] = lambda: BENCH_UID
+    try:
+        return asyncio.run(
+            _run_endpoints(names or list(ENDPOINTS), requests, concurrency, warmup)
+        )
+    finally:
+        app.dependency_overrides.pop(get_current_uid, None)
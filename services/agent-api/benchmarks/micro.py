@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import io
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from PIL import Image
+
+from app.analysis.hair_density import (
+    ANALYSIS_METHODS,
+    METHOD_LABEL,
+    RoiRect,
+    _compute_tiled,
+    _quality_from_gray,
+    _roi_from_preset,
+    compute_density_index,
+    compute_density_multi,
+)
+
+from app.keywords import FoodEntry, KeywordEngine, get_keyword_engine
+from app.stores import StoreCatalog
+
+from .common import summarize, time_calls
+
+SOURCE_IMAGE = Path(__file__).resolve().parent.parent / "test_image.png"
+SIZES = (512, 1024, 2048)
+QUICK_SIZES = (512, 1024)
+FORMATS = ("PNG", "JPEG", "WEBP")
+_ROI_INNER_LOOPS = 1000
+STORE_COUNT = 300_000
+STORE_RADII_M = (800, 3000)
+TILED_BUDGET_BYTES = 1024 * 1024
+KEYWORD_CATALOG_SIZES = (100, 1_000, 10_000, 100_000)
+KEYWORD_MESSAGE = (
+    "最近抜け毛が増えてきて不安です。朝はたまごと納豆、昼はｻｰﾓﾝ定食、"
+    "夜は鶏むね肉とブロッコリーを食べています。頭皮が少し赤みを帯びている気がします。"
+)
+
+
+def _encode(image: Image.Image, side: int, image_format: str) -> bytes:
+    resized = image.resize((side, side), Image.Resampling.BICUBIC)
+    buffer = io.BytesIO()
+    options = {"quality": 90} if image_format in ("JPEG", "WEBP") else {}
+    resized.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def run_micro(min_time_s: float = 0.5, quick: bool = False) -> list[dict[str, Any]]:
+    source = Image.open(SOURCE_IMAGE).convert("RGB")
+    sizes = QUICK_SIZES if quick else SIZES
+    results: list[dict[str, Any]] = []
+
+    for side in sizes:
+        megapixels = side * side / 1_000_000
+        for image_format in FORMATS:
+            image_bytes = _encode(source, side, image_format)
+            for method in ANALYSIS_METHODS:
+                samples = time_calls(
+                    lambda: compute_density_index(image_bytes, None, None, method),
+                    min_time_s,
+                    min_rounds=5,
+                )
+                result = summarize(
+                    f"compute_density_index[{method},{image_format},{side}]",
+                    samples,
+                    megapixels=megapixels,
+                    bytes=len(image_bytes),
+                )
+                result["msPerMegapixel"] = result["p50Ms"] / megapixels
+                results.append(result)
+
+        # 解析対象は ROI（60%四方）なので、実運用に近い大きさのグレー画像で測る
+        roi_side = int(side * 0.6)
+        gray = np.asarray(source.convert("L").resize((roi_side, roi_side)))
+        samples = time_calls(lambda: _quality_from_gray(gray), min_time_s, min_rounds=5)
+        result = summarize(
+            f"_quality_from_gray[{roi_side}]",
+            samples,
+            megapixels=roi_side * roi_side / 1_000_000,
+        )
+        result["msPerMegapixel"] = result["p50Ms"] / result["megapixels"]
+        results.append(result)
+
+        # crown と default を同じ写真で解析する場合: 1回のデコードでまとめるか、ROI ごとに呼ぶか
+        image_bytes = _encode(source, side, "JPEG")
+        _check_multi_roi(image_bytes)
+        samples = time_calls(
+            lambda: compute_density_multi(image_bytes, [None, "crown"]),
+            min_time_s,
+            min_rounds=5,
+        )
+        results.append(summarize(f"compute_density_multi[2roi,JPEG,{side}]", samples))
+        samples = time_calls(
+            lambda: [compute_density_index(image_bytes, roi) for roi in (None, "crown")],
+            min_time_s,
+            min_rounds=5,
+        )
+        results.append(summarize(f"compute_density_index_x2[JPEG,{side}]", samples))
+
+        # 作業メモリの上限を小さくして、行の帯に分けた解析を通す
+        samples = time_calls(
+            lambda: _compute_tiled(image_bytes, [None], None, METHOD_LABEL, TILED_BUDGET_BYTES),
+            min_time_s,
+            min_rounds=5,
+        )
+        results.append(summarize(f"compute_density_tiled[JPEG,{side},1MB]", samples))
+
+    for preset in (None, "crown"):
+
+        def roi_loop() -> None:
+            for _ in range(_ROI_INNER_LOOPS):
+                _roi_from_preset(3024, 4032, preset)
+
+        samples = [
+            value / _ROI_INNER_LOOPS
+            for value in time_calls(roi_loop, min_time_s, min_rounds=5)
+        ]
+        results.append(summarize(f"_roi_from_preset[{preset or 'default'}]", samples))
+
+    # 関東くらいの範囲に一様に店舗を置き、東京駅周辺を半径検索する
+    rng = np.random.default_rng(0)
+    catalog = StoreCatalog(
+        [f"store_{index}" for index in range(STORE_COUNT)],
+        rng.uniform(34.5, 36.5, STORE_COUNT),
+        rng.uniform(138.5, 141.0, STORE_COUNT),
+        ["supermarket"] * STORE_COUNT,
+    )
+    for radius_m in STORE_RADII_M:
+        samples = time_calls(
+            lambda: catalog.query_radius(35.681, 139.767, radius_m, 10),
+            min_time_s,
+            min_rounds=5,
+        )
+        results.append(
+            summarize(f"StoreCatalog.query_radius[{STORE_COUNT},{radius_m}m]", samples)
+        )
+
+    results.extend(_keyword_results(min_time_s))
+    return results
+
+
+def _check_multi_roi(image_bytes: bytes) -> None:
+    # まとめて解析しても、各 ROI は単独で解析した結果とビット単位で一致しなければならない
+    rois = [None, "crown", RoiRect(0.05, 0.1, 0.3, 0.3)]
+    for max_side in (None, 256):
+        for method in ANALYSIS_METHODS:
+            multi = compute_density_multi(image_bytes, rois, max_side, method)
+            for roi, result in zip(rois, multi):
+                single = compute_density_index(image_bytes, roi, max_side, method)
+                if result != single:
+                    raise AssertionError(
+                        f"compute_density_multi differs for {roi} ({method}, {max_side}): "
+                        f"{result} != {single}"
+                    )
+
+
+def _synthetic_foods(count: int, rng: np.random.Generator) -> list[FoodEntry]:
+    # 2〜6 文字のランダムな漢字語（別名2つ付き）。メッセージにほぼ当たらないので、語彙数の影響だけを見られる
+    codes = rng.integers(0x4E00, 0x9FA0, size=(count, 3, 6))
+    lengths = rng.integers(2, 7, size=(count, 3))
+    return [
+        FoodEntry(
+            name="".join(map(chr, codes[index, 0, : lengths[index, 0]])),
+            why="",
+            aliases=tuple(
+                "".join(map(chr, codes[index, alias, : lengths[index, alias]]))
+                for alias in (1, 2)
+            ),
+        )
+        for index in range(count)
+    ]
+
+
+def _keyword_results(min_time_s: float) -> list[dict[str, Any]]:
+    bundled = get_keyword_engine()
+    rng = np.random.default_rng(0)
+    results: list[dict[str, Any]] = []
+    for size in KEYWORD_CATALOG_SIZES:
+        engine = KeywordEngine(
+            bundled.foods + _synthetic_foods(size, rng), bundled.risk_keywords
+        )
+        samples = time_calls(lambda: engine.scan(KEYWORD_MESSAGE), min_time_s, min_rounds=5)
+        results.append(
+            summarize(
+                f"KeywordEngine.scan[{size}]",
+                samples,
+                patterns=engine.pattern_count,
+                messageChars=len(KEYWORD_MESSAGE),
+            )
+        )
+
+        # 比較用: 置き換え前と同じ「語ごとに in で探す」方式
+        terms = [term for food in engine.foods for term in (food.name, *food.aliases)]
+
+        def naive_scan() -> None:
+            [term for term in terms if term in KEYWORD_MESSAGE]
+
+        samples = time_calls(naive_scan, min_time_s, min_rounds=5)
+        results.append(summarize(f"naive_keyword_scan[{size}]", samples, patterns=len(terms)))
+    return results
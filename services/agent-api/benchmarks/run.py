@@ -0,0 +1,160 @@
+"""解析関数のマイクロベンチマークと /api/v1/* の負荷ベンチマーク。
+
+使い方（services/agent-api で実行）:
+    python -m benchmarks.run                          # 全て実行し baseline と比較
+    python -m benchmarks.run --suite micro --quick
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --update-baseline        # 現在の結果を baseline として保存
+
+Firestore はインメモリのモック、認証は固定 uid、LLM はローカル代替バックエンドを使う。
+"""
+
+import argparse
+from datetime import datetime, timezone
+import json
+import os
+from pathlib import Path
+import platform
+import re
+import sys
+import tempfile
+
+# app.config は import 時に環境変数を読むので、app を import する前に設定する。
+# 画像は写真ごとに中身の違うファイルを STORAGE_LOCAL_DIR から読む（benchmarks/endpoints.py が用意する）
+_BENCH_ENV = {
+    "USE_MOCK_FIRESTORE": "true",
+    "LOCAL_IMAGE_PATH": "",
+    "STORAGE_LOCAL_DIR": str(Path(tempfile.gettempdir()) / "agent-api-bench-images"),
+    "LLM_BACKEND": "local",
+    "LLM_LOCAL_LATENCY": "fixed:0",
+    "ANALYSIS_CACHE_SIZE": "0",
+    "ANALYSIS_CACHE_DIR": "",
+    "LLM_CACHE_SIZE": "0",
+    "AUTH_CERT_WARMUP_TIMEOUT_S": "0",
+}
+for _key, _value in _BENCH_ENV.items():
+    os.environ.setdefault(_key, _value)
+
+import numpy as np  # noqa: E402
+import PIL  # noqa: E402
+
+from .endpoints import ENDPOINTS, run_endpoints  # noqa: E402
+from .micro import run_micro  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+_APP_DIR = Path(__file__).resolve().parent.parent / "app"
+_GETENV_RE = re.compile(r'getenv\("([A-Z0-9_]+)"')
+# 回帰判定に使う指標。負荷系は裾（p99）も見る
+_COMPARED_METRICS = ("p50Ms", "p99Ms")
+
+
+def _env_keys() -> list[str]:
+    # 結果を再現できるよう、app が読む環境変数を全て記録する（null は未設定でコードの既定値）
+    keys = set(_BENCH_ENV)
+    for path in _APP_DIR.rglob("*.py"):
+        keys.update(_GETENV_RE.findall(path.read_text(encoding="utf-8")))
+    return sorted(keys)
+
+
+def _environment() -> dict:
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpuCount": os.cpu_count(),
+        "numpy": np.__version__,
+        "pillow": PIL.__version__,
+        "env": {key: os.environ.get(key) for key in _env_keys()},
+    }
+
+
+def compare(
+    results: list[dict], baseline: list[dict], threshold: float
+) -> list[dict]:
+    previous = {item["name"]: item for item in baseline}
+    regressions = []
+    for item in results:
+        before = previous.get(item["name"])
+        if before is None:
+            continue
+        for metric in _COMPARED_METRICS:
+            old, new = before.get(metric), item.get(metric)
+            # ごく短い処理は揺らぎが大きいので、0.05ms 未満の差は無視する
+            if not old or new is None or new - old < 0.05:
+                continue
+            ratio = new / old
+            if ratio > 1 + threshold:
+                regressions.append(
+                    {"name": item["name"], "metric": metric, "baseline": old, "current": new, "ratio": ratio}
+                )
+    return regressions
+
+
+def _print_table(results: list[dict]) -> None:
+    for item in results:
+        extra = ""
+        if "msPerMegapixel" in item:
+            extra = f"  {item['msPerMegapixel']:8.2f} ms/MP"
+        if "requestsPerSecond" in item:
+            extra = f"  {item['requestsPerSecond']:8.1f} req/s  errors={item['errors']}"
+        print(
+            f"{item['name']:<60} p50={item['p50Ms']:9.3f}ms p99={item['p99Ms']:9.3f}ms{extra}"
+        )
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run")
+    parser.add_argument("--suite", choices=("all", "micro", "endpoints"), default="all")
+    parser.add_argument("--quick", action="store_true", help="小さい画像と少ない試行回数で実行")
+    parser.add_argument("--endpoint", action="append", choices=sorted(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.25, help="許容する悪化率（0.25 = 25%%）")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    results: list[dict] = []
+    if args.suite in ("all", "micro"):
+        results.extend(run_micro(min_time_s=0.1 if args.quick else 0.5, quick=args.quick))
+    if args.suite in ("all", "endpoints"):
+        requests = min(args.requests, 20) if args.quick else args.requests
+        results.extend(run_endpoints(args.endpoint, requests, args.concurrency))
+
+    _print_table(results)
+    report = {"environment": _environment(), "results": results}
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n")
+
+    if args.update_baseline:
+        baseline_results: list[dict] = []
+        if args.baseline.exists():
+            # 今回測っていない項目は既存の値を残す
+            measured = {item["name"] for item in results}
+            baseline_results = [
+                item
+                for item in json.loads(args.baseline.read_text())["results"]
+                if item["name"] not in measured
+            ]
+        report["results"] = baseline_results + results
+        args.baseline.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n")
+        print(f"baseline updated: {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"baseline not found: {args.baseline}")
+        return 0
+
+    regressions = compare(results, json.loads(args.baseline.read_text())["results"], args.threshold)
+    for item in regressions:
+        print(
+            f"REGRESSION {item['name']} {item['metric']}: "
+            f"{item['baseline']:.3f}ms -> {item['current']:.3f}ms (x{item['ratio']:.2f})"
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
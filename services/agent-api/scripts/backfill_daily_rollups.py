@@ -0,0 +1,24 @@
+"""analysisResults/{uid}/daily の日次集計を items から作り直す。
+
+使い方（services/agent-api で実行）:
+    python -m scripts.backfill_daily_rollups            # 全ユーザー
+    python -m scripts.backfill_daily_rollups UID [UID...]
+"""
+
+import sys
+
+from app.analysis_rollups import backfill_rollups
+from app.firebase import get_firestore_client
+
+
+def main(argv: list[str]) -> int:
+    db = get_firestore_client()
+    uids = argv or [ref.id for ref in db.collection("analysisResults").list_documents()]
+    for uid in uids:
+        days = backfill_rollups(db, uid)
+        print(f"{uid}: days={days}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
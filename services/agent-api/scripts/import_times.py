@@ -0,0 +1,117 @@
+"""起動時（import app.main）の import 時間をパッケージ別・モジュール別に集計する。
+
+使い方（services/agent-api で実行）:
+    python -m scripts.import_times                  # 上位20件と重い依存の有無を表示
+    python -m scripts.import_times --top 40 --repeat 5
+    python -m scripts.import_times --max-ms 800     # 合計が 800ms を超えたら終了コード 1
+    python -m scripts.import_times --json
+
+NumPy / PIL / google.genai / google.cloud.storage / firebase_admin は初回使用時に読み込む方針なので、
+起動時に import されていたら警告し、終了コード 1 を返す。
+"""
+
+import argparse
+import json
+from pathlib import Path
+import re
+import subprocess
+import sys
+
+SERVICE_ROOT = Path(__file__).resolve().parent.parent
+LAZY_MODULES = (
+    "numpy",
+    "PIL.Image",
+    "google.genai",
+    "google.cloud.storage",
+    "google.cloud.firestore",
+    "firebase_admin",
+)
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def _measure(module: str) -> dict[str, tuple[int, int]]:
+    # -X importtime は stderr に「自身 | 累積 | モジュール名」を μs で出す
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SERVICE_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings: dict[str, tuple[int, int]] = {}
+    for line in completed.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            timings[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return timings
+
+
+def measure(module: str, repeat: int) -> dict[str, tuple[int, int]]:
+    # ディスクキャッシュの影響を除くため、各モジュールは複数回の最小値を使う
+    best: dict[str, tuple[int, int]] = {}
+    for _ in range(repeat):
+        for name, (self_us, cumulative_us) in _measure(module).items():
+            previous = best.get(name)
+            if previous is None or cumulative_us < previous[1]:
+                best[name] = (self_us, cumulative_us)
+    return best
+
+
+def report(module: str, timings: dict[str, tuple[int, int]], top: int) -> dict:
+    by_package: dict[str, int] = {}
+    for name, (self_us, _) in timings.items():
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+    return {
+        "module": module,
+        "totalMs": timings.get(module, (0, 0))[1] / 1000,
+        "packages": [
+            {"package": package, "selfMs": self_us / 1000}
+            for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:top]
+        ],
+        "modules": [
+            {"module": name, "selfMs": self_us / 1000, "cumulativeMs": cumulative_us / 1000}
+            for name, (self_us, cumulative_us) in sorted(
+                timings.items(), key=lambda item: -item[1][1]
+            )[:top]
+        ],
+        "eagerLazyModules": [name for name in LAZY_MODULES if name in timings],
+    }
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m scripts.import_times")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-ms", type=float, help="合計 import 時間の上限（ms）")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    result = report(args.module, measure(args.module, max(1, args.repeat)), args.top)
+
+    if args.json:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+    else:
+        print(f"import {result['module']}: {result['totalMs']:.1f} ms")
+        print("\npackage (self time)")
+        for item in result["packages"]:
+            print(f"  {item['package']:<40} {item['selfMs']:8.1f} ms")
+        print("\nmodule (cumulative / self)")
+        for item in result["modules"]:
+            print(
+                f"  {item['module']:<50} {item['cumulativeMs']:8.1f} ms {item['selfMs']:8.1f} ms"
+            )
+
+    failed = False
+    for name in result["eagerLazyModules"]:
+        print(f"EAGER IMPORT {name}: 初回使用時に読み込むはずのモジュールが起動時に import されています")
+        failed = True
+    if args.max_ms is not None and result["totalMs"] > args.max_ms:
+        print(f"SLOW IMPORT {result['totalMs']:.1f} ms > {args.max_ms:.1f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
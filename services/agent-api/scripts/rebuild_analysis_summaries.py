@@ -0,0 +1,24 @@
+"""analysisResults/{uid} の集計ドキュメントを items から作り直す。
+
+使い方（services/agent-api で実行）:
+    python -m scripts.rebuild_analysis_summaries            # 全ユーザー
+    python -m scripts.rebuild_analysis_summaries UID [UID...]
+"""
+
+import sys
+
+from app.analysis_summary import rebuild_summary
+from app.firebase import get_firestore_client
+
+
+def main(argv: list[str]) -> int:
+    db = get_firestore_client()
+    uids = argv or [ref.id for ref in db.collection("analysisResults").list_documents()]
+    for uid in uids:
+        summary = rebuild_summary(db, uid)
+        print(f"{uid}: count={summary['count']} mean={summary['densityMean']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
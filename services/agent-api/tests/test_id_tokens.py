@@ -0,0 +1,115 @@
+import datetime
+import json
+import time
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.auth import crypt, jwt
+import pytest
+
+from app import id_tokens
+from app.id_tokens import CertificateKeeper, CertificateUnavailable, verify_with_keeper
+
+PROJECT_ID = "demo-project"
+
+
+def _signing_key(kid: str) -> tuple[crypt.RSASigner, str]:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, kid)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    pem_key = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    signer = crypt.RSASigner.from_string(pem_key, key_id=kid)
+    return signer, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+def _token(signer: crypt.RSASigner) -> str:
+    now = int(time.time())
+    payload = {
+        "iss": id_tokens.ID_TOKEN_ISSUER_PREFIX + PROJECT_ID,
+        "aud": PROJECT_ID,
+        "sub": "user-1",
+        "iat": now,
+        "exp": now + 600,
+    }
+    return jwt.encode(signer, payload).decode()
+
+
+class _RotatingCerts:
+    def __init__(self, certs: dict[str, str]):
+        self.certs = certs
+        self.fail = False
+        self.calls = 0
+
+    def __call__(self, _url: str) -> tuple[bytes, float]:
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("offline")
+        return json.dumps(self.certs).encode(), 3600.0
+
+
+@pytest.fixture
+def keys():
+    return {kid: _signing_key(kid) for kid in ("old", "new")}
+
+
+@pytest.fixture
+def short_retry(monkeypatch):
+    monkeypatch.setattr(id_tokens, "_RETRY_MIN_S", 0.05)
+
+
+def _started_keeper(fetch: _RotatingCerts) -> CertificateKeeper:
+    keeper = CertificateKeeper(fetch=fetch)
+    keeper.start(warmup_timeout_s=5)
+    # 起動直後の鍵は「取り直したばかり」とみなされるので、その期間を過ぎてから検証する
+    time.sleep(0.1)
+    return keeper
+
+
+def test_rotated_kid_is_verified_after_refresh(keys, short_retry):
+    fetch = _RotatingCerts({"old": keys["old"][1]})
+    keeper = _started_keeper(fetch)
+    try:
+        fetch.certs = {"old": keys["old"][1], "new": keys["new"][1]}
+        claims = verify_with_keeper(_token(keys["new"][0]), PROJECT_ID, keeper)
+        assert claims["uid"] == "user-1"
+        assert keeper.knows("new")
+    finally:
+        keeper.stop(1)
+
+
+def test_rotated_kid_is_unavailable_when_refresh_fails(keys, short_retry, monkeypatch):
+    monkeypatch.setattr(id_tokens, "AUTH_CERT_ROTATION_WAIT_S", 0.3)
+    fetch = _RotatingCerts({"old": keys["old"][1]})
+    keeper = _started_keeper(fetch)
+    try:
+        fetch.fail = True
+        with pytest.raises(CertificateUnavailable):
+            verify_with_keeper(_token(keys["new"][0]), PROJECT_ID, keeper)
+    finally:
+        keeper.stop(1)
+
+
+def test_unknown_kid_with_fresh_certificates_is_rejected(keys, short_retry):
+    fetch = _RotatingCerts({"old": keys["old"][1]})
+    keeper = _started_keeper(fetch)
+    try:
+        with pytest.raises(ValueError):
+            verify_with_keeper(_token(keys["new"][0]), PROJECT_ID, keeper)
+    finally:
+        keeper.stop(1)
@@ -0,0 +1,46 @@
+import pytest
+
+from app.keywords import get_keyword_engine
+
+
+def _food_names(message: str) -> list[str]:
+    return [food.name for food in get_keyword_engine().scan(message).foods]
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "さけるチーズをよく食べます",
+        "揚げ物はさけるようにしている",
+        "eggplant のグリル",
+        "仕事をさばくのが大変",
+        "えびす様にお参りした",
+        "ツナギを着て作業した",
+    ],
+)
+def test_short_kana_and_ascii_aliases_do_not_match_inside_other_words(message):
+    names = _food_names(message)
+    for name in ("鮭", "卵", "鯖", "海老", "マグロ"):
+        assert name not in names
+
+
+@pytest.mark.parametrize(
+    ("message", "name"),
+    [
+        ("朝は焼き鮭とごはん", "鮭"),
+        ("サーモンが好き", "鮭"),
+        ("I ate eggs today", "卵"),
+        ("egg sandwich", "卵"),
+        ("夜はサバ缶", "鯖"),
+        ("エビフライを食べた", "海老"),
+        ("ツナ缶のサラダ", "マグロ"),
+    ],
+)
+def test_food_terms_still_match(message, name):
+    assert name in _food_names(message)
+
+
+def test_risk_keywords_are_found_alongside_foods():
+    hits = get_keyword_engine().scan("卵を食べたが頭皮に湿疹が出た")
+    assert [food.name for food in hits.foods] == ["卵"]
+    assert "湿疹" in hits.risks
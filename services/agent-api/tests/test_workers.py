@@ -0,0 +1,36 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from app.analysis.workers import AnalysisWorkerCrashed, AnalysisWorkerPool
+
+
+def _exit_worker() -> None:
+    os._exit(1)
+
+
+def _exit_worker_once(marker: str) -> str:
+    path = Path(marker)
+    if not path.exists():
+        path.touch()
+        os._exit(1)
+    return "ok"
+
+
+@pytest.fixture
+def pool():
+    pool = AnalysisWorkerPool(1, 1)
+    yield pool
+    pool.shutdown()
+
+
+def test_pool_is_rebuilt_and_retried_after_a_worker_dies(pool, tmp_path):
+    assert pool.run(_exit_worker_once, str(tmp_path / "crashed")) == "ok"
+    assert pool.run(os.getpid) != os.getpid()
+
+
+def test_pool_reports_crash_when_retry_also_dies_and_stays_usable(pool):
+    with pytest.raises(AnalysisWorkerCrashed):
+        pool.run(_exit_worker)
+    assert pool.run(os.getpid) != os.getpid()